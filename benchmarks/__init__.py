@@ -0,0 +1,3 @@
+"""
+Замеры производительности. Запускаются из корня репозитория: python -m benchmarks.<модуль>
+"""
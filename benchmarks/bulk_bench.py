@@ -0,0 +1,55 @@
+"""
+Загрузка ключей командами SET по одной на строку и командами MSET с несколькими парами на строке.
+Строки выполняются как в пакетном режиме main.py (разбор, execute_command, вывод),
+с журналированием на уровне --log-level в файл os.devnull.
+Запуск: python -m benchmarks.bulk_bench [--keys N] [--pairs-per-line 1 10 100 1000] [--log-level DEBUG]
+"""
+import argparse
+import io
+import logging
+import os
+import time
+
+from custom_database import CustomDataBase
+from main import run_batch
+
+
+def make_lines(keys: int, pairs_per_line: int) -> bytes:
+    lines = []
+    for start in range(0, keys, pairs_per_line):
+        numbers = range(start, min(start + pairs_per_line, keys))
+        if pairs_per_line == 1:
+            lines.append(f'SET key{start} value{start}')
+        else:
+            lines.append('MSET ' + ' '.join(f'key{number} value{number}' for number in numbers))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def load(source: bytes, logger: logging.Logger) -> float:
+    database = CustomDataBase()
+    started = time.perf_counter()
+    run_batch(database, io.BytesIO(source), io.StringIO(), logger)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=1000000)
+    parser.add_argument('--pairs-per-line', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--log-level', default='WARNING',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'])
+    arguments = parser.parse_args()
+    logging.basicConfig(filename=os.devnull, level=getattr(logging, arguments.log_level))
+    logger = logging.getLogger(__name__)
+
+    print(f'{"пар/строку":>10} {"ключей/с":>12} {"ускорение":>10}')
+    baseline = None
+    for pairs_per_line in arguments.pairs_per_line:
+        elapsed = load(make_lines(arguments.keys, pairs_per_line), logger)
+        rate = arguments.keys / elapsed
+        baseline = baseline or rate
+        print(f'{pairs_per_line:>10} {rate:>12.0f} {rate / baseline:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
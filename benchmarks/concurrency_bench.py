@@ -0,0 +1,97 @@
+"""
+Конкуренция потоков за ThreadSafeDataBase: суммарная скорость смеси команд (GET, SET и INCR)
+при 1-32 потоках для одной блокировки на всю базу данных (--stripes 1) и полос блокировок.
+Время ожидания блокировок - доля времени, которую потоки провели в acquire полос.
+Запуск: python -m benchmarks.concurrency_bench [--threads 1 2 4 8 16 32] [--stripes 1 64]
+                                               [--operations 20000] [--writes 0.2]
+"""
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+
+from concurrent_database import ThreadSafeDataBase
+
+
+class TimedLock:
+    """
+    Блокировка, суммирующая время ожидания в acquire.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self) -> None:
+        if not self._lock.acquire(blocking=False):
+            started = time.perf_counter()
+            self._lock.acquire()
+            self.waited += time.perf_counter() - started
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def __enter__(self) -> 'TimedLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+def worker(database: ThreadSafeDataBase, keys: int, operations: int, writes: float, seed: int) -> None:
+    rng = random.Random(seed)
+    for _ in range(operations):
+        key = f'key{rng.randrange(keys)}'
+        roll = rng.random()
+        if roll < writes / 2:
+            database.set(key, str(rng.randrange(100)))
+        elif roll < writes:
+            database.increment(f'counter{rng.randrange(keys)}', 1)
+        else:
+            database.mget([key])
+
+
+def run(threads: int, stripes: int, keys: int, operations: int, writes: float) -> dict:
+    database = ThreadSafeDataBase(stripes)
+    database.locks = [TimedLock() for _ in range(stripes)]
+    database.mset([(f'key{i}', str(i % 100)) for i in range(keys)])
+    workers = [threading.Thread(target=worker, args=(database, keys, operations, writes, seed))
+               for seed in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    waited = sum(lock.waited for lock in database.locks)
+    return {
+        'operations_per_sec': threads * operations / elapsed,
+        'lock_wait_ratio'   : waited / (elapsed * threads),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--stripes', type=int, nargs='+', default=[1, 64])
+    parser.add_argument('--keys', type=int, default=10000)
+    parser.add_argument('--operations', type=int, default=20000, help='Команд на поток.')
+    parser.add_argument('--writes', type=float, default=0.2, help='Доля SET и INCR.')
+    arguments = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f'GIL: {"включён" if gil else "выключен"}')
+    print(f'{"полосы":>7} {"потоки":>7} {"команд/с":>10} {"ожидание":>9}')
+    for stripes in arguments.stripes:
+        for threads in arguments.threads:
+            result = run(threads, stripes, arguments.keys, arguments.operations, arguments.writes)
+            print(f'{stripes:>7} {threads:>7} {result["operations_per_sec"]:>10.0f} '
+                  f'{result["lock_wait_ratio"]:>9.1%}')
+
+
+if __name__ == '__main__':
+    main()
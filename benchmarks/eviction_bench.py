@@ -0,0 +1,58 @@
+"""
+Доля попаданий и накладные расходы политик вытеснения.
+Нагрузка кеша: GET ключа с неравномерным (Ципф) распределением, при промахе - SET.
+Бюджет памяти задаётся долей от объёма всех ключей; для сравнения приведён запуск
+без ограничения памяти (все обращения, кроме первых, - попадания).
+Запуск: python -m benchmarks.eviction_bench [--keyspace N] [--operations M] [--budget 0.1 0.5]
+"""
+import argparse
+import logging
+import random
+import time
+
+from constants import WrongInputException
+from custom_database import CustomDataBase
+from eviction import EVICTION_POLICIES, entry_size
+from benchmarks.workloads import zipf_keys
+
+
+def run(keys: list, policy: str = None, max_memory: int = 0) -> tuple:
+    database = CustomDataBase()
+    if policy:
+        database.enable_eviction(max_memory, policy)
+    get = database.get
+    set_ = database.set
+    hits = 0
+    started = time.perf_counter()
+    for key in keys:
+        try:
+            get(key)
+            hits += 1
+        except WrongInputException:
+            set_(key, key)
+    elapsed = time.perf_counter() - started
+    return hits / len(keys), len(keys) / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keyspace', type=int, default=100000)
+    parser.add_argument('--operations', type=int, default=1000000)
+    parser.add_argument('--budget', type=float, nargs='+', default=[0.05, 0.2, 0.5])
+    parser.add_argument('--seed', type=int, default=1)
+    arguments = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    keys = zipf_keys(arguments.keyspace, arguments.operations, random.Random(arguments.seed))
+    dataset = sum(entry_size(f'key{rank}', f'key{rank}') for rank in range(arguments.keyspace))
+
+    print(f'{"политика":>10} {"бюджет":>8} {"попадания":>10} {"оп/с":>10}')
+    hit_rate, rate = run(keys)
+    print(f'{"нет":>10} {"-":>8} {hit_rate:>10.2%} {rate:>10.0f}')
+    for budget in arguments.budget:
+        for policy in EVICTION_POLICIES:
+            hit_rate, rate = run(keys, policy, int(dataset * budget))
+            print(f'{policy:>10} {budget:>8.0%} {hit_rate:>10.2%} {rate:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
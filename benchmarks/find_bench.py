@@ -0,0 +1,76 @@
+"""
+Пиковая память и время вывода FIND для значения, которое есть у большинства ключей:
+список с объединением в одну строку (как до потокового вывода), потоковый вывод
+фрагментами и постраничный обход FIND ... LIMIT ... CURSOR.
+Пиковая память измеряется tracemalloc сверх памяти самих данных.
+Запуск: python -m benchmarks.find_bench [--keys 1000000] [--limit 1000]
+"""
+import argparse
+import logging
+import time
+import tracemalloc
+
+from custom_database import CustomDataBase
+from main import write_output
+
+
+class NullOutput:
+    """
+    Приёмник вывода, который только считает записанные символы.
+    """
+
+    def __init__(self) -> None:
+        self.written = 0
+
+    def write(self, text: str) -> None:
+        self.written += len(text)
+
+
+def joined(database: CustomDataBase, value: str, output: NullOutput, limit: int) -> None:
+    write_output(output.write, ' '.join(database.find(value)))
+
+
+def streamed(database: CustomDataBase, value: str, output: NullOutput, limit: int) -> None:
+    write_output(output.write, database.stream_keys(database.iter_find(value)))
+
+
+def paged(database: CustomDataBase, value: str, output: NullOutput, limit: int) -> None:
+    cursor = None
+    while True:
+        keys, cursor = database.find_page(value, cursor, limit)
+        write_output(output.write, database.format_keys_page(keys, cursor))
+        if cursor is None:
+            break
+
+
+def measure(method, database: CustomDataBase, value: str, limit: int) -> dict:
+    output = NullOutput()
+    tracemalloc.start()
+    started = time.perf_counter()
+    method(database, value, output, limit)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': elapsed, 'peak_mb': peak / 2 ** 20, 'written_mb': output.written / 2 ** 20}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=1000000)
+    parser.add_argument('--limit', type=int, default=1000)
+    arguments = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    database = CustomDataBase()
+    database.mset([(f'key{i}', 'hot' if i % 10 else 'rare') for i in range(arguments.keys)])
+    # Упорядоченный индекс ключей строится при первом постраничном запросе и дальше поддерживается.
+    database.find_page('hot', count=1)
+
+    print(f'{"способ":<14} {"время, с":>9} {"пик памяти, МБ":>15} {"выведено, МБ":>13}')
+    for name, method in (('join', joined), ('поток', streamed), (f'LIMIT {arguments.limit}', paged)):
+        result = measure(method, database, 'hot', arguments.limit)
+        print(f'{name:<14} {result["seconds"]:>9.3f} {result["peak_mb"]:>15.2f} {result["written_mb"]:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Массовая загрузка: время заполнения пустой базы данных циклом set по одной паре,
+методом load и из CSV-файла (load_csv, в том числе с разбором в нескольких процессах).
+Загрузка замеряется при журналировании уровня WARNING и DEBUG (main.py --log-level DEBUG;
+журнал пишется в os.devnull), так как set журналирует каждый вызов,
+а load - каждый пакет. Ускорение - отношение времени цикла set к времени способа.
+Запуск: python -m benchmarks.load_bench [--keys 1000000] [--values 10] [--workers 1 4]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from bulk_load import load_csv
+from compact_database import CompactDataBase
+from custom_database import CustomDataBase
+
+
+def timed(function, *arguments) -> float:
+    started = time.perf_counter()
+    function(*arguments)
+    return time.perf_counter() - started
+
+
+def set_loop(database: CustomDataBase, pairs) -> None:
+    for key, value in pairs:
+        database.set(key, value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=1000000)
+    parser.add_argument('--values', type=int, default=10, help='Количество различных значений.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4],
+                        help='Количество процессов разбора CSV.')
+    arguments = parser.parse_args()
+
+    pairs = [(f'key{i}', str(i % arguments.values)) for i in range(arguments.keys)]
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(handle, 'w', encoding='utf-8', newline='') as source:
+        source.writelines(f'{key},{value}\n' for key, value in pairs)
+    handler = logging.FileHandler(os.devnull)
+    logging.getLogger().addHandler(handler)
+    try:
+        print(f'ключей: {arguments.keys}, значений: {arguments.values}')
+        print(f'{"журнал":>8} {"способ":<22} {"время, с":>9} {"пар/с":>10} {"ускорение":>10}')
+        for level in (logging.WARNING, logging.DEBUG):
+            logging.getLogger().setLevel(level)
+            results = [
+                ('set', timed(set_loop, CustomDataBase(), pairs)),
+                ('load', timed(CustomDataBase().load, pairs)),
+                ('load compact', timed(CompactDataBase().load, pairs)),
+            ]
+            for workers in arguments.workers:
+                results.append((f'load_csv workers={workers}', timed(load_csv, CustomDataBase(), path, ',',
+                                                                     False, workers)))
+            baseline = results[0][1]
+            for name, elapsed in results:
+                print(f'{logging.getLevelName(level):>8} {name:<22} {elapsed:>9.3f} '
+                      f'{arguments.keys / elapsed:>10.0f} {baseline / elapsed:>9.1f}x')
+    finally:
+        logging.getLogger().removeHandler(handler)
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
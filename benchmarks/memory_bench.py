@@ -0,0 +1,72 @@
+"""
+Потребление памяти (RSS) обычной CustomDataBase и CompactDataBase при небольшом
+количестве различных значений. Каждый вариант загружается в отдельном процессе.
+Запуск: python -m benchmarks.memory_bench [--keys 10000000] [--values 5000]
+"""
+import argparse
+import logging
+import resource
+import subprocess
+import sys
+import time
+
+from compact_database import CompactDataBase
+from custom_database import CustomDataBase
+
+ENGINES = {
+    'plain'  : CustomDataBase,
+    'compact': CompactDataBase,
+}
+
+
+def current_rss() -> int:
+    """
+    Текущий размер резидентной памяти процесса в байтах.
+    :return:
+    """
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * resource.getpagesize()
+
+
+def load(engine: str, keys: int, values: int) -> None:
+    """
+    Загрузить keys ключей с values различными значениями и вывести прирост RSS.
+    Каждое значение - отдельный объект str, как при разборе команд из ввода.
+    :param engine:
+    :param keys:
+    :param values:
+    :return:
+    """
+    logging.disable(logging.CRITICAL)
+    database = ENGINES[engine]()
+    before = current_rss()
+    started = time.perf_counter()
+    set_ = database.set
+    for i in range(keys):
+        set_(f'key{i}', f'value{i % values}')
+    elapsed = time.perf_counter() - started
+    grown = current_rss() - before
+    estimate = database.memory_usage()
+    print(f'{engine:<8} {grown / 2 ** 20:>10.1f} {grown / keys:>10.1f} {estimate["bytes_per_key"]:>12} '
+          f'{keys / elapsed:>12.0f}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=10 * 1000 * 1000)
+    parser.add_argument('--values', type=int, default=5000)
+    parser.add_argument('--child', choices=sorted(ENGINES), help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.child:
+        load(arguments.child, arguments.keys, arguments.values)
+        return
+
+    print(f'{"движок":<8} {"RSS, МБ":>10} {"Б/ключ":>10} {"MEMORY Б/кл":>12} {"SET/с":>12}')
+    sys.stdout.flush()
+    for engine in ENGINES:
+        subprocess.run([sys.executable, '-m', 'benchmarks.memory_bench', '--child', engine,
+                        '--keys', str(arguments.keys), '--values', str(arguments.values)], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Счётчики и числовые диапазоны: INCR против GET и SET с прибавлением на стороне клиента
+(каждая команда проходит разбор строки), COUNTS BETWEEN по числовому индексу против
+перебора всех значений.
+Запуск: python -m benchmarks.numeric_bench [--keys 100000] [--operations 100000]
+"""
+import argparse
+import logging
+import random
+import time
+
+from custom_database import CustomDataBase
+from input_filter import parse_command
+from ordered_index import parse_number
+
+
+def incr(database: CustomDataBase, keys: list) -> None:
+    for key in keys:
+        database.execute_command(*parse_command(f'INCR {key}'))
+
+
+def get_set(database: CustomDataBase, keys: list) -> None:
+    for key in keys:
+        value = database.execute_command(*parse_command(f'GET {key}'))
+        database.execute_command(*parse_command(f'SET {key} {int(value) + 1}'))
+
+
+def counts_between(database: CustomDataBase, ranges: list) -> None:
+    for low, high in ranges:
+        database.counts_between(low, high)
+
+
+def counts_scan(database: CustomDataBase, ranges: list) -> None:
+    for low, high in ranges:
+        sum(1 for value in database.database.values() if low <= parse_number(value) <= high)
+
+
+def timed(method, database: CustomDataBase, arguments: list) -> float:
+    started = time.perf_counter()
+    method(database, arguments)
+    return len(arguments) / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=100000)
+    parser.add_argument('--operations', type=int, default=100000)
+    arguments = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    rng = random.Random(1)
+    database = CustomDataBase()
+    database.mset([(f'key{i}', str(rng.randrange(arguments.keys))) for i in range(arguments.keys)])
+    keys = [f'key{rng.randrange(arguments.keys)}' for _ in range(arguments.operations)]
+    starts = [rng.randrange(arguments.keys) for _ in range(100)]
+    ranges = [(start, start + 100) for start in starts]
+    # Числовой индекс строится при первом запросе и дальше поддерживается.
+    database.counts_between(0, 0)
+
+    print(f'{"способ":<16} {"операций/с":>12}')
+    for name, method, method_arguments in (('INCR', incr, keys), ('GET+SET', get_set, keys),
+                                           ('COUNTS BETWEEN', counts_between, ranges),
+                                           ('перебор', counts_scan, ranges)):
+        print(f'{name:<16} {timed(method, database, method_arguments):>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
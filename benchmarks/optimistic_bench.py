@@ -0,0 +1,99 @@
+"""
+Короткие транзакции «прочитать-изменить-записать» (увеличение счётчика) через сеансы сервера:
+BEGIN/GET/SET/COMMIT со снимком данных против WATCH/GET/MULTI/SET/EXEC.
+Клиенты выполняют шаги транзакций по очереди, поэтому при малом количестве ключей
+транзакции конфликтуют и повторяются.
+Запуск: python -m benchmarks.optimistic_bench [--clients 1 10] [--keys 1000 10] [--transactions N]
+"""
+import argparse
+import logging
+import random
+import time
+
+from constants import Action, WrongInputException
+from custom_database import CustomDataBase
+from input_filter import ParsedCommand
+from mvcc import VersionStore
+from session import Session
+
+
+def begin_steps(key: str):
+    yield ParsedCommand(Action.BEGIN)
+    value = yield ParsedCommand(Action.GET, key)
+    yield ParsedCommand(Action.SET, key, str(int(value) + 1))
+    yield ParsedCommand(Action.COMMIT)
+
+
+def watch_steps(key: str):
+    yield ParsedCommand(Action.WATCH, arguments=(key,))
+    value = yield ParsedCommand(Action.GET, key)
+    yield ParsedCommand(Action.MULTI)
+    yield ParsedCommand(Action.SET, key, str(int(value) + 1))
+    yield ParsedCommand(Action.EXEC)
+
+
+def run(steps, clients: int, keys: int, transactions: int, seed: int = 1) -> dict:
+    """
+    Выполнить transactions транзакций clients сеансами, чередуя их шаги.
+    Возвращает количество транзакций в секунду и долю повторов из-за конфликтов.
+    :param steps: генератор команд одной транзакции.
+    :param clients:
+    :param keys:
+    :param transactions:
+    :param seed:
+    :return:
+    """
+    rng = random.Random(seed)
+    database = CustomDataBase()
+    database.mset([(f'key{i}', '0') for i in range(keys)])
+    versions = VersionStore(database)
+    sessions = [Session(database, versions) for _ in range(clients)]
+    running = [None] * clients
+    committed = retries = 0
+    started = time.perf_counter()
+    while committed < transactions:
+        for client, session in enumerate(sessions):
+            if running[client] is None:
+                key = f'key{rng.randrange(keys)}'
+                running[client] = (key, steps(key))
+                result = None
+            else:
+                result = running[client][2]
+            key, transaction = running[client][:2]
+            try:
+                command = transaction.send(result)
+            except StopIteration:
+                running[client] = None
+                committed += 1
+                continue
+            try:
+                running[client] = (key, transaction, session.execute_command(*command))
+            except WrongInputException:
+                running[client] = None
+                retries += 1
+    elapsed = time.perf_counter() - started
+    return {
+        'transactions_per_sec': committed / elapsed,
+        'retry_ratio'         : retries / (committed + retries),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--keys', type=int, nargs='+', default=[1000, 10])
+    parser.add_argument('--transactions', type=int, default=100000)
+    arguments = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f'{"модель":<12} {"клиенты":>8} {"ключи":>7} {"транзакций/с":>13} {"повторы":>8}')
+    for clients in arguments.clients:
+        for keys in arguments.keys:
+            for name, steps in (('BEGIN', begin_steps), ('WATCH/EXEC', watch_steps)):
+                result = run(steps, clients, keys, arguments.transactions)
+                print(f'{name:<12} {clients:>8} {keys:>7} {result["transactions_per_sec"]:>13.0f} '
+                      f'{result["retry_ratio"]:>8.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Стоимость разбора одной строки с командой.
+Запуск: python -m benchmarks.parser_bench [--lines N]
+"""
+import argparse
+import time
+
+from input_filter import InputFilter, parse_command
+
+SAMPLE_LINES = [
+    'SET key1 value1',
+    'GET key1',
+    'unset key1',
+    'COUNTS value1',
+    'FIND value1',
+    'BEGIN',
+    'COMMIT',
+    'SET key1',
+    'UNKNOWN key1',
+]
+
+
+def measure(parse, lines) -> float:
+    """
+    Вернуть среднее время разбора одной строки в наносекундах.
+    :param parse:
+    :param lines:
+    :return:
+    """
+    started = time.perf_counter_ns()
+    for line in lines:
+        try:
+            parse(line)
+        except Exception:
+            pass
+    return (time.perf_counter_ns() - started) / len(lines)
+
+
+def parse_with_filter(line):
+    input_filter = InputFilter(line)
+    if input_filter.is_valid():
+        return input_filter.cleaned_data
+    raise input_filter.error
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=500000)
+    arguments = parser.parse_args()
+    lines = [SAMPLE_LINES[i % len(SAMPLE_LINES)] for i in range(arguments.lines)]
+
+    print(f'{"парсер":<24} {"нс/строка":>10}')
+    print(f'{"parse_command":<24} {measure(parse_command, lines):>10.0f}')
+    print(f'{"InputFilter.is_valid":<24} {measure(parse_with_filter, lines):>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
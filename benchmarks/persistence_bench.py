@@ -0,0 +1,60 @@
+"""
+Пропускная способность записи с журналом предзаписи для каждой политики fsync.
+Запуск: python -m benchmarks.persistence_bench [--operations N] [--transaction-size M]
+"""
+import argparse
+import tempfile
+import time
+
+from custom_database import CustomDataBase
+from persistence import FsyncPolicy, PersistentStorage
+
+
+def run(policy: FsyncPolicy, operations: int, transaction_size: int, fsync_interval: float) -> dict:
+    """
+    Выполнить operations операций SET, группируя их в транзакции по transaction_size штук
+    (1 - каждая операция фиксируется отдельно).
+    :param policy:
+    :param operations:
+    :param transaction_size:
+    :param fsync_interval:
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as data_dir:
+        storage = PersistentStorage(data_dir, fsync_policy=policy, fsync_interval=fsync_interval,
+                                    snapshot_every=None)
+        database = storage.open(CustomDataBase())
+        started = time.perf_counter()
+        for i in range(operations):
+            if transaction_size > 1 and i % transaction_size == 0:
+                database.begin_transaction()
+            database.set(f'key{i % 10000}', str(i))
+            if transaction_size > 1 and i % transaction_size == transaction_size - 1:
+                database.commit_transaction()
+        while database.transaction_stack:
+            database.commit_transaction()
+        elapsed = time.perf_counter() - started
+        fsync_count = storage.wal.fsync_count
+        storage.close()
+    return {'policy': policy.value, 'ops_per_sec': operations / elapsed, 'fsyncs': fsync_count}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--operations', type=int, default=20000)
+    parser.add_argument('--transaction-size', type=int, default=1)
+    parser.add_argument('--fsync-interval', type=float, default=1.0)
+    arguments = parser.parse_args()
+
+    print(f'{"политика":<10} {"оп/с":>12} {"fsync":>8}')
+    for policy in FsyncPolicy:
+        operations = arguments.operations
+        if policy is FsyncPolicy.ALWAYS and arguments.transaction_size == 1:
+            # fsync на каждую операцию медленный, сокращаем объём, чтобы замер не длился минутами.
+            operations = min(operations, 2000)
+        result = run(policy, operations, arguments.transaction_size, arguments.fsync_interval)
+        print(f'{result["policy"]:<10} {result["ops_per_sec"]:>12.0f} {result["fsyncs"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
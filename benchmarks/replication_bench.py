@@ -0,0 +1,99 @@
+"""
+Отставание реплики под нагрузкой записи: ведущий сервер и реплика запускаются
+отдельными процессами (main.py --serve и main.py --serve --replicaof), клиент пишет
+на ведущий сервер пакетами SET, а отставание читается из STATS JSON реплики.
+Запуск: python -m benchmarks.replication_bench [--duration 3] [--pipeline 100]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def connect(port: int):
+    for _ in range(100):
+        try:
+            return await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f'Сервер на порту {port} не запустился.')
+
+
+async def stats(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> dict:
+    writer.write(b'STATS JSON\n')
+    return json.loads((await reader.readline())[1:])
+
+
+async def run(leader_port: int, follower_port: int, duration: float, pipeline: int) -> dict:
+    leader = await connect(leader_port)
+    follower = await connect(follower_port)
+    while (await stats(*follower)).get('leader_link') != 'up':
+        await asyncio.sleep(0.05)
+    lags = []
+    written = 0
+    started = time.perf_counter()
+    deadline = started + duration
+    reader, writer = leader
+    while time.perf_counter() < deadline:
+        writer.write(''.join(f'SET key{written + i} {i % 100}\n' for i in range(pipeline)).encode())
+        for _ in range(pipeline):
+            await reader.readline()
+        written += pipeline
+        if written % (pipeline * 20) == 0:
+            lags.append((await stats(*follower))['replication_lag_ms'])
+    elapsed = time.perf_counter() - started
+    leader_offset = (await stats(*leader))['replication_offset']
+    while (await stats(*follower))['replication_offset'] < leader_offset:
+        await asyncio.sleep(0.001)
+    catch_up = time.perf_counter() - started - elapsed
+    for _, connection_writer in (leader, follower):
+        connection_writer.close()
+    lags.sort()
+    return {
+        'writes_per_sec': written / elapsed,
+        'lag_p50_ms'    : lags[len(lags) // 2] if lags else 0,
+        'lag_max_ms'    : lags[-1] if lags else 0,
+        'catch_up_ms'   : catch_up * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--pipeline', type=int, default=100)
+    arguments = parser.parse_args()
+
+    leader_port, follower_port = free_port(), free_port()
+    with tempfile.TemporaryDirectory() as leader_dir, tempfile.TemporaryDirectory() as follower_dir:
+        common = [sys.executable, MAIN, '--serve', '--log-level', 'WARNING']
+        processes = [
+            subprocess.Popen(common + ['--port', str(leader_port)], cwd=leader_dir),
+            subprocess.Popen(common + ['--port', str(follower_port), '--replicaof', f'127.0.0.1:{leader_port}'],
+                             cwd=follower_dir),
+        ]
+        try:
+            result = asyncio.run(run(leader_port, follower_port, arguments.duration, arguments.pipeline))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+    print(f'записей/с: {result["writes_per_sec"]:.0f}')
+    print(f'отставание реплики p50: {result["lag_p50_ms"]:.2f} мс, максимум: {result["lag_max_ms"]:.2f} мс')
+    print(f'реплика догнала ведущий сервер через {result["catch_up_ms"]:.1f} мс после окончания записи')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Нагрузочный клиент для TCP-сервера: пропускная способность и задержки
+в зависимости от количества одновременных клиентов.
+Без --port запускает сервер в этом же процессе.
+Запуск: python -m benchmarks.server_load [--clients 1 10 100 1000] [--pipeline 16] [--duration 3]
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from custom_database import CustomDataBase
+from metrics import LatencyHistogram
+from server import DatabaseServer
+
+
+async def client(host: str, port: int, pipeline: int, deadline: float, keyspace: int,
+                 histogram: LatencyHistogram, counter: list) -> None:
+    """
+    Один клиент: отправляет пакеты из pipeline команд (половина GET, половина SET)
+    и ждёт ответы на весь пакет. Задержка считается на пакет.
+    :return:
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    rng = random.Random()
+    try:
+        while time.perf_counter() < deadline:
+            batch = []
+            for _ in range(pipeline):
+                key = rng.randrange(keyspace)
+                if rng.random() < 0.5:
+                    batch.append(f'GET key{key}\n')
+                else:
+                    batch.append(f'SET key{key} {rng.randrange(100)}\n')
+            started = time.perf_counter_ns()
+            writer.write(''.join(batch).encode())
+            for _ in range(pipeline):
+                await reader.readline()
+            histogram.record(time.perf_counter_ns() - started)
+            counter[0] += pipeline
+    finally:
+        writer.close()
+
+
+async def run_level(host: str, port: int, clients: int, pipeline: int, duration: float, keyspace: int) -> dict:
+    histogram = LatencyHistogram()
+    counter = [0]
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(client(host, port, pipeline, deadline, keyspace, histogram, counter)
+                           for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {
+        'clients'    : clients,
+        'ops_per_sec': counter[0] / elapsed,
+        'p50_ms'     : histogram.percentile(50) / 1e6,
+        'p99_ms'     : histogram.percentile(99) / 1e6,
+    }
+
+
+async def run(arguments: argparse.Namespace) -> None:
+    server = None
+    port = arguments.port
+    if port is None:
+        database = CustomDataBase()
+        for i in range(arguments.keyspace):
+            database.set(f'key{i}', str(i % 100))
+        server = DatabaseServer(database, arguments.host, 0)
+        await server.start()
+        port = server.port
+
+    print(f'{"клиенты":>8} {"оп/с":>12} {"p50, мс":>10} {"p99, мс":>10}')
+    for clients in arguments.clients:
+        try:
+            result = await run_level(arguments.host, port, clients, arguments.pipeline,
+                                     arguments.duration, arguments.keyspace)
+        except OSError as e:
+            print(f'{clients:>8} ошибка: {e}')
+            continue
+        print(f'{result["clients"]:>8} {result["ops_per_sec"]:>12.0f} '
+              f'{result["p50_ms"]:>10.2f} {result["p99_ms"]:>10.2f}')
+
+    if server is not None:
+        await server.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--pipeline', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--keyspace', type=int, default=10000)
+    logging.disable(logging.CRITICAL)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Масштабирование пропускной способности в зависимости от количества сегментов.
+Команды отправляются пакетами через ShardedDataBase.execute_batch; для сравнения
+приведена одна CustomDataBase в текущем процессе.
+Запуск: python -m benchmarks.sharding_bench [--shards 1 2 4 8] [--operations N] [--batch-size M]
+"""
+import argparse
+import logging
+import os
+import random
+import time
+
+from constants import Action
+from custom_database import CustomDataBase
+from input_filter import ParsedCommand
+from sharding import ShardedDataBase
+
+
+def make_commands(operations: int, keyspace: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    commands = []
+    for _ in range(operations):
+        key = f'key{rng.randrange(keyspace)}'
+        if rng.random() < 0.5:
+            commands.append(ParsedCommand(Action.GET, key))
+        else:
+            commands.append(ParsedCommand(Action.SET, key, str(rng.randrange(100))))
+    return commands
+
+
+def run_single(commands: list) -> float:
+    database = CustomDataBase()
+    started = time.perf_counter()
+    for command in commands:
+        try:
+            database.execute_command(*command)
+        except Exception:
+            pass
+    return len(commands) / (time.perf_counter() - started)
+
+
+def run_sharded(commands: list, shards: int, batch_size: int) -> float:
+    database = ShardedDataBase(shards)
+    try:
+        started = time.perf_counter()
+        for start in range(0, len(commands), batch_size):
+            database.execute_batch(commands[start:start + batch_size])
+        return len(commands) / (time.perf_counter() - started)
+    finally:
+        database.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--operations', type=int, default=400000)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--keyspace', type=int, default=100000)
+    arguments = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    commands = make_commands(arguments.operations, arguments.keyspace)
+
+    print(f'Ядер процессора: {os.cpu_count()}')
+    print(f'{"сегменты":>10} {"оп/с":>12}')
+    print(f'{"процесс":>10} {run_single(commands):>12.0f}')
+    for shards in arguments.shards:
+        print(f'{shards:>10} {run_sharded(commands, shards, arguments.batch_size):>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Задержка команд во время записи снимка: дочерний процесс (fork) против копии данных и потока.
+Запуск: python -m benchmarks.snapshot_bench [--keys N]
+"""
+import argparse
+import tempfile
+import time
+
+from custom_database import CustomDataBase
+from metrics import LatencyHistogram
+from persistence import FsyncPolicy, PersistentStorage
+
+
+def run(keys: int, fork: bool) -> dict:
+    """
+    Заполнить базу keys ключами, начать фоновую запись снимка и выполнять SET
+    до её окончания. Возвращает паузу на запуск записи, длительность записи
+    и задержки команд, выполненных во время записи.
+    :param keys:
+    :param fork:
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as data_dir:
+        storage = PersistentStorage(data_dir, fsync_policy=FsyncPolicy.NEVER, snapshot_every=None)
+        database = storage.open(CustomDataBase())
+        database.FORK_SNAPSHOTS = fork
+        database.mset([(f'key{i}', str(i % 1000)) for i in range(keys)])
+        histogram = LatencyHistogram()
+        started = time.perf_counter_ns()
+        storage.snapshot()
+        histogram.record(time.perf_counter_ns() - started)
+        operations = 0
+        while storage.saver.in_progress:
+            started = time.perf_counter_ns()
+            database.set(f'key{operations % keys}', 'x')
+            histogram.record(time.perf_counter_ns() - started)
+            operations += 1
+        stats = storage.saver.stats()
+        storage.close()
+    return {
+        'mode'       : 'fork' if fork else 'thread',
+        'start_ms'   : stats['last_fork_ms'],
+        'save_ms'    : stats['last_save_duration_ms'],
+        'operations' : operations,
+        'p99_us'     : histogram.percentile(99) / 1000,
+        'max_us'     : histogram.percentile(100) / 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=1000000)
+    arguments = parser.parse_args()
+
+    print(f'{"режим":<8} {"запуск, мс":>11} {"запись, мс":>11} {"SET":>9} {"p99, мкс":>10} {"max, мкс":>10}')
+    for fork in (True, False):
+        result = run(arguments.keys, fork)
+        print(f'{result["mode"]:<8} {result["start_ms"]:>11.1f} {result["save_ms"]:>11.1f} '
+              f'{result["operations"]:>9} {result["p99_us"]:>10.1f} {result["max_us"]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Время запуска с восстановлением данных: от начала main.py до готовности к первой команде.
+Сравниваются снимок версии 2 (словарь значений, загрузка через mmap группами ключей),
+снимок версии 1 (записи журнала) и загрузка теми же данными в виде команд SET в пакетном режиме.
+Запуск: python -m benchmarks.startup_bench [--keys 1000000] [--values 100]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from custom_database import CustomDataBase
+from persistence import RECORDS_SNAPSHOT_MAGIC, SNAPSHOT_FILE_NAME, encode_record, write_snapshot
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+
+def startup_seconds(arguments: list, cwd: str, stdin: bytes = b'') -> float:
+    """
+    Запустить main.py и вернуть время запуска, которое он сообщает в stderr.
+    :param arguments:
+    :param cwd:
+    :param stdin:
+    :return:
+    """
+    result = subprocess.run([sys.executable, MAIN, '--log-level', 'WARNING', '--startup-budget', '3600']
+                            + arguments, input=stdin, capture_output=True, cwd=cwd, check=True)
+    return float(re.search(r'Запуск: ([\d.]+)', result.stderr.decode()).group(1))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=1000000)
+    parser.add_argument('--values', type=int, default=100)
+    parser.add_argument('--skip-commands', action='store_true',
+                        help='Не замерять загрузку командами SET (медленно для больших --keys).')
+    arguments = parser.parse_args()
+
+    items = [(f'key{i}', str(i % arguments.values)) for i in range(arguments.keys)]
+    database = CustomDataBase()
+    database.load_grouped((value, [key for key, _ in items[int(value)::arguments.values]])
+                          for value in map(str, range(min(arguments.values, arguments.keys))))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = {}
+        v2_dir = os.path.join(work_dir, 'v2')
+        os.makedirs(v2_dir)
+        started = time.perf_counter()
+        write_snapshot(os.path.join(v2_dir, SNAPSHOT_FILE_NAME), database.committed_groups())
+        print(f'Запись снимка версии 2: {time.perf_counter() - started:.3f} с, '
+              f'{os.path.getsize(os.path.join(v2_dir, SNAPSHOT_FILE_NAME)) / 2 ** 20:.1f} МБ')
+        results['снимок v2 (mmap)'] = startup_seconds(['--data-dir', v2_dir, '--batch'], work_dir)
+
+        v1_dir = os.path.join(work_dir, 'v1')
+        os.makedirs(v1_dir)
+        with open(os.path.join(v1_dir, SNAPSHOT_FILE_NAME), 'wb') as file:
+            file.write(RECORDS_SNAPSHOT_MAGIC)
+            file.write(b''.join(encode_record(key, value) for key, value in items))
+        print(f'Снимок версии 1: {os.path.getsize(os.path.join(v1_dir, SNAPSHOT_FILE_NAME)) / 2 ** 20:.1f} МБ')
+        results['снимок v1 (записи)'] = startup_seconds(['--data-dir', v1_dir, '--batch'], work_dir)
+
+        if not arguments.skip_commands:
+            commands = ''.join(f'SET {key} {value}\n' for key, value in items).encode()
+            started = time.perf_counter()
+            subprocess.run([sys.executable, MAIN, '--log-level', 'WARNING', '--batch'], input=commands,
+                           capture_output=True, cwd=work_dir, check=True)
+            results['команды SET'] = time.perf_counter() - started
+
+    print(f'{"способ загрузки":<20} {"время, с":>10}')
+    for name, seconds in results.items():
+        print(f'{name:<20} {seconds:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
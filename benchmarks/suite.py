@@ -0,0 +1,172 @@
+"""
+Воспроизводимый набор замеров для CustomDataBase и разбора команд.
+Для каждой нагрузки из benchmarks.workloads и каждого размера данных измеряются
+операции в секунду (лучший из нескольких повторов) и пиковая память (tracemalloc,
+отдельным прогоном, так как трассировка замедляет выполнение).
+Результаты можно сохранить в JSON и сравнить с сохранёнными ранее.
+Запуск:
+    python -m benchmarks.suite --save baseline.json
+    python -m benchmarks.suite --compare baseline.json [--threshold 0.1]
+"""
+from typing import Any, Dict, List, Optional
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks.workloads import WORKLOADS
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DEFAULT_OPERATIONS = 200000
+DEFAULT_REPEATS = 3
+DEFAULT_SEED = 42
+
+
+def measure(name: str, size: int, operations: int, repeats: int, seed: int) -> Dict[str, Any]:
+    """
+    Замерить одну нагрузку на одном размере данных.
+    :param name:
+    :param size:
+    :param operations:
+    :param repeats:
+    :param seed:
+    :return:
+    """
+    workload = WORKLOADS[name]
+    best = 0.0
+    for _ in range(repeats):
+        database, run = workload(size, operations, seed)
+        gc.collect()
+        started = time.perf_counter()
+        executed = run()
+        elapsed = time.perf_counter() - started
+        best = max(best, executed / elapsed)
+        del database, run
+
+    gc.collect()
+    tracemalloc.start()
+    database, run = workload(size, operations, seed)
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del database, run
+
+    return {'workload': name, 'size': size, 'ops_per_sec': best, 'peak_memory_bytes': peak}
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        'python'   : sys.version.split()[0],
+        'platform' : platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Сравнить результаты с сохранёнными. Регрессия - падение скорости или рост памяти
+    больше чем на threshold (доля). Возвращает описания регрессий.
+    :param results:
+    :param baseline:
+    :param threshold:
+    :return:
+    """
+    previous = {(result['workload'], result['size']): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get((result['workload'], result['size']))
+        if old is None:
+            continue
+        speed = result['ops_per_sec'] / old['ops_per_sec'] - 1
+        memory = result['peak_memory_bytes'] / max(1, old['peak_memory_bytes']) - 1
+        if speed < -threshold:
+            regressions.append(f'{result["workload"]}[{result["size"]}]: скорость {speed:+.1%}')
+        if memory > threshold:
+            regressions.append(f'{result["workload"]}[{result["size"]}]: память {memory:+.1%}')
+    return regressions
+
+
+def print_results(results: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]]) -> None:
+    previous = {}
+    if baseline:
+        previous = {(result['workload'], result['size']): result for result in baseline['results']}
+    print(f'{"нагрузка":<24} {"размер":>9} {"оп/с":>12} {"память, МБ":>11} {"изм. оп/с":>10}')
+    for result in results:
+        old = previous.get((result['workload'], result['size']))
+        change = f'{result["ops_per_sec"] / old["ops_per_sec"] - 1:+.1%}' if old else ''
+        print(f'{result["workload"]:<24} {result["size"]:>9} {result["ops_per_sec"]:>12.0f} '
+              f'{result["peak_memory_bytes"] / 2 ** 20:>11.1f} {change:>10}')
+
+
+def print_scaling(results: List[Dict[str, Any]]) -> None:
+    """
+    Кривые масштабирования: операции в секунду каждой нагрузки в зависимости от размера данных.
+    :param results:
+    :return:
+    """
+    sizes = sorted({result['size'] for result in results})
+    curves: Dict[str, Dict[int, float]] = {}
+    for result in results:
+        curves.setdefault(result['workload'], {})[result['size']] = result['ops_per_sec']
+    print()
+    print(f'{"оп/с по размеру":<24}' + ''.join(f'{size:>12}' for size in sizes))
+    for name, curve in curves.items():
+        print(f'{name:<24}' + ''.join(f'{curve.get(size, 0):>12.0f}' for size in sizes))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workloads', nargs='+', choices=sorted(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--operations', type=int, default=DEFAULT_OPERATIONS)
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--save', metavar='PATH', help='Сохранить результаты в JSON.')
+    parser.add_argument('--compare', metavar='PATH', help='Сравнить с результатами из JSON.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Допустимое ухудшение (доля) до признания регрессии.')
+    arguments = parser.parse_args(argv)
+    logging.disable(logging.CRITICAL)
+
+    results = []
+    for size in arguments.sizes:
+        for name in arguments.workloads:
+            results.append(measure(name, size, arguments.operations, arguments.repeats, arguments.seed))
+
+    baseline = None
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    if len(arguments.sizes) > 1:
+        print_scaling(results)
+
+    if arguments.save:
+        report = {
+            'environment': environment(),
+            'parameters' : {'operations': arguments.operations, 'repeats': arguments.repeats,
+                            'seed'      : arguments.seed},
+            'results'    : results,
+        }
+        with open(arguments.save, 'w') as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+    if baseline:
+        regressions = compare(results, baseline, arguments.threshold)
+        if regressions:
+            print('Регрессии:')
+            for regression in regressions:
+                print(f'  {regression}')
+            return 1
+        print('Регрессий не обнаружено.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Синтетические нагрузки для набора замеров benchmarks.suite.
+Каждая нагрузка получает размер данных, количество операций и зерно генератора
+случайных чисел и возвращает подготовленную базу данных и функцию, выполняющую
+операции и возвращающую их количество. Подготовка в замер скорости не входит.
+"""
+from itertools import accumulate
+from typing import Callable, Dict, List, Tuple
+import random
+
+from custom_database import CustomDataBase
+from input_filter import parse_command
+
+Workload = Callable[[int, int, int], Tuple[CustomDataBase, Callable[[], int]]]
+
+# Показатель распределения Ципфа для неравномерного доступа к ключам.
+ZIPF_EXPONENT = 1.1
+
+# Количество различных значений при низкой кардинальности.
+LOW_CARDINALITY_VALUES = 10
+
+# Максимальное суммарное количество ключей, возвращаемых FIND за один замер.
+MAX_FOUND_KEYS = 20 * 1000 * 1000
+
+# Глубина вложенности транзакций в нагрузке nested_transactions.
+TRANSACTION_DEPTH = 32
+
+
+def populate(size: int, cardinality: int) -> CustomDataBase:
+    """
+    Создать базу данных с ключами key0..key{size-1} и значениями из cardinality вариантов.
+    :param size:
+    :param cardinality:
+    :return:
+    """
+    database = CustomDataBase()
+    database.database = {f'key{i}': str(i % cardinality) for i in range(size)}
+    return database
+
+
+def uniform_keys(size: int, operations: int, rng: random.Random) -> List[str]:
+    return [f'key{rng.randrange(size)}' for _ in range(operations)]
+
+
+def zipf_keys(size: int, operations: int, rng: random.Random) -> List[str]:
+    cumulative_weights = list(accumulate(1 / (rank ** ZIPF_EXPONENT) for rank in range(1, size + 1)))
+    ranks = rng.choices(range(size), cum_weights=cumulative_weights, k=operations)
+    return [f'key{rank}' for rank in ranks]
+
+
+def _mixed(read_ratio: float, skewed: bool) -> Workload:
+    def workload(size: int, operations: int, seed: int):
+        rng = random.Random(seed)
+        database = populate(size, size)
+        keys = zipf_keys(size, operations, rng) if skewed else uniform_keys(size, operations, rng)
+        reads = [rng.random() < read_ratio for _ in range(operations)]
+        values = [str(rng.randrange(size)) for _ in range(operations)]
+
+        def run() -> int:
+            get = database.get
+            set_ = database.set
+            for key, read, value in zip(keys, reads, values):
+                if read:
+                    get(key)
+                else:
+                    set_(key, value)
+            return operations
+
+        return database, run
+
+    return workload
+
+
+def _counts_find(cardinality: Callable[[int], int]) -> Workload:
+    def workload(size: int, operations: int, seed: int):
+        rng = random.Random(seed)
+        values_count = cardinality(size)
+        database = populate(size, values_count)
+        # FIND при низкой кардинальности возвращает size / values_count ключей:
+        # ограничиваем суммарный объём результатов, чтобы замер длился секунды.
+        operations = min(operations, max(100, MAX_FOUND_KEYS // max(1, size // values_count)))
+        values = [str(rng.randrange(values_count)) for _ in range(operations)]
+
+        def run() -> int:
+            counts = database.counts
+            find = database.find
+            for number, value in enumerate(values):
+                if number % 2:
+                    find(value)
+                else:
+                    counts(value)
+            return operations
+
+        return database, run
+
+    return workload
+
+
+def nested_transactions(size: int, operations: int, seed: int):
+    """
+    BEGIN до глубины TRANSACTION_DEPTH, на каждом уровне запись нескольких ключей,
+    затем поочерёдно ROLLBACK и COMMIT всех уровней.
+    """
+    rng = random.Random(seed)
+    database = populate(size, size)
+    writes_per_level = 4
+    per_round = TRANSACTION_DEPTH * (writes_per_level + 2)
+    rounds = max(1, operations // per_round)
+    keys = uniform_keys(size, rounds * TRANSACTION_DEPTH * writes_per_level, rng)
+
+    def run() -> int:
+        position = 0
+        for _ in range(rounds):
+            for _ in range(TRANSACTION_DEPTH):
+                database.begin_transaction()
+                for key in keys[position:position + writes_per_level]:
+                    database.set(key, 'tx')
+                position += writes_per_level
+            for level in range(TRANSACTION_DEPTH):
+                if level % 2:
+                    database.commit_transaction()
+                else:
+                    database.rollback_transaction()
+        return rounds * per_round
+
+    return database, run
+
+
+def parser(size: int, operations: int, seed: int):
+    """
+    Разбор строк с командами (без выполнения).
+    """
+    rng = random.Random(seed)
+    templates = ['SET key{0} {1}', 'GET key{0}', 'UNSET key{0}', 'COUNTS {1}', 'FIND {1}', 'BEGIN', 'COMMIT']
+    lines = [rng.choice(templates).format(rng.randrange(size), rng.randrange(100)) for _ in range(operations)]
+
+    def run() -> int:
+        for line in lines:
+            parse_command(line)
+        return operations
+
+    return CustomDataBase(), run
+
+
+WORKLOADS: Dict[str, Workload] = {
+    'read_heavy_uniform'    : _mixed(0.9, skewed=False),
+    'read_heavy_zipf'       : _mixed(0.9, skewed=True),
+    'write_heavy_uniform'   : _mixed(0.1, skewed=False),
+    'write_heavy_zipf'      : _mixed(0.1, skewed=True),
+    'counts_find_low_card'  : _counts_find(lambda size: LOW_CARDINALITY_VALUES),
+    'counts_find_high_card' : _counts_find(lambda size: max(1, size // 2)),
+    'nested_transactions'   : nested_transactions,
+    'parser'                : parser,
+}
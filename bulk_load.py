@@ -0,0 +1,191 @@
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+import csv
+import io
+import logging
+import multiprocessing
+import os
+
+from custom_database import CustomDataBase
+
+logger = logging.getLogger(__name__)
+
+# Размер части файла, которую разбирает один процесс при параллельной загрузке CSV.
+CSV_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Файлы меньше этого размера разбираются в текущем процессе даже при workers > 1:
+# запуск процессов и передача результатов обошлись бы дороже разбора.
+PARALLEL_MIN_SIZE = 4 * CSV_CHUNK_SIZE
+
+
+class CsvFormatError(ValueError):
+    """
+    Строка CSV-файла без ключа и значения. line - номер строки файла, начиная с 1.
+    """
+
+    def __init__(self, line: int, row: List[str]) -> None:
+        super().__init__(line, row)
+        self.line = line
+        self.row = row
+
+    def __str__(self) -> str:
+        return f'Строка {self.line}: ожидается ключ и значение, получено {self.row!r}.'
+
+
+def _pairs(rows) -> Iterator[Tuple[str, str]]:
+    # Пары (ключ, значение) из строк csv.reader: первые два столбца, пустые строки пропускаются.
+    for row in rows:
+        if len(row) >= 2:
+            yield row[0], row[1]
+        elif row:
+            raise CsvFormatError(rows.line_num, row)
+
+
+def read_csv(path: str, delimiter: str = ',', header: bool = False,
+             encoding: str = 'utf-8') -> Iterator[Tuple[str, str]]:
+    """
+    Лениво прочитать пары (ключ, значение) из первых двух столбцов CSV-файла.
+    :param path:
+    :param delimiter:
+    :param header: пропустить первую строку.
+    :param encoding:
+    :return:
+    """
+    with open(path, newline='', encoding=encoding) as source:
+        rows = csv.reader(source, delimiter=delimiter)
+        if header:
+            next(rows, None)
+        yield from _pairs(rows)
+
+
+def _chunk_bounds(path: str, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Разделить файл на части примерно по chunk_size байт, каждая заканчивается переводом строки.
+    :param path:
+    :param chunk_size:
+    :return:
+    """
+    size = os.path.getsize(path)
+    bounds = []
+    with open(path, 'rb') as source:
+        start = 0
+        while start < size:
+            source.seek(min(start + chunk_size, size))
+            source.readline()
+            stop = min(source.tell(), size)
+            bounds.append((start, stop))
+            start = stop
+    return bounds
+
+
+def _parse_chunk(task: Tuple[str, int, int, str, str]) -> Tuple[List[Tuple[str, str]], int]:
+    # Разбор части файла в процессе пула: пары списком и количество строк в части.
+    # Номер строки в CsvFormatError - номер внутри части.
+    path, start, stop, delimiter, encoding = task
+    with open(path, 'rb') as source:
+        source.seek(start)
+        text = source.read(stop - start).decode(encoding)
+    return list(_pairs(csv.reader(io.StringIO(text, newline=''), delimiter=delimiter))), text.count('\n')
+
+
+def load_csv(database: CustomDataBase, path: str, delimiter: str = ',', header: bool = False,
+             workers: int = 1, encoding: str = 'utf-8') -> int:
+    """
+    Загрузить в базу данных пары (ключ, значение) из первых двух столбцов CSV-файла
+    методом database.load и вернуть количество загруженных пар.
+    При workers > 1 большой файл делится по строкам на части, которые разбирают
+    workers процессов; части загружаются в порядке следования в файле.
+    В этом режиме поля в кавычках не должны содержать переводов строк.
+    >>>load_csv(database, 'data.csv', header=True, workers=4)
+    1000000
+    :param database:
+    :param path:
+    :param delimiter:
+    :param header: пропустить первую строку.
+    :param workers:
+    :param encoding:
+    :return:
+    """
+    if workers <= 1 or os.path.getsize(path) < PARALLEL_MIN_SIZE:
+        loaded = database.load(read_csv(path, delimiter, header, encoding))
+        logger.info('Загружено из %s пар: %s.', path, loaded)
+        return loaded
+    bounds = _chunk_bounds(path, CSV_CHUNK_SIZE)
+    if header:
+        with open(path, 'rb') as source:
+            source.readline()
+            bounds[0] = (source.tell(), bounds[0][1])
+    tasks = [(path, start, stop, delimiter, encoding) for start, stop in bounds]
+    loaded = 0
+    # Количество строк файла перед текущей частью: по нему номера строк в ошибках
+    # частей пересчитываются в номера строк файла.
+    lines = 1 if header else 0
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.imap(_parse_chunk, tasks)
+        while True:
+            try:
+                pairs, chunk_lines = next(results)
+            except StopIteration:
+                break
+            except CsvFormatError as e:
+                raise CsvFormatError(lines + e.line, e.row) from None
+            loaded += database.load(pairs)
+            lines += chunk_lines
+    logger.info('Загружено из %s пар: %s (частей: %s, процессов: %s).', path, loaded, len(tasks), workers)
+    return loaded
+
+
+def _column(values: Any) -> Sequence[Any]:
+    """
+    Столбец в виде списка значений Python. Массивы NumPy и pandas (tolist) и Arrow (to_pylist)
+    преобразуются своими методами целиком, без обращения к элементам по одному,
+    поэтому сами библиотеки импортировать не нужно.
+    :param values:
+    :return:
+    """
+    for method in ('to_pylist', 'tolist'):
+        convert = getattr(values, method, None)
+        if convert is not None:
+            return convert()
+    return values if isinstance(values, (list, tuple)) else list(values)
+
+
+def _text(values: Sequence[Any]) -> Sequence[Optional[str]]:
+    """
+    Привести каждое значение столбца к строке: числа - в десятичную запись, байты декодируются,
+    None остаётся None. Тип проверяется у каждого значения, поэтому столбцы
+    со смешанными типами ('a', 3) сохраняются только строками.
+    :param values:
+    :return:
+    """
+    if all(type(value) is str for value in values):
+        return values
+    return [value if type(value) is str else None if value is None
+            else value.decode() if isinstance(value, bytes) else str(value) for value in values]
+
+
+def load_columns(database: CustomDataBase, keys: Any, values: Any) -> int:
+    """
+    Загрузить в базу данных столбцы ключей и значений одинаковой длины: списки,
+    массивы NumPy, серии pandas или массивы Arrow. Нечисловые и числовые значения сохраняются
+    строками (числа - в десятичной записи, их понимают INCR и COUNTS BETWEEN).
+    Пары с отсутствующим значением (None, null Arrow) пропускаются, отсутствующий ключ - ошибка ValueError.
+    Возвращает количество загруженных пар.
+    >>>load_columns(database, numpy.array(['A', 'B']), numpy.array([5, 6]))
+    2
+    :param database:
+    :param keys:
+    :param values:
+    :return:
+    """
+    keys = _column(keys)
+    values = _column(values)
+    if len(keys) != len(values):
+        raise ValueError(f'Количество ключей ({len(keys)}) и значений ({len(values)}) различается.')
+    keys = _text(keys)
+    if None in keys:
+        raise ValueError(f'Ключ в позиции {keys.index(None)} отсутствует (None).')
+    values = _text(values)
+    pairs = zip(keys, values)
+    if None in values:
+        pairs = ((key, value) for key, value in pairs if value is not None)
+    return database.load(pairs)
@@ -0,0 +1,324 @@
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import logging
+import sys
+
+from custom_database import CustomDataBase, group_by_value
+from ordered_index import Number, parse_number
+
+logger = logging.getLogger(__name__)
+
+
+class ValueDictionary:
+    """
+    Словарь значений: каждому различному значению присваивается целочисленный идентификатор.
+    Счётчики ссылок хранятся в массиве array, освободившиеся идентификаторы переиспользуются.
+    Объект int идентификатора хранится в единственном экземпляре (в value_ids),
+    поэтому все ключи с одинаковым значением ссылаются на один и тот же объект.
+    """
+
+    def __init__(self) -> None:
+        self.values: List[Any] = []
+        self.value_ids: Dict[Any, int] = {}
+        self.references = array('Q')
+        self._free_ids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.value_ids)
+
+    def acquire(self, value: Any, references: int = 1) -> int:
+        """
+        Вернуть идентификатор значения, увеличив счётчик ссылок на references.
+        :param value:
+        :param references:
+        :return:
+        """
+        value_id = self.value_ids.get(value)
+        if value_id is None:
+            if self._free_ids:
+                value_id = self._free_ids.pop()
+                self.values[value_id] = value
+            else:
+                value_id = len(self.values)
+                self.values.append(value)
+                self.references.append(0)
+            self.value_ids[value] = value_id
+        self.references[value_id] += references
+        return value_id
+
+    def release(self, value_id: int) -> None:
+        """
+        Уменьшить счётчик ссылок и освободить идентификатор, если ссылок не осталось.
+        :param value_id:
+        :return:
+        """
+        references = self.references[value_id] - 1
+        self.references[value_id] = references
+        if not references:
+            del self.value_ids[self.values[value_id]]
+            self.values[value_id] = None
+            self._free_ids.append(value_id)
+
+    def count(self, value: Any) -> int:
+        value_id = self.value_ids.get(value)
+        return 0 if value_id is None else self.references[value_id]
+
+
+class EncodedValues(Mapping):
+    """
+    Отображение "ключ -> значение", в котором значения хранятся как идентификаторы
+    ValueDictionary. Для чтения ведёт себя как dict, изменяется методами assign/remove.
+    """
+
+    def __init__(self) -> None:
+        self.codes: Dict[str, int] = {}
+        self.dictionary = ValueDictionary()
+
+    def __getitem__(self, key: str) -> Any:
+        return self.dictionary.values[self.codes[key]]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value_id = self.codes.get(key)
+        if value_id is None:
+            return default
+        return self.dictionary.values[value_id]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.codes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def items(self):
+        values = self.dictionary.values
+        return ((key, values[value_id]) for key, value_id in self.codes.items())
+
+    def copy(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def assign(self, key: str, value: Any) -> None:
+        value_id = self.dictionary.acquire(value)
+        old_value_id = self.codes.get(key)
+        self.codes[key] = value_id
+        if old_value_id is not None:
+            self.dictionary.release(old_value_id)
+
+    def assign_new(self, keys: Sequence[str], value: Any) -> None:
+        """
+        Присвоить значение value ключам keys, которых ещё нет в отображении.
+        :param keys:
+        :param value:
+        :return:
+        """
+        value_id = self.dictionary.acquire(value, len(keys))
+        self.codes.update(dict.fromkeys(keys, value_id))
+
+    def assign_all(self, items: Dict[str, Any]) -> None:
+        """
+        Заполнить пустое отображение парами items за один проход: идентификаторы присваиваются
+        значениям в порядке первого появления, счётчики ссылок считаются в том же проходе.
+        :param items:
+        :return:
+        """
+        dictionary = self.dictionary
+        value_ids = dictionary.value_ids
+        values = dictionary.values
+        counts = []
+        codes = self.codes
+        for key, value in items.items():
+            value_id = value_ids.get(value)
+            if value_id is None:
+                value_id = value_ids[value] = len(values)
+                values.append(value)
+                counts.append(1)
+            else:
+                counts[value_id] += 1
+            codes[key] = value_id
+        dictionary.references = array('Q', counts)
+
+    def remove(self, key: str) -> None:
+        self.dictionary.release(self.codes.pop(key))
+
+    def keys_with(self, value: Any) -> Iterator[str]:
+        value_id = self.dictionary.value_ids.get(value)
+        if value_id is None:
+            return iter(())
+        return (key for key, code in self.codes.items() if code is value_id)
+
+
+class CompactDataBase(CustomDataBase):
+    """
+    Вариант CustomDataBase для данных с небольшим количеством различных значений.
+    Значения кодируются идентификаторами словаря значений (ValueDictionary), поэтому
+    каждое различное значение хранится один раз, а обратный индекс значений
+    заменён массивом счётчиков ссылок.
+    COUNTS - O(1) по счётчику ссылок, FIND - O(n) проход по идентификаторам без
+    сравнения строк: индекс "значение -> ключи" занимал бы столько же памяти, сколько сами данные.
+    Интерфейс get/set/unset/counts/find и транзакции совпадают с CustomDataBase.
+    >>>database = CompactDataBase()
+    >>>database.set('A', '5')
+    >>>database.counts('5')
+    1
+    """
+
+    def _rebuild_indexes(self) -> None:
+        if isinstance(self._database, EncodedValues):
+            return
+        encoded = EncodedValues()
+        for key, value in self._database.items():
+            encoded.assign(key, value)
+        self._database = encoded
+        self._value_index = {}
+
+    def load_grouped(self, groups: Iterable[Tuple[Any, Sequence[str]]]) -> None:
+        encoded = EncodedValues()
+        for value, keys in groups:
+            if keys:
+                encoded.assign_new(keys, value)
+        self._database = encoded
+        self._value_index = {}
+        self._data_replaced()
+
+    def _load_all(self, items: Dict[str, Any]) -> None:
+        encoded = EncodedValues()
+        encoded.assign_all(items)
+        self._database = encoded
+        self._value_index = {}
+        self._data_replaced()
+
+    def _load_items(self, items: Dict[str, Any]) -> None:
+        encoded = self._database
+        existing = encoded.codes.keys() & items.keys()
+        for key in existing:
+            encoded.assign(key, items[key])
+        for value, keys in group_by_value((key, value) for key, value in items.items() if key not in existing):
+            encoded.assign_new(keys, value)
+
+    def committed_groups(self) -> Iterable[Tuple[Any, Iterable[str]]]:
+        return group_by_value(self.iter_committed())
+
+    def _store(self, key: str, value: Any) -> None:
+        if self._key_index is not None and key not in self._database:
+            self._key_index.add(key)
+        self._database.assign(key, value)
+
+    def _discard(self, key: str) -> None:
+        self._database.remove(key)
+        if self._key_index is not None:
+            self._key_index.remove(key)
+
+    def counts(self, value: Any) -> int:
+        """
+        Подсчитать количество ключей с указанным значением value.
+        Сложность - O(1), используется счётчик ссылок словаря значений.
+        :param value:
+        :return:
+        """
+        logger.debug('counts. Поиск сколько раз %s встречается в базе данных.', value)
+        if self._expiry.deadlines:
+            self.expire_due()
+        return self._database.dictionary.count(value)
+
+    def iter_find(self, value: Any) -> Iterator[str]:
+        """
+        Лениво перебрать ключи, содержащие значение value.
+        Сложность - O(n), сравниваются идентификаторы значений, а не строки.
+        :param value:
+        :return:
+        """
+        logger.debug('find. Поиск всех ключей для значения %s.', value)
+        if self._expiry.deadlines:
+            self.expire_due()
+        return self._database.keys_with(value)
+
+    def counts_between(self, low: Number, high: Number) -> int:
+        """
+        Подсчитать ключи с числовыми значениями от low до high включительно.
+        Сложность - O(d), где d - количество различных значений: просматривается словарь значений,
+        ключи считаются по счётчикам ссылок.
+        :param low:
+        :param high:
+        :return:
+        """
+        logger.debug('counts_between. Подсчёт ключей со значениями от %s до %s.', low, high)
+        if self._expiry.deadlines:
+            self.expire_due()
+        dictionary = self._database.dictionary
+        return sum(dictionary.count(value) for _, value in self._values_between(low, high))
+
+    def iter_find_between(self, low: Number, high: Number) -> Iterator[str]:
+        """
+        Лениво перебрать ключи с числовыми значениями от low до high по возрастанию значений.
+        Сложность - O(n + d log d): ключи раскладываются по идентификаторам подходящих значений.
+        :param low:
+        :param high:
+        :return:
+        """
+        logger.debug('find_between. Поиск ключей со значениями от %s до %s.', low, high)
+        if self._expiry.deadlines:
+            self.expire_due()
+        value_ids = self._database.dictionary.value_ids
+        buckets: Dict[int, List[str]] = {value_ids[value]: [] for _, value in self._values_between(low, high)}
+        if buckets:
+            for key, value_id in self._database.codes.items():
+                bucket = buckets.get(value_id)
+                if bucket is not None:
+                    bucket.append(key)
+        for keys in buckets.values():
+            yield from keys
+
+    def _values_between(self, low: Number, high: Number) -> List[Tuple[Number, Any]]:
+        # Различные значения из диапазона в порядке возрастания чисел.
+        values = []
+        for value in self._database.dictionary.value_ids:
+            number = parse_number(value)
+            if number is not None and low <= number <= high:
+                values.append((number, value))
+        values.sort()
+        return values
+
+    def find_page(self, value: Any, cursor: Optional[str] = None,
+                  count: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Страница ключей со значением value после cursor. Интерфейс совпадает с CustomDataBase.find_page.
+        Обратного индекса нет, поэтому ключи перебираются по упорядоченному индексу
+        со сравнением идентификаторов значений.
+        :param value:
+        :param cursor:
+        :param count:
+        :return:
+        """
+        logger.debug('find_page. Поиск %s ключей для значения %s после %s.', count, value, cursor)
+        codes = self._database.codes
+        value_id = self._database.dictionary.value_ids.get(value)
+        return self._scan_page(lambda key: codes[key] == value_id, cursor, count or self.KEYS_PAGE_SIZE)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats['value_index_values'] = 0
+        stats['value_dictionary_values'] = len(self._database.dictionary)
+        return stats
+
+    def memory_usage(self) -> Dict[str, int]:
+        encoded = self._database
+        dictionary = encoded.dictionary
+        keys = len(encoded)
+        total = (sys.getsizeof(encoded.codes) + self._sample_size(encoded.codes) * keys
+                 + sys.getsizeof(dictionary.values) + sys.getsizeof(dictionary.value_ids)
+                 + sys.getsizeof(dictionary.references)
+                 + sum(sys.getsizeof(value) + sys.getsizeof(value_id)
+                       for value, value_id in dictionary.value_ids.items()))
+        return self._memory_report(total, keys)
+
+    @staticmethod
+    def _sample_size(codes: Dict[str, int]) -> float:
+        sizes = []
+        for key in codes:
+            sizes.append(sys.getsizeof(key))
+            if len(sizes) >= CustomDataBase.MEMORY_SAMPLE_SIZE:
+                break
+        return sum(sizes) / len(sizes) if sizes else 0
@@ -0,0 +1,447 @@
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import heapq
+import logging
+import threading
+
+from constants import STATS_JSON_OPTION, Action, WrongInputException, WrongInputText
+from custom_database import LOAD_BATCH_SIZE, CustomDataBase
+from metrics import format_stats
+from ordered_index import Number, parse_number
+
+logger = logging.getLogger(__name__)
+
+# Количество полос блокировок по умолчанию.
+STRIPES = 64
+
+# Маркер удалённого в транзакции потока ключа.
+_DELETED = object()
+# Маркер в стеке сроков жизни: ключ изменён командой INCR, срок жизни сохраняется.
+_KEEP_TTL = object()
+
+
+class _ThreadTransactions(threading.local):
+    """
+    Стеки транзакций потока: у каждого потока свои, как у session.Session.
+    """
+
+    def __init__(self) -> None:
+        # Изменения транзакций: ключ -> новое значение или _DELETED.
+        self.transaction_stack: List[Dict[str, Any]] = []
+        # Сроки жизни ключей, записанных командой SET ... EX (или _KEEP_TTL).
+        self.ttl_stack: List[Dict[str, Any]] = []
+
+
+class ThreadSafeDataBase:
+    """
+    Потокобезопасная база данных для встраивания в многопоточные приложения.
+    Ключи распределяются по хешу между полосами (stripes): каждая полоса - отдельная
+    CustomDataBase со своей блокировкой, поэтому потоки, работающие с ключами разных полос,
+    не ждут друг друга. Команды над одним ключом блокируют одну полосу, COUNTS, FIND и SCAN -
+    все полосы по очереди.
+    Транзакции BEGIN/ROLLBACK/COMMIT принадлежат потоку: изменения копятся в стеке потока
+    и не видны другим потокам, ROLLBACK отбрасывает их без обращения к общим данным,
+    а COMMIT самой внешней транзакции применяет их, блокируя нужные полосы в порядке номеров.
+    GET зафиксированных данных вне транзакции выполняется без блокировки, если в полосе
+    нет сроков жизни ключей (чтение словаря атомарно); изменения многоключевого коммита
+    такие чтения могут увидеть не одновременно.
+    Интерфейс execute_command совпадает с CustomDataBase.execute_command.
+    >>>database = ThreadSafeDataBase()
+    >>>database.set('A', '5')
+    >>>threading.Thread(target=database.increment, args=('A', 1)).start()
+    """
+
+    def __init__(self, stripes: int = STRIPES) -> None:
+        self.stripes = [CustomDataBase() for _ in range(stripes)]
+        self.locks = [threading.Lock() for _ in range(stripes)]
+        self._local = _ThreadTransactions()
+
+    def _stripe(self, key: str) -> int:
+        return hash(key) % len(self.stripes)
+
+    @property
+    def transaction_stack(self) -> List[Dict[str, Any]]:
+        return self._local.transaction_stack
+
+    @property
+    def transaction_depth(self) -> int:
+        return len(self._local.transaction_stack)
+
+    def _locked(self, key: str, method: Callable, *arguments) -> Any:
+        number = self._stripe(key)
+        with self.locks[number]:
+            return method(self.stripes[number], key, *arguments)
+
+    def _each_stripe(self, method: Callable, *arguments) -> List[Any]:
+        results = []
+        for stripe, lock in zip(self.stripes, self.locks):
+            with lock:
+                results.append(method(stripe, *arguments))
+        return results
+
+    def _lookup(self, key: str) -> Any:
+        for changes in reversed(self._local.transaction_stack):
+            if key in changes:
+                return changes[key]
+        return self._committed(key)
+
+    def _committed(self, key: str) -> Any:
+        number = self._stripe(key)
+        stripe = self.stripes[number]
+        if stripe.plain_reads:
+            return stripe.database.get(key, _DELETED)
+        with self.locks[number]:
+            value = stripe.mget([key])[0]
+        return _DELETED if value is None else value
+
+    def _merged_changes(self) -> Dict[str, Any]:
+        merged = {}
+        for changes in self._local.transaction_stack:
+            merged.update(changes)
+        return merged
+
+    def get(self, key: str) -> Any:
+        value = self._lookup(key)
+        if value is _DELETED:
+            raise WrongInputException(Action.GET, key=key, message=WrongInputText.NULL.value)
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        local = self._local
+        if not local.transaction_stack:
+            self._locked(key, CustomDataBase.set, value, ttl)
+            return
+        local.transaction_stack[-1][key] = value
+        if ttl is None:
+            local.ttl_stack[-1].pop(key, None)
+        else:
+            local.ttl_stack[-1][key] = ttl
+
+    def unset(self, key: str) -> None:
+        local = self._local
+        if not local.transaction_stack:
+            self._locked(key, CustomDataBase.unset)
+        elif self._lookup(key) is _DELETED:
+            raise WrongInputException(Action.UNSET, key=key,
+                                      message=f"Ошибка: Аргумент {key} отсутствует в базе данных.")
+        else:
+            local.transaction_stack[-1][key] = _DELETED
+            local.ttl_stack[-1].pop(key, None)
+
+    def increment(self, key: str, amount: int) -> int:
+        """
+        Атомарно увеличить целое значение ключа на amount. Вне транзакции выполняется
+        под блокировкой полосы ключа, поэтому одновременные INCR не теряют приращений.
+        :param key:
+        :param amount:
+        :return:
+        """
+        local = self._local
+        if not local.transaction_stack:
+            return self._locked(key, CustomDataBase.increment, amount)
+        value = self._lookup(key)
+        number = CustomDataBase._integer(key, None if value is _DELETED else value) + amount
+        ttl = _KEEP_TTL
+        for changes, ttls in zip(reversed(local.transaction_stack), reversed(local.ttl_stack)):
+            if key in changes:
+                ttl = ttls.get(key)
+                break
+        local.transaction_stack[-1][key] = str(number)
+        local.ttl_stack[-1][key] = ttl
+        return number
+
+    def mset(self, pairs: Sequence[Tuple[str, str]]) -> None:
+        """
+        Установить значения нескольких ключей. Вне транзакции изменения применяются атомарно
+        для команд, блокирующих полосы: полосы ключей блокируются все сразу в порядке номеров.
+        :param pairs:
+        :return:
+        """
+        local = self._local
+        if not local.transaction_stack:
+            self._apply(dict(pairs), {})
+            return
+        local.transaction_stack[-1].update(pairs)
+        ttls = local.ttl_stack[-1]
+        if ttls:
+            for key, _ in pairs:
+                ttls.pop(key, None)
+
+    def load(self, pairs: Iterable[Tuple[str, str]], batch_size: int = LOAD_BATCH_SIZE) -> int:
+        """
+        Массово загрузить пары (ключ, значение) методом CustomDataBase.load: пакет делится
+        по полосам, и каждая полоса загружает свою часть под своей блокировкой,
+        поэтому загрузка не атомарна - другие потоки видят её по частям.
+        В транзакции потока каждый пакет выполняется как mset.
+        Возвращает количество загруженных пар.
+        :param pairs:
+        :param batch_size:
+        :return:
+        """
+        loaded = 0
+        iterator = iter(pairs)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                break
+            if self._local.transaction_stack:
+                self.mset(batch)
+            else:
+                by_stripe: Dict[int, List[Tuple[str, str]]] = {}
+                for pair in batch:
+                    by_stripe.setdefault(self._stripe(pair[0]), []).append(pair)
+                for number, stripe_pairs in by_stripe.items():
+                    with self.locks[number]:
+                        self.stripes[number].load(stripe_pairs, batch_size)
+            loaded += len(batch)
+        return loaded
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        values = [self._lookup(key) for key in keys]
+        return [None if value is _DELETED else value for value in values]
+
+    def munset(self, keys: Sequence[str]) -> int:
+        local = self._local
+        present = [key for key in dict.fromkeys(keys) if self._lookup(key) is not _DELETED]
+        if not local.transaction_stack:
+            return self._apply(dict.fromkeys(present, _DELETED), {})
+        for key in present:
+            local.transaction_stack[-1][key] = _DELETED
+            local.ttl_stack[-1].pop(key, None)
+        return len(present)
+
+    def ttl(self, key: str) -> int:
+        return self._locked(key, CustomDataBase.ttl)
+
+    def counts(self, value: Any) -> int:
+        count = sum(self._each_stripe(CustomDataBase.counts, value))
+        for key, new_value in self._merged_changes().items():
+            count += (new_value == value) - (self._committed(key) == value)
+        return count
+
+    def find(self, value: Any) -> List[str]:
+        keys = []
+        for stripe_keys in self._each_stripe(CustomDataBase.find, value):
+            keys.extend(stripe_keys)
+        return self._visible(keys, lambda key, key_value: key_value == value)
+
+    def counts_between(self, low: Number, high: Number) -> int:
+        count = sum(self._each_stripe(CustomDataBase.counts_between, low, high))
+        for key in self._merged_changes():
+            count += self._in_range(self._lookup(key), low, high) - self._in_range(self._committed(key), low, high)
+        return count
+
+    def find_between(self, low: Number, high: Number) -> List[str]:
+        numbers = {}
+        for matches in self._each_stripe(CustomDataBase.numbers_between, low, high):
+            numbers.update((key, number) for number, key in matches)
+        for key, value in self._merged_changes().items():
+            numbers.pop(key, None)
+            if self._in_range(value, low, high):
+                numbers[key] = parse_number(value)
+        return sorted(numbers, key=numbers.get)
+
+    @staticmethod
+    def _in_range(value: Any, low: Number, high: Number) -> bool:
+        if value is _DELETED:
+            return False
+        number = parse_number(value)
+        return number is not None and low <= number <= high
+
+    def scan(self, prefix: str) -> List[str]:
+        keys = list(heapq.merge(*self._each_stripe(CustomDataBase.scan, prefix)))
+        return sorted(self._visible(keys, lambda key, value: key.startswith(prefix)))
+
+    def key_range(self, start: str, stop: str) -> List[str]:
+        keys = list(heapq.merge(*self._each_stripe(CustomDataBase.key_range, start, stop)))
+        return sorted(self._visible(keys, lambda key, value: start <= key <= stop))
+
+    def keys_page(self, cursor: Optional[str] = None, count: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Страница ключей после cursor, как CustomDataBase.keys_page: страницы полос
+        сливаются с учётом транзакции потока.
+        :param cursor:
+        :param count:
+        :return:
+        """
+        return self._merge_pages(CustomDataBase.keys_page, (), lambda key, value: True, cursor, count)
+
+    def find_page(self, value: Any, cursor: Optional[str] = None,
+                  count: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Страница ключей со значением value после cursor, собранная из страниц полос, как в keys_page.
+        :param value:
+        :param cursor:
+        :param count:
+        :return:
+        """
+        return self._merge_pages(CustomDataBase.find_page, (value,), lambda key, key_value: key_value == value,
+                                 cursor, count)
+
+    def _merge_pages(self, method: Callable, arguments: tuple, matches: Callable[[str, Any], bool],
+                     cursor: Optional[str], count: Optional[int]) -> Tuple[List[str], Optional[str]]:
+        # Изменённые транзакцией потока ключи могут выпасть из страниц полос, поэтому
+        # полосы возвращают на столько же ключей больше; из слияния берутся первые count.
+        count = count or CustomDataBase.KEYS_PAGE_SIZE
+        changes = self._merged_changes()
+        pages = self._each_stripe(method, *arguments, cursor, count + len(changes))
+        keys = self._visible(list(heapq.merge(*(keys for keys, _ in pages))), matches)
+        if changes:
+            keys = sorted(key for key in keys if cursor is None or key > cursor)
+        more = len(keys) > count or any(stripe_cursor is not None for _, stripe_cursor in pages)
+        keys = keys[:count]
+        return keys, (keys[-1] if more and keys else None)
+
+    def _visible(self, keys: List[str], matches: Callable[[str, Any], bool]) -> List[str]:
+        """
+        Поправить ключи зафиксированных данных с учётом транзакции потока: изменённые
+        в транзакции ключи остаются, только если их новое значение удовлетворяет matches.
+        :param keys:
+        :param matches:
+        :return:
+        """
+        changes = self._merged_changes()
+        if not changes:
+            return keys
+        result = [key for key in keys if key not in changes]
+        result.extend(key for key, value in changes.items() if value is not _DELETED and matches(key, value))
+        return result
+
+    def begin_transaction(self) -> None:
+        self._local.transaction_stack.append({})
+        self._local.ttl_stack.append({})
+
+    def rollback_transaction(self) -> None:
+        local = self._local
+        if not local.transaction_stack:
+            raise WrongInputException(Action.ROLLBACK, message=WrongInputText.NO_TRANSACTIONS_TO_ROLLBACK.value)
+        local.transaction_stack.pop()
+        local.ttl_stack.pop()
+
+    def commit_transaction(self) -> None:
+        """
+        Зафиксировать текущую транзакцию потока. Изменения вложенной транзакции переходят
+        в родительскую, изменения самой внешней применяются к общим данным.
+        :return:
+        """
+        local = self._local
+        if not local.transaction_stack:
+            raise WrongInputException(Action.COMMIT, message=WrongInputText.NO_TRANSACTIONS_TO_COMMIT.value)
+        changes = local.transaction_stack.pop()
+        ttls = local.ttl_stack.pop()
+        if local.transaction_stack:
+            local.transaction_stack[-1].update(changes)
+            parent_ttls = local.ttl_stack[-1]
+            for key in changes:
+                parent_ttls.pop(key, None)
+            parent_ttls.update(ttls)
+            return
+        self._apply(changes, ttls)
+
+    def _apply(self, changes: Dict[str, Any], ttls: Dict[str, Any]) -> int:
+        """
+        Применить изменения к полосам, заблокировав все нужные полосы в порядке номеров
+        (поэтому взаимоблокировки невозможны). Возвращает количество удалённых ключей.
+        :param changes:
+        :param ttls:
+        :return:
+        """
+        by_stripe: Dict[int, List[str]] = {}
+        for key in changes:
+            by_stripe.setdefault(self._stripe(key), []).append(key)
+        numbers = sorted(by_stripe)
+        for number in numbers:
+            self.locks[number].acquire()
+        removed = 0
+        try:
+            for number in numbers:
+                stripe = self.stripes[number]
+                keys = by_stripe[number]
+                # munset пропускает ключи, срок жизни которых истёк после чтения, поэтому
+                # удаление не прерывает коммит, уже изменивший другие полосы.
+                removed += stripe.munset([key for key in keys if changes[key] is _DELETED])
+                for key in keys:
+                    value = changes[key]
+                    if value is not _DELETED:
+                        ttl = ttls.get(key)
+                        if ttl is _KEEP_TTL:
+                            stripe.set(key, value, keep_ttl=True)
+                        else:
+                            stripe.set(key, value, ttl)
+        finally:
+            for number in reversed(numbers):
+                self.locks[number].release()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        stripe_stats = self._each_stripe(CustomDataBase.stats)
+        # Ключи с одним значением могут находиться в разных частях, поэтому различные
+        # значения объединяются, а не суммируются.
+        values = set()
+        self._each_stripe(lambda stripe: values.update(stripe.indexed_values()))
+        return {
+            'stripes'           : len(self.stripes),
+            'keys'              : sum(stats['keys'] for stats in stripe_stats),
+            'transaction_depth' : self.transaction_depth,
+            'journal_entries'   : sum(len(changes) for changes in self._local.transaction_stack),
+            'value_index_values': len(values),
+        }
+
+    def execute_command(self, command, key=None, value=None, ttl=None, arguments=()) -> Union[str, int, None]:
+        """
+        Выполнить одну команду в текущем потоке. Интерфейс совпадает с CustomDataBase.execute_command.
+        :param command:
+        :param key:
+        :param value:
+        :param ttl:
+        :param arguments:
+        :return:
+        """
+        if command is Action.SET:
+            self.set(key, value, ttl)
+            return
+        elif command is Action.GET:
+            return self.get(key)
+        elif command is Action.UNSET:
+            self.unset(key)
+            return
+        elif command is Action.MSET:
+            self.mset(arguments)
+            return
+        elif command is Action.MGET:
+            return CustomDataBase.format_values(self.mget(arguments))
+        elif command is Action.MUNSET:
+            return self.munset(arguments)
+        elif command is Action.INCR or command is Action.DECR or command is Action.INCRBY or command is Action.DECRBY:
+            return self.increment(key, value)
+        elif command is Action.TTL:
+            return self.ttl(key)
+        elif command is Action.COUNTS:
+            if value is None:
+                return self.counts_between(*arguments)
+            return self.counts(value)
+        elif command is Action.FIND and value is None:
+            return " ".join(self.find_between(*arguments))
+        elif command is Action.FIND and key is None and not arguments:
+            return " ".join(self.find(value))
+        elif command is Action.FIND:
+            return CustomDataBase.format_keys_page(*self.find_page(value, key, *arguments))
+        elif command is Action.KEYS:
+            return CustomDataBase.format_keys_page(*self.keys_page(key))
+        elif command is Action.SCAN:
+            return " ".join(self.scan(key))
+        elif command is Action.RANGE:
+            return " ".join(self.key_range(key, value))
+        elif command is Action.BEGIN:
+            self.begin_transaction()
+            return
+        elif command is Action.ROLLBACK:
+            self.rollback_transaction()
+            return
+        elif command is Action.COMMIT:
+            self.commit_transaction()
+            return
+        elif command is Action.STATS:
+            return format_stats(self.stats(), as_json=value == STATS_JSON_OPTION)
+
+        raise WrongInputException(message=WrongInputText.WRONG_INPUT_FORMAT.value)
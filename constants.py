@@ -15,6 +15,58 @@ class Action(Enum):
     ROLLBACK = 'ROLLBACK'
     COMMIT = 'COMMIT'
     HELP = 'HELP'
+    STATS = 'STATS'
+    MEMORY = 'MEMORY'
+    TTL = 'TTL'
+    MSET = 'MSET'
+    MGET = 'MGET'
+    MUNSET = 'MUNSET'
+    SCAN = 'SCAN'
+    RANGE = 'RANGE'
+    KEYS = 'KEYS'
+    SAVE = 'SAVE'
+    BGSAVE = 'BGSAVE'
+    WATCH = 'WATCH'
+    UNWATCH = 'UNWATCH'
+    MULTI = 'MULTI'
+    EXEC = 'EXEC'
+    DISCARD = 'DISCARD'
+    INCR = 'INCR'
+    DECR = 'DECR'
+    INCRBY = 'INCRBY'
+    DECRBY = 'DECRBY'
+    SLOWLOG = 'SLOWLOG'
+    PROFILE = 'PROFILE'
+
+# Синоним команды STATS.
+INFO_COMMAND = 'INFO'
+# Параметр команды STATS для вывода в формате JSON.
+STATS_JSON_OPTION = 'JSON'
+# Параметр команды SET со временем жизни ключа в секундах.
+EXPIRE_OPTION = 'EX'
+# Строка ответа KEYS и FIND ... LIMIT с курсором для запроса следующей страницы ключей.
+NEXT_CURSOR_TEXT = 'CURSOR {cursor}'
+# Параметры команды FIND: размер страницы и курсор, после которого она начинается.
+LIMIT_OPTION = 'LIMIT'
+CURSOR_OPTION = 'CURSOR'
+# Диапазон чисел в командах COUNTS и FIND: BETWEEN FROM AND TO.
+BETWEEN_OPTION = 'BETWEEN'
+AND_OPTION = 'AND'
+# Подкоманды SLOWLOG и PROFILE.
+SLOWLOG_GET = 'GET'
+SLOWLOG_LEN = 'LEN'
+SLOWLOG_RESET = 'RESET'
+PROFILE_START = 'START'
+PROFILE_STOP = 'STOP'
+# Ответ PROFILE STOP.
+PROFILE_SAVED_TEXT = 'Отчёт профилировщика записан в {path}, команд: {commands}.'
+# Ответы команд SAVE и BGSAVE.
+SAVED_TEXT = 'Снимок записан, ключей: {keys}.'
+BACKGROUND_SAVE_TEXT = 'Запись снимка начата в фоновом процессе.'
+# Ответ на команду, поставленную в очередь MULTI.
+QUEUED_TEXT = 'QUEUED'
+# Результат команды из очереди EXEC, которая ничего не возвращает.
+OK_TEXT = 'OK'
 
 
 class WrongInputException(Exception):
@@ -38,23 +90,89 @@ class WrongInputText(Enum):
     NULL = "NULL"
     NO_TRANSACTIONS_TO_ROLLBACK = "Ошибка: Нет активных транзакций для отмены."
     NO_TRANSACTIONS_TO_COMMIT = "Ошибка: Нет активных транзакций для коммита."
+    WRONG_EXPIRE_TIME = "Ошибка: Время жизни ключа должно быть целым положительным числом секунд."
+    WRONG_LIMIT = "Ошибка: LIMIT должен быть целым положительным числом."
+    WRONG_INCREMENT = "Ошибка: Приращение должно быть целым числом."
+    WRONG_RANGE = "Ошибка: Границы BETWEEN должны быть числами."
+    NOT_AN_INTEGER = "Ошибка: Значение переменной не является целым числом."
+    NO_STORAGE = "Ошибка: Снимки доступны только при запуске с параметром --data-dir."
+    SAVE_IN_PROGRESS = "Ошибка: Снимок уже записывается в фоновом режиме."
+    READ_ONLY_REPLICA = "Ошибка: Реплика доступна только для чтения, изменяйте данные на ведущем сервере."
+    SAVE_FAILED = "Ошибка: Не удалось записать снимок, подробности в app.log."
+    TRANSACTION_CONFLICT = "Ошибка: Конфликт транзакций, другой клиент изменил ключи: {keys}. Транзакция отменена."
+    NO_MULTI = "Ошибка: Очередь команд не начата, сначала введите MULTI."
+    NOT_ALLOWED_IN_MULTI = "Ошибка: Команда {command} недоступна после MULTI."
+    WATCHED_KEYS_CHANGED = "Ошибка: Отслеживаемые ключи изменены: {keys}. Очередь команд отменена."
+    PROFILE_RUNNING = "Ошибка: Профилирование уже запущено."
+    PROFILE_NOT_RUNNING = "Ошибка: Профилирование не запущено, сначала введите PROFILE START."
+    PROFILE_REPORT_FAILED = "Ошибка: Не удалось записать отчёт профилировщика: {error}."
+    PROFILE_WRONG_FILE = "Ошибка: Для отчёта профилировщика укажите имя файла без каталогов."
 
 
 HELP_TEXT = """
     Данное приложение представляет собой базу данных, способную сохранять аргументы со значениями,
     получать информацию о существующих значениях.
-    Есть поддержка транзакций. Работа ведётся только в оперативной памяти, сохранения
-    на жёстком диске или в иные форматы данных не предусмотрено.
+    Есть поддержка транзакций. По умолчанию работа ведётся только в оперативной памяти.
+    При запуске с параметром --data-dir зафиксированные изменения сохраняются
+    в журнал предзаписи и снимки в указанном каталоге и восстанавливаются при запуске.
+    Сервер, запущенный с параметром --replicaof, работает репликой ведущего сервера
+    и выполняет только команды чтения.
     Команды:
             SET ARGUMENT VALUE - сохранить значение в базе данных.
+            SET ARGUMENT VALUE EX SECONDS - сохранить значение, которое будет удалено через SECONDS секунд.
+            MSET ARGUMENT VALUE [ARGUMENT VALUE ...] - сохранить несколько значений одной командой.
+            MGET ARGUMENT [ARGUMENT ...] - получить значения нескольких переменных (NULL для отсутствующих).
+            MUNSET ARGUMENT [ARGUMENT ...] - удалить несколько переменных, вывести количество удалённых.
+            TTL ARGUMENT - оставшееся время жизни переменной в секундах, -1 если срок не задан,
+                           -2 если переменной нет.
             GET ARGUMENT  - получить, ранее сохраненную переменную. Если такой переменной
                             не было сохранено, возвращает NULL.
             UNSET ARGUMENT  - удаление ранее установленной переменной. Если значение не было
                               установлено, не делает ничего.
             COUNTS ARGUMENT - показать сколько раз данные значение встречается в базе данных.
+            COUNTS BETWEEN FROM AND TO - показать сколько переменных имеют числовые значения от FROM до TO.
+            FIND BETWEEN FROM AND TO - вывести переменные с числовыми значениями от FROM до TO
+                                       по возрастанию значений.
+            INCR ARGUMENT, DECR ARGUMENT - увеличить или уменьшить целое значение переменной на 1
+                                           и вывести результат. Отсутствующая переменная считается равной 0.
+            INCRBY ARGUMENT N, DECRBY ARGUMENT N - увеличить или уменьшить значение на целое N.
             FIND ARGUMENT - вывести найденные установленные переменные для данного значения.
+            FIND ARGUMENT LIMIT N [CURSOR NAME] - вывести по возрастанию имён не больше N переменных
+                           с данным значением (после NAME, если указан). Если переменные ещё есть,
+                           вторая строка ответа - CURSOR <имя>, следующая страница:
+                           FIND ARGUMENT LIMIT N CURSOR <имя>.
+            SCAN PREFIX - вывести по возрастанию переменные, имена которых начинаются с PREFIX.
+            RANGE FROM TO - вывести по возрастанию переменные с именами от FROM до TO включительно.
+            KEYS [CURSOR] - вывести страницу переменных по возрастанию имён. Если переменные ещё есть,
+                            вторая строка ответа - CURSOR <имя>, следующая страница: KEYS <имя>.
             END - закрыть приложение.
     Поддержка транзакций:
             BEGIN - начать транзакцию.
             ROLLBACK - откатить текущую (самой внутреннюю) транзакцию
-            COMMIT - зафиксировать изменения текущей (самой внутренней) транзакции"""
+            COMMIT - зафиксировать изменения текущей (самой внутренней) транзакции
+    Оптимистичные транзакции:
+            WATCH ARGUMENT [ARGUMENT ...] - отслеживать изменения переменных до EXEC.
+            UNWATCH - перестать отслеживать переменные.
+            MULTI - начать очередь команд: команды не выполняются, а отвечают QUEUED.
+            EXEC - выполнить очередь одним пакетом и вывести результаты команд по строке на команду.
+                   Если отслеживаемые переменные изменились после WATCH, очередь отменяется.
+            DISCARD - отбросить очередь команд.
+    Статистика:
+            STATS (или INFO) - показать количество ключей, глубину транзакций, размеры индексов
+                               и, если приложение запущено с параметром --metrics, количество вызовов
+                               и задержки (p50/p99) каждой команды.
+            STATS JSON - то же самое в формате JSON.
+            MEMORY - оценка занимаемой данными памяти и количества байт на ключ.
+    Диагностика:
+            SLOWLOG GET [N] - последние N (по умолчанию все) команд, выполнявшихся дольше порога
+                              --slowlog-threshold микросекунд: номер, время, длительность,
+                              глубина транзакций и команда с аргументами.
+            SLOWLOG LEN - количество записей в журнале медленных команд.
+            SLOWLOG RESET - очистить журнал медленных команд.
+            PROFILE START - начать профилирование разбора и выполнения команд (cProfile).
+            PROFILE STOP [FILE] - закончить профилирование и записать отчёт в файл FILE каталога profiles
+                (по умолчанию profile.txt).
+    Снимки (при запуске с параметром --data-dir):
+            SAVE - записать снимок зафиксированных данных, приостановив выполнение команд.
+            BGSAVE - записать снимок в фоновом процессе, не приостанавливая выполнение команд.
+                     Ход и длительность записи показывает STATS (bgsave_progress, last_save_duration_ms)."""
@@ -1,10 +1,76 @@
-from typing import Any, List, Union
+from itertools import islice
+from time import monotonic, perf_counter_ns, time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+import heapq
 import logging
+import math
+import sys
 
-from constants import Action, WrongInputException, WrongInputText
+from constants import (BACKGROUND_SAVE_TEXT, NEXT_CURSOR_TEXT, OK_TEXT, PROFILE_START, SAVED_TEXT,
+                       STATS_JSON_OPTION, Action, WrongInputException, WrongInputText)
+from eviction import EVICTION_POLICIES, EvictionPolicy
+from expiry import ExpiryHeap
+from metrics import Metrics, format_stats
+from optimistic import KeyVersions, OptimisticTransaction
+from ordered_index import Number, NumericIndex, SortedKeys, parse_number
+from profiling import CommandProfiler, SlowLog, execute_slowlog, stop_profile
 
 logger = logging.getLogger(__name__)
 
+# Маркер отсутствующего значения, чтобы отличать его от любого сохранённого значения.
+_MISSING = object()
+
+# Зафиксированное изменение ключа: (ключ, старое значение, новое значение), None - ключа нет.
+Change = Tuple[str, Optional[Any], Optional[Any]]
+
+# Количество ключей в одном фрагменте потокового вывода FIND.
+STREAM_CHUNK_KEYS = 1000
+
+# Количество пар (ключ, значение) в одном пакете массовой загрузки load.
+LOAD_BATCH_SIZE = 100000
+# Количество значений пакета, по которым load выбирает способ построения обратного индекса.
+LOAD_SAMPLE_SIZE = 1000
+
+
+def group_by_value(items: Iterable[Tuple[str, Any]]) -> Iterable[Tuple[Any, List[str]]]:
+    """
+    Сгруппировать пары (ключ, значение) по значениям: вернуть пары (значение, ключи).
+    :param items:
+    :return:
+    """
+    groups: Dict[Any, List[str]] = {}
+    for key, value in items:
+        keys = groups.get(value)
+        if keys is None:
+            groups[value] = [key]
+        else:
+            keys.append(key)
+    return groups.items()
+
+
+def page_after(keys: Iterable[str], cursor: Optional[str], count: int) -> Tuple[List[str], Optional[str]]:
+    """
+    Выбрать из неупорядоченных ключей keys страницу из count наименьших ключей, больших cursor,
+    и курсор следующей страницы (None, если ключей больше нет).
+    Сложность - O(k log count), в памяти держится только страница.
+    :param keys:
+    :param cursor:
+    :param count:
+    :return:
+    """
+    if cursor is not None:
+        keys = (key for key in keys if key > cursor)
+    return split_page(heapq.nsmallest(count + 1, keys), count)
+
+
+def split_page(keys: List[str], count: int) -> Tuple[List[str], Optional[str]]:
+    # keys - до count + 1 ключей по возрастанию: лишний ключ означает, что есть следующая страница.
+    if len(keys) > count:
+        del keys[count:]
+        return keys, keys[-1]
+    return keys, None
+
+
 class CustomDataBase:
     """
     Класс - простейшая база данных. Предназначена для хранения и манипуляций с простейшими данными.
@@ -15,12 +81,596 @@ class CustomDataBase:
     Больше примеров использования можно найти в модуле tests.py
     """
 
+    # Количество ключей, по которым оценивается средний размер записи в memory_usage.
+    MEMORY_SAMPLE_SIZE = 1000
+
+    # Сколько истёкших ключей удаляется перед каждой командой execute_command.
+    ACTIVE_EXPIRE_LIMIT = 20
+
+    # Количество ключей на странице ответа KEYS.
+    KEYS_PAGE_SIZE = 100
 
+    # Данные хранятся в памяти процесса, поэтому дочерний процесс, созданный fork,
+    # видит их неизменными на момент fork (copy-on-write) и может записать снимок в фоне.
+    FORK_SNAPSHOTS = True
+    # load в пустую базу данных собирает все пары в словарь в памяти и строит индекс один раз.
+    LOAD_IN_MEMORY = True
 
     def __init__(self) -> None:
         logger.debug('Создание новой базы данных.')
+        # Обратный индекс: значение -> ключи с этим значением.
+        # Вложенный dict используется как упорядоченное множество ключей.
+        self._value_index: Dict[Any, Dict[str, None]] = {}
+        # Упорядоченный индекс ключей для SCAN/RANGE/KEYS. Строится при первом
+        # таком запросе, после чего поддерживается при каждом изменении набора ключей.
+        self._key_index: Optional[SortedKeys] = None
+        # Различные числовые значения по возрастанию для COUNTS/FIND BETWEEN.
+        # Как и индекс ключей, строится при первом запросе и дальше поддерживается.
+        self._numeric_index: Optional[NumericIndex] = None
+        # Бюджет памяти и политика вытеснения. None - объём данных не ограничен.
+        self.eviction: Optional[EvictionPolicy] = None
+        # Сроки жизни ключей (по часам clock) и счётчик удалённых по сроку ключей.
+        self._expiry = ExpiryHeap()
+        self.clock: Callable[[], float] = monotonic
+        self.expired_keys = 0
         self.database = {}
-        self.transaction_stack = []
+        # Стек журналов отката: для каждой открытой транзакции хранится
+        # словарь "ключ -> значение до первого изменения в транзакции"
+        # (_MISSING, если ключа не было).
+        self.transaction_stack: List[Dict[str, Any]] = []
+        # Параллельный стек журналов сроков жизни: "ключ -> срок до первого изменения
+        # в транзакции" (None, если срока не было).
+        self._expiry_journals: List[Dict[str, Optional[float]]] = []
+        # Подписчики на зафиксированные изменения (например, журнал предзаписи).
+        # Получают список троек (ключ, старое значение, новое значение),
+        # где None означает отсутствие ключа.
+        self._commit_listeners: List[Callable[[List[Change]], None]] = []
+        # Счётчики и гистограммы задержек команд. None - инструментирование выключено.
+        self.metrics: Optional[Metrics] = None
+        # Журнал медленных команд. Команды замеряют main.py и server.py вместе с разбором строки.
+        self.slowlog = SlowLog()
+        # Профилировщик команд между PROFILE START и PROFILE STOP. None - профилирование выключено.
+        self.profiler: Optional[CommandProfiler] = None
+        # Долговременное хранение (persistence.PersistentStorage), через которое выполняются
+        # команды SAVE и BGSAVE. None - данные хранятся только в оперативной памяти.
+        self.storage = None
+        # Сторона репликации (replication.ReplicationLeader или ReplicationFollower),
+        # показатели которой выводит STATS. None - репликация не используется.
+        self.replication = None
+        # Версии ключей, отслеживаемых командой WATCH. Создаются при первом WATCH.
+        self._key_versions: Optional[KeyVersions] = None
+        # Состояние WATCH/MULTI клиента, работающего с базой данных напрямую (main.py).
+        self.optimistic = OptimisticTransaction(self)
+
+    @property
+    def database(self) -> Dict[str, Any]:
+        """
+        Словарь с данными базы. Изменять его следует только через методы класса,
+        иначе индексы разойдутся с данными.
+        :return:
+        """
+        return self._database
+
+    @database.setter
+    def database(self, database: Dict[str, Any]) -> None:
+        # Журналы открытых транзакций ссылаются на старые данные,
+        # поэтому заменять словарь целиком следует вне транзакций.
+        self._database = database
+        self._rebuild_indexes()
+        self._data_replaced()
+
+    def _data_replaced(self) -> None:
+        # Сброс производных структур после замены данных целиком.
+        self._key_index = None
+        self._numeric_index = None
+        self._expiry = ExpiryHeap()
+        if self.eviction is not None:
+            self.eviction.reset(self._database.items())
+            self._evict()
+
+    def load_grouped(self, groups: Iterable[Tuple[Any, Sequence[str]]]) -> None:
+        """
+        Заменить данные базы ключами, сгруппированными по значениям: пары (значение, ключи),
+        каждый ключ встречается один раз. Словарь данных и обратный индекс строятся
+        целыми группами (dict.fromkeys), без вставки и индексации по одному ключу.
+        Используется при загрузке снимков. Сложность - O(n).
+        :param groups:
+        :return:
+        """
+        data = {}
+        value_index = {}
+        for value, keys in groups:
+            data.update(dict.fromkeys(keys, value))
+            value_index[value] = dict.fromkeys(keys)
+        self._database = data
+        self._value_index = value_index
+        self._data_replaced()
+
+    def load(self, pairs: Iterable[Tuple[str, Any]], batch_size: int = LOAD_BATCH_SIZE) -> int:
+        """
+        Массово загрузить пары (ключ, значение) из любого итерируемого источника, дополняя данные.
+        Существующие ключи перезаписываются, как SET (срок жизни снимается), из повторяющихся
+        ключей остаётся последнее значение. Пары читаются пакетами по batch_size, журналируется
+        один раз на пакет, упорядоченный и числовой индексы строятся заново при первом запросе.
+        В пустую базу данных пакеты добавляются в словарь данных целиком (dict.update),
+        а обратный индекс строится один раз после загрузки; в непустую - каждый пакет
+        добавляется в словарь и индекс сразу.
+        Если есть подписчики на коммиты (журнал предзаписи, репликация, WATCH), открыта
+        транзакция или включено вытеснение, каждый пакет выполняется как mset.
+        Возвращает количество загруженных пар.
+        >>>database.load((f'key{i}', str(i)) for i in range(1000000))
+        1000000
+        :param pairs:
+        :param batch_size:
+        :return:
+        """
+        batches = iter(lambda: list(islice(iterator, batch_size)), [])
+        iterator = iter(pairs)
+        loaded = 0
+        if self._commit_listeners or self.transaction_stack or self.eviction is not None:
+            for batch in batches:
+                self.mset(batch)
+                loaded += len(batch)
+                logger.debug('load. Загружен пакет из %s пар, всего %s.', len(batch), loaded)
+            return loaded
+        if self.LOAD_IN_MEMORY and not self._database:
+            items: Dict[str, Any] = {}
+            for batch in batches:
+                items.update(batch)
+                loaded += len(batch)
+                logger.debug('load. Прочитан пакет из %s пар, всего %s.', len(batch), loaded)
+            self._load_all(items)
+            return loaded
+        for batch in batches:
+            items = dict(batch)
+            if self._expiry.deadlines:
+                for key in self._expiry.deadlines.keys() & items.keys():
+                    self._expiry.discard(key)
+            self._load_items(items)
+            self._key_index = None
+            self._numeric_index = None
+            loaded += len(batch)
+            logger.debug('load. Загружен пакет из %s пар, всего %s.', len(batch), loaded)
+        return loaded
+
+    def _load_all(self, items: Dict[str, Any]) -> None:
+        """
+        Заменить данные пустой базы данных словарём items и построить обратный индекс.
+        :param items:
+        :return:
+        """
+        self._database = items
+        self._value_index = {}
+        self._index_items(items)
+        self._data_replaced()
+
+    def _load_items(self, items: Dict[str, Any]) -> None:
+        """
+        Добавить к данным пакет "ключ -> значение". Старые значения перезаписываемых ключей
+        удаляются из обратного индекса по одному, новые добавляются методом _index_items.
+        :param items:
+        :return:
+        """
+        data = self._database
+        for key in data.keys() & items.keys():
+            self._unindex(key, data[key])
+        data.update(items)
+        self._index_items(items)
+
+    def _index_items(self, items: Dict[str, Any]) -> None:
+        """
+        Добавить ключи items в обратный индекс: группами по значениям (dict.fromkeys),
+        если по первым LOAD_SAMPLE_SIZE значениям повторы есть, и по одному иначе.
+        :param items:
+        :return:
+        """
+        value_index = self._value_index
+        if len(set(islice(items.values(), LOAD_SAMPLE_SIZE))) * 2 > min(len(items), LOAD_SAMPLE_SIZE):
+            # Значения почти все различны: группировка только добавила бы списки.
+            for key, value in items.items():
+                index = value_index.get(value)
+                if index is None:
+                    value_index[value] = {key: None}
+                else:
+                    index[key] = None
+            return
+        for value, keys in group_by_value(items.items()):
+            index = value_index.get(value)
+            if index is None:
+                value_index[value] = dict.fromkeys(keys)
+            else:
+                index.update(dict.fromkeys(keys))
+
+    def _rebuild_indexes(self) -> None:
+        """
+        Полностью перестроить индексы по текущему содержимому базы данных.
+        Сложность - O(n)
+        :return:
+        """
+        value_index = {}
+        for key, value in self._database.items():
+            value_index.setdefault(value, {})[key] = None
+        self._value_index = value_index
+
+    def _store(self, key: str, value: Any) -> None:
+        """
+        Записать значение в базу данных, поддерживая индексы в актуальном состоянии.
+        :param key:
+        :param value:
+        :return:
+        """
+        old_value = self._database.get(key, _MISSING)
+        if old_value is not _MISSING:
+            if old_value == value:
+                self._database[key] = value
+                return
+            self._unindex(key, old_value)
+        elif self._key_index is not None:
+            self._key_index.add(key)
+        self._database[key] = value
+        keys = self._value_index.get(value)
+        if keys is None:
+            self._value_index[value] = keys = {}
+            if self._numeric_index is not None:
+                self._numeric_index.add(value)
+        keys[key] = None
+
+    def _discard(self, key: str) -> None:
+        """
+        Удалить существующий ключ из базы данных и из индексов.
+        :param key:
+        :return:
+        """
+        self._unindex(key, self._database.pop(key))
+        if self._key_index is not None:
+            self._key_index.remove(key)
+
+    def add_commit_listener(self, listener: Callable[[List[Change]], None]) -> None:
+        """
+        Подписаться на зафиксированные изменения базы данных.
+        Изменения внутри транзакций передаются подписчику только после
+        коммита самой внешней транзакции, откатанные изменения не передаются никогда.
+        :param listener:
+        :return:
+        """
+        self._commit_listeners.append(listener)
+
+    def _notify_commit(self, changes: List[Change]) -> None:
+        for listener in self._commit_listeners:
+            listener(changes)
+
+    def committed_items(self) -> Dict[str, Any]:
+        """
+        Вернуть копию зафиксированного состояния базы данных,
+        то есть данных без изменений открытых транзакций.
+        Сложность - O(n + m), где m - суммарный размер журналов открытых транзакций.
+        :return:
+        """
+        committed = self._database.copy()
+        self._restore_committed(committed.__setitem__, lambda key: committed.pop(key, None))
+        return committed
+
+    def committed_copy(self) -> Mapping[str, Any]:
+        """
+        Копия зафиксированного состояния, которую можно читать в другом потоке, пока база данных
+        изменяется. Используется для фоновой записи снимка без fork (FORK_SNAPSHOTS).
+        Базовая реализация - committed_items, копия данных в памяти.
+        :return:
+        """
+        return self.committed_items()
+
+    def _restore_committed(self, assign: Callable[[str, Any], None], remove: Callable[[str], None]) -> None:
+        # Вернуть в копию данных значения ключей, изменённых открытыми транзакциями:
+        # assign(key, value) записывает прежнее значение, remove(key) удаляет ключ, которого не было.
+        for key, old_value in self._committed_values().items():
+            if old_value is _MISSING:
+                remove(key)
+            else:
+                assign(key, old_value)
+
+    def iter_committed(self) -> Iterator[Tuple[str, Any]]:
+        """
+        Перебрать пары (ключ, значение) зафиксированного состояния без копирования данных.
+        Используется для записи снимков: в дочернем процессе после fork перебор
+        не изменяет данные, поэтому страницы памяти остаются общими с родителем.
+        Сложность - O(n + m).
+        :return:
+        """
+        committed = self._committed_values()
+        for key, value in self._database.items():
+            if key not in committed:
+                yield key, value
+        for key, value in committed.items():
+            if value is not _MISSING:
+                yield key, value
+
+    def committed_groups(self) -> Iterable[Tuple[Any, Iterable[str]]]:
+        """
+        Зафиксированное состояние, сгруппированное по значениям: пары (значение, ключи).
+        Вне транзакций группами служит обратный индекс значений, без обхода данных.
+        :return:
+        """
+        if self.transaction_stack:
+            return group_by_value(self.iter_committed())
+        return self._value_index.items()
+
+    def expire_at(self, key: str) -> Optional[float]:
+        """
+        Момент истечения срока жизни ключа по системным часам (time.time())
+        или None, если срок не задан. Так срок записывается на диск и передаётся репликам:
+        часы clock монотонные и между процессами не сопоставимы.
+        :param key:
+        :return:
+        """
+        deadline = self._expiry.get(key)
+        if deadline is None:
+            return None
+        return time() + deadline - self.clock()
+
+    def committed_expires(self) -> Dict[str, float]:
+        """
+        Моменты истечения (time.time()) сроков жизни ключей зафиксированного состояния.
+        Сроки, изменённые открытыми транзакциями, берутся из журналов сроков.
+        :return:
+        """
+        deadlines = self._expiry.deadlines
+        if self._expiry_journals:
+            deadlines = dict(deadlines)
+            for journal in reversed(self._expiry_journals):
+                deadlines.update(journal)
+        offset = time() - self.clock()
+        return {key: deadline + offset for key, deadline in deadlines.items() if deadline is not None}
+
+    def restore(self, records: Iterable[Tuple[str, Any, Optional[float]]]) -> int:
+        """
+        Установить значения ключей с моментами истечения сроков жизни по системным часам
+        (None - без срока) одним коммитом, как mset. Ключи, срок которых уже истёк,
+        не записываются, а существующие удаляются. Используется при восстановлении данных
+        с диска и при репликации. Возвращает количество ключей с истёкшим сроком.
+        >>>database.restore([('A', '5', None), ('session', 'x', time.time() + 60)])
+        0
+        :param records: тройки (ключ, значение, момент истечения).
+        :return:
+        """
+        logger.debug('restore. Восстановление значений и сроков жизни ключей.')
+        batch = bool(self._commit_listeners) and not self.transaction_stack
+        if batch:
+            self.begin_transaction()
+        now = time()
+        expired = []
+        set_ = self._set
+        for key, value, expire_at in records:
+            if expire_at is None:
+                set_(key, value)
+            elif expire_at > now:
+                set_(key, value, expire_at - now)
+            else:
+                expired.append(key)
+        for key in expired:
+            if key in self._database:
+                self._remove(key)
+        if batch:
+            self.commit_transaction()
+            if self.eviction is not None and self.eviction.over_limit():
+                self._evict()
+        if expired:
+            logger.info('restore. Пропущено ключей с истёкшим сроком жизни: %s.', len(expired))
+        return len(expired)
+
+    def key_versions(self) -> KeyVersions:
+        """
+        Версии ключей для команды WATCH, общие для всех клиентов базы данных.
+        :return:
+        """
+        if self._key_versions is None:
+            self._key_versions = KeyVersions(self)
+        return self._key_versions
+
+    def _committed_values(self) -> Dict[str, Any]:
+        # Значения ключей из журналов открытых транзакций до начала самой внешней из них.
+        committed = {}
+        for journal in reversed(self.transaction_stack):
+            committed.update(journal)
+        return committed
+
+    def enable_metrics(self) -> None:
+        """
+        Включить подсчёт вызовов и задержек команд в execute_command.
+        :return:
+        """
+        if self.metrics is None:
+            self.metrics = Metrics()
+
+    @property
+    def transaction_depth(self) -> int:
+        return len(self.transaction_stack)
+
+    @property
+    def plain_reads(self) -> bool:
+        """
+        True, если чтение ключа не изменяет состояние базы данных: нет ключей со сроком жизни
+        и вытеснения. Тогда значения можно читать из database без блокировок (concurrent_database).
+        :return:
+        """
+        return not self._expiry.deadlines and self.eviction is None
+
+    def start_profile(self) -> None:
+        """
+        Начать профилирование разбора и выполнения команд (PROFILE START).
+        :return:
+        """
+        if self.profiler is not None:
+            raise WrongInputException(Action.PROFILE, message=WrongInputText.PROFILE_RUNNING.value)
+        logger.info('Профилирование команд начато.')
+        self.profiler = CommandProfiler()
+
+    def stop_profile(self, name: Optional[str] = None) -> str:
+        """
+        Закончить профилирование (PROFILE STOP) и записать отчёт в файл name каталога
+        profiling.PROFILE_DIR. Если отчёт записать не удалось, профилирование продолжается.
+        :param name: имя файла без каталогов.
+        :return:
+        """
+        reply = stop_profile(self.profiler, name)
+        self.profiler = None
+        return reply
+
+    def enable_eviction(self, max_memory: int, policy: str = 'lru') -> None:
+        """
+        Ограничить оценку занимаемой данными памяти значением max_memory байт.
+        При превышении бюджета ключи вытесняются (удаляются) по политике policy:
+        'lru', 'lfu' или 'random'. Ключи, изменённые в открытых транзакциях, не вытесняются.
+        Сложность - O(n) на учёт существующих ключей.
+        :param max_memory:
+        :param policy:
+        :return:
+        """
+        self.eviction = EVICTION_POLICIES[policy](max_memory)
+        self.eviction.reset(self._database.items())
+        self._evict()
+
+    def _pinned(self, key: str) -> bool:
+        return any(key in journal for journal in self.transaction_stack)
+
+    def _evict(self, protected: Optional[str] = None) -> None:
+        """
+        Вытеснять ключи, пока занятая память превышает бюджет.
+        Вытеснение - зафиксированное удаление, не отменяемое ROLLBACK, поэтому ключи
+        из журналов открытых транзакций и только что записанный ключ protected пропускаются.
+        :param protected:
+        :return:
+        """
+        eviction = self.eviction
+        while eviction.over_limit():
+            for key in eviction.candidates():
+                if key != protected and not self._pinned(key):
+                    break
+            else:
+                logger.warning('Бюджет памяти превышен, но все ключи используются открытыми транзакциями.')
+                return
+            value = self._database[key]
+            logger.debug('Вытеснение ключа %s (политика %s).', key, eviction.name)
+            eviction.removed(key, value)
+            eviction.evicted_keys += 1
+            self._expiry.discard(key)
+            self._discard(key)
+            if self._commit_listeners:
+                self._notify_commit([(key, value, None)])
+
+    def indexed_values(self) -> Iterable[Any]:
+        """
+        Различные значения обратного индекса значений (value_index_values в stats).
+        :return:
+        """
+        return self._value_index.keys()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Вернуть статистику базы данных: размеры данных, индексов и транзакций,
+        а при включённом инструментировании - сводку по командам.
+        :return:
+        """
+        stats = {
+            'keys'              : len(self._database),
+            'transaction_depth' : len(self.transaction_stack),
+            'journal_entries'   : sum(len(journal) for journal in self.transaction_stack),
+            'value_index_values': len(self._value_index),
+        }
+        if self._expiry.deadlines or self.expired_keys:
+            stats['expires'] = len(self._expiry)
+            stats['expired_keys'] = self.expired_keys
+        if self.eviction is not None:
+            stats.update(self.eviction.stats())
+        if self.storage is not None:
+            stats.update(self.storage.stats())
+        if self.replication is not None:
+            stats.update(self.replication.stats())
+        if self._key_versions is not None:
+            stats['watched_keys'] = len(self._key_versions)
+        if self.metrics is not None:
+            stats['commands'] = self.metrics.commands()
+        return stats
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Оценить объём памяти, занимаемый данными и индексами.
+        Размер контейнеров считается точно, размер ключей и значений - по выборке
+        из MEMORY_SAMPLE_SIZE записей.
+        :return:
+        """
+        keys = len(self._database)
+        sizes = []
+        for key, value in self._database.items():
+            sizes.append(sys.getsizeof(key) + sys.getsizeof(value))
+            if len(sizes) >= self.MEMORY_SAMPLE_SIZE:
+                break
+        entries = sum(sizes) / len(sizes) * keys if sizes else 0
+        index = sys.getsizeof(self._value_index) + sum(sys.getsizeof(keys_with_value)
+                                                       for keys_with_value in self._value_index.values())
+        return self._memory_report(sys.getsizeof(self._database) + entries + index, keys)
+
+    @staticmethod
+    def _memory_report(total: float, keys: int) -> Dict[str, int]:
+        return {
+            'keys'         : keys,
+            'total_bytes'  : int(total),
+            'bytes_per_key': int(total / keys) if keys else 0,
+        }
+
+    def _journal(self, key: str) -> None:
+        """
+        Запомнить исходное значение ключа в журнале текущей транзакции,
+        если ключ ещё не изменялся на этом уровне.
+        :param key:
+        :return:
+        """
+        if self.transaction_stack:
+            journal = self.transaction_stack[-1]
+            if key not in journal:
+                journal[key] = self._database.get(key, _MISSING)
+
+    def _journal_expiry(self, key: str) -> None:
+        if self._expiry_journals:
+            journal = self._expiry_journals[-1]
+            if key not in journal:
+                journal[key] = self._expiry.get(key)
+
+    def _expire_if_due(self, key: str) -> None:
+        deadline = self._expiry.get(key)
+        if deadline is not None and deadline <= self.clock():
+            self._expire(key)
+
+    def _expire(self, key: str) -> None:
+        logger.debug('Истёк срок жизни ключа %s.', key)
+        self.expired_keys += 1
+        self._remove(key)
+
+    def expire_due(self, limit: Optional[int] = None) -> int:
+        """
+        Удалить ключи с истёкшим сроком жизни (не больше limit) и вернуть их количество.
+        Ключи извлекаются из кучи сроков: O(log n) на ключ, без обхода базы данных.
+        Внутри транзакции удаление записывается в журнал, как UNSET, поэтому ROLLBACK
+        возвращает ключ вместе с его истёкшим сроком, и ключ снова удаляется при следующем обращении.
+        :param limit:
+        :return:
+        """
+        now = self.clock()
+        expired = 0
+        while limit is None or expired < limit:
+            key = self._expiry.pop_due(now)
+            if key is None:
+                break
+            self._expire(key)
+            expired += 1
+        return expired
+
+    def _unindex(self, key: str, value: Any) -> None:
+        keys = self._value_index[value]
+        del keys[key]
+        if not keys:
+            del self._value_index[value]
+            if self._numeric_index is not None:
+                self._numeric_index.remove(value)
 
     def get(self, key: str) -> Any:
         """
@@ -29,23 +679,168 @@ class CustomDataBase:
         :param key:
         :return:
         """
-        logger.debug(f'Получение значения параметра {key} из базы данных')
+        logger.debug('Получение значения параметра %s из базы данных', key)
+        if self._expiry.deadlines:
+            self._expire_if_due(key)
         if key in self.database:
-            logger.debug(f'Значение найдено в базе данных')
+            logger.debug('Значение найдено в базе данных')
+            if self.eviction is not None:
+                self.eviction.hit(key)
             return self.database[key]
         else:
-            logger.warning(f'Значение {key} не найдено в базе данных')
+            logger.warning('Значение %s не найдено в базе данных', key)
+            if self.eviction is not None:
+                self.eviction.misses += 1
             raise WrongInputException(Action.GET, key=key, message=WrongInputText.NULL.value)
 
-    def set(self, key: str, value: str) -> None:
+    def get_encoded(self, key: str) -> Union[bytes, memoryview]:
+        """
+        Вернуть значение по ключу в кодировке UTF-8, как get. MmapDataBase возвращает memoryview
+        отображения без копирования, который нужно освободить (release) до следующей команды.
+        :param key:
+        :return:
+        """
+        return self.get(key).encode()
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None, keep_ttl: bool = False) -> None:
         """
         Установить новое значение value по указанному ключу key в базе данных.
+        Если указан ttl, ключ удаляется через ttl секунд, иначе прежний срок жизни ключа
+        снимается, если не указан keep_ttl.
         :param key:
         :param value:
+        :param ttl:
+        :param keep_ttl:
+        :return:
+        """
+        logger.debug('Установка значения %s : %s в базу данных.', key, value)
+        self._set(key, value, ttl, keep_ttl)
+
+    def increment(self, key: str, amount: int) -> int:
+        """
+        Атомарно увеличить целое значение ключа на amount (уменьшить при отрицательном amount)
+        и вернуть новое значение. Отсутствующий ключ считается равным 0, срок жизни ключа сохраняется.
+        Если значение не целое число - возбуждает исключение WrongInputException.
+        Внутри транзакции изменение отменяется ROLLBACK, как SET.
+        :param key:
+        :param amount:
+        :return:
+        """
+        logger.debug('increment. Увеличение значения %s на %s.', key, amount)
+        if self._expiry.deadlines:
+            self._expire_if_due(key)
+        number = self._integer(key, self._database.get(key)) + amount
+        self._set(key, str(number), keep_ttl=True)
+        return number
+
+    @staticmethod
+    def _integer(key: str, value: Optional[str]) -> int:
+        # Целое значение ключа для increment: 0 для отсутствующего ключа.
+        if value is None:
+            return 0
+        number = parse_number(value)
+        if not isinstance(number, int):
+            raise WrongInputException(Action.INCR, key=key, message=WrongInputText.NOT_AN_INTEGER.value)
+        return number
+
+    def _set(self, key: str, value: str, ttl: Optional[int] = None, keep_ttl: bool = False) -> None:
+        if self._expiry.deadlines:
+            self._expire_if_due(key)
+        eviction = self.eviction
+        if eviction is not None:
+            eviction.stored(key, value, self._database.get(key))
+        notify = self._commit_listeners and not self.transaction_stack
+        if notify:
+            old_value = self._database.get(key)
+        else:
+            self._journal(key)
+        self._store(key, value)
+        # Срок жизни устанавливается до уведомления подписчиков: журнал предзаписи
+        # и репликация записывают его вместе со значением (expire_at).
+        if ttl is not None:
+            self._journal_expiry(key)
+            self._expiry.set(key, self.clock() + ttl)
+        elif key in self._expiry.deadlines and not keep_ttl:
+            self._journal_expiry(key)
+            self._expiry.discard(key)
+        if notify:
+            self._notify_commit([(key, old_value, value)])
+        if eviction is not None and eviction.over_limit():
+            self._evict(protected=key)
+
+    def mset(self, pairs: Sequence[Tuple[str, str]]) -> None:
+        """
+        Установить значения нескольких ключей одной командой.
+        Изменения фиксируются атомарно: подписчики (журнал предзаписи) получают их одним коммитом.
+        Сложность - O(k), журналирование - одна запись на команду, а не на ключ.
+        :param pairs: последовательность пар (ключ, значение).
+        :return:
+        """
+        logger.debug('mset. Установка значений %s ключей.', len(pairs))
+        batch = bool(self._commit_listeners) and not self.transaction_stack
+        if batch:
+            self.begin_transaction()
+        set_ = self._set
+        for key, value in pairs:
+            set_(key, value)
+        if batch:
+            self.commit_transaction()
+            if self.eviction is not None and self.eviction.over_limit():
+                self._evict()
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        """
+        Вернуть значения нескольких ключей, None для отсутствующих. Сложность - O(k).
+        :param keys:
+        :return:
+        """
+        logger.debug('mget. Получение значений %s ключей.', len(keys))
+        database = self._database
+        eviction = self.eviction
+        values = []
+        for key in keys:
+            if self._expiry.deadlines:
+                self._expire_if_due(key)
+            value = database.get(key)
+            if eviction is not None:
+                if value is None:
+                    eviction.misses += 1
+                else:
+                    eviction.hit(key)
+            values.append(value)
+        return values
+
+    def munset(self, keys: Sequence[str]) -> int:
+        """
+        Удалить несколько ключей одной командой и вернуть количество удалённых.
+        Отсутствующие ключи пропускаются. Изменения фиксируются атомарно, как в mset.
+        :param keys:
         :return:
         """
-        logger.debug(f'Установка значения {key} : {value} в базу данных.')
-        self.database[key] = value
+        logger.debug('munset. Удаление %s ключей.', len(keys))
+        batch = bool(self._commit_listeners) and not self.transaction_stack
+        if batch:
+            self.begin_transaction()
+        removed = 0
+        for key in keys:
+            if self._expiry.deadlines:
+                self._expire_if_due(key)
+            if key in self._database:
+                self._remove(key)
+                removed += 1
+        if batch:
+            self.commit_transaction()
+        return removed
+
+    @staticmethod
+    def format_results(results: List[Union[str, int, None, WrongInputException]]) -> str:
+        # Результаты EXEC: по строке на команду, OK для команд без результата, текст ошибки для ошибок.
+        return '\n'.join(OK_TEXT if result is None else result.message if isinstance(result, WrongInputException)
+                         else str(result) for result in results)
+
+    @staticmethod
+    def format_values(values: List[Optional[Any]]) -> str:
+        return " ".join(WrongInputText.NULL.value if value is None else str(value) for value in values)
 
     def unset(self, key: str) -> None:
         """
@@ -54,50 +849,307 @@ class CustomDataBase:
         :param key:
         :return:
         """
+        if self._expiry.deadlines:
+            self._expire_if_due(key)
         if key in self.database:
-            logger.debug(f'Удаление значения {key} из базы данных.')
-            del self.database[key]
+            logger.debug('Удаление значения %s из базы данных.', key)
+            self._remove(key)
         else:
             raise WrongInputException(Action.UNSET, key=key,
                                       message=f"Ошибка: Аргумент {key} отсутствует в базе данных.")
 
+    def _remove(self, key: str) -> None:
+        """
+        Удалить существующий ключ с учётом транзакций, сроков жизни и подписчиков.
+        :param key:
+        :return:
+        """
+        if self.eviction is not None:
+            self.eviction.removed(key, self._database[key])
+        if key in self._expiry.deadlines:
+            self._journal_expiry(key)
+            self._expiry.discard(key)
+        if self._commit_listeners and not self.transaction_stack:
+            old_value = self._database[key]
+            self._discard(key)
+            self._notify_commit([(key, old_value, None)])
+            return
+        self._journal(key)
+        self._discard(key)
+
+    def ttl(self, key: str) -> int:
+        """
+        Вернуть оставшееся время жизни ключа в секундах (с округлением вверх),
+        -1, если срок жизни не задан, и -2, если ключа нет.
+        :param key:
+        :return:
+        """
+        if self._expiry.deadlines:
+            self._expire_if_due(key)
+        if key not in self._database:
+            return -2
+        deadline = self._expiry.get(key)
+        if deadline is None:
+            return -1
+        return math.ceil(deadline - self.clock())
+
     def counts(self, value: Any) -> int:
         """
         Подсчитать количество ключей, встречаемых в базе данных с указанным значением value.
-        Сложность - O(n)
+        Сложность - O(1), используется обратный индекс значений.
         :param value:
         :return:
         """
-        logger.debug(f'counts. Поиск сколько раз {value} встречается в базе данных.')
-        return sum([1 for v in self.database.values() if v == value])
+        logger.debug('counts. Поиск сколько раз %s встречается в базе данных.', value)
+        if self._expiry.deadlines:
+            self.expire_due()
+        return len(self._value_index.get(value, ()))
 
     def find(self, value: Any) -> List[str]:
         """
         Вернуть все ключи, содержащие значение value, в виде списка со строками.
-        Сложность - O(n)
+        Сложность - O(k), где k - количество найденных ключей.
         :param value:
         :return:
         """
-        logger.debug(f'find. Поиск всех ключей для значения {value}.')
-        return [k for k, v in self.database.items() if v == value]
+        return list(self.iter_find(value))
+
+    def iter_find(self, value: Any) -> Iterator[str]:
+        """
+        Лениво перебрать ключи, содержащие значение value, без построения списка.
+        Итератор действителен до следующего изменения данных.
+        :param value:
+        :return:
+        """
+        logger.debug('find. Поиск всех ключей для значения %s.', value)
+        if self._expiry.deadlines:
+            self.expire_due()
+        return iter(self._value_index.get(value, ()))
+
+    def find_page(self, value: Any, cursor: Optional[str] = None,
+                  count: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Вернуть страницу из count ключей со значением value, следующих по возрастанию после
+        ключа cursor, и курсор следующей страницы (None, если ключей больше нет).
+        Как и у keys_page, курсор остаётся действительным при изменении данных между запросами.
+        В памяти держится только страница. Из двух способов выбирается более дешёвый:
+        обход упорядоченного индекса ключей с проверкой по обратному индексу - O(count * n / k),
+        либо отбор наименьших из k ключей значения - O(k log count).
+        :param value:
+        :param cursor:
+        :param count:
+        :return:
+        """
+        logger.debug('find_page. Поиск %s ключей для значения %s после %s.', count, value, cursor)
+        count = count or self.KEYS_PAGE_SIZE
+        if self._expiry.deadlines:
+            self.expire_due()
+        keys = self._value_index.get(value, {})
+        if len(keys) ** 2 < count * len(self._database):
+            return page_after(keys, cursor, count)
+        return self._scan_page(keys.__contains__, cursor, count)
+
+    def counts_between(self, low: Number, high: Number) -> int:
+        """
+        Подсчитать ключи с числовыми значениями от low до high включительно.
+        Сложность - O(log d + r), где d - количество различных числовых значений,
+        r - количество различных значений в диапазоне: ключи каждого значения
+        считаются по обратному индексу значений (первый запрос строит числовой индекс за O(d log d)).
+        :param low:
+        :param high:
+        :return:
+        """
+        logger.debug('counts_between. Подсчёт ключей со значениями от %s до %s.', low, high)
+        value_index = self._value_index
+        return sum(len(value_index[value]) for value in self._numeric_values().irange(low, high))
+
+    def find_between(self, low: Number, high: Number) -> List[str]:
+        """
+        Вернуть ключи с числовыми значениями от low до high включительно по возрастанию значений.
+        :param low:
+        :param high:
+        :return:
+        """
+        return list(self.iter_find_between(low, high))
+
+    def numbers_between(self, low: Number, high: Number) -> List[Tuple[Number, str]]:
+        """
+        Вернуть пары (число, ключ) для ключей с числовыми значениями от low до high
+        по возрастанию значений: ключи и их значения читаются одним проходом по индексу.
+        :param low:
+        :param high:
+        :return:
+        """
+        logger.debug('numbers_between. Поиск значений от %s до %s.', low, high)
+        value_index = self._value_index
+        matches = []
+        for value in self._numeric_values().irange(low, high):
+            number = parse_number(value)
+            matches.extend((number, key) for key in value_index[value])
+        return matches
+
+    def iter_find_between(self, low: Number, high: Number) -> Iterator[str]:
+        """
+        Лениво перебрать ключи с числовыми значениями от low до high по возрастанию значений.
+        Сложность - O(log d + r + k), где k - количество найденных ключей.
+        Итератор действителен до следующего изменения данных.
+        :param low:
+        :param high:
+        :return:
+        """
+        logger.debug('find_between. Поиск ключей со значениями от %s до %s.', low, high)
+        value_index = self._value_index
+        for value in self._numeric_values().irange(low, high):
+            yield from value_index[value]
+
+    def _numeric_values(self) -> NumericIndex:
+        if self._expiry.deadlines:
+            self.expire_due()
+        if self._numeric_index is None:
+            logger.debug('Построение числового индекса значений.')
+            self._numeric_index = NumericIndex(self._value_index)
+        return self._numeric_index
+
+    def _scan_page(self, matches: Callable[[str], bool], cursor: Optional[str],
+                   count: int) -> Tuple[List[str], Optional[str]]:
+        # Первые count ключей после cursor по упорядоченному индексу, удовлетворяющие matches.
+        keys = self._ordered_keys().irange(cursor, include_start=False)
+        return split_page(list(islice(filter(matches, keys), count + 1)), count)
+
+    @staticmethod
+    def stream_keys(keys: Iterable[str]) -> Iterator[str]:
+        """
+        Потоковый вывод ключей через пробел: фрагменты по STREAM_CHUNK_KEYS ключей,
+        чтобы не собирать весь ответ в одну строку. Первый фрагмент выдаётся всегда,
+        даже пустой.
+        :param keys:
+        :return:
+        """
+        keys = iter(keys)
+        yield ' '.join(islice(keys, STREAM_CHUNK_KEYS))
+        while True:
+            chunk = ' '.join(islice(keys, STREAM_CHUNK_KEYS))
+            if not chunk:
+                return
+            yield ' ' + chunk
+
+    def _ordered_keys(self) -> SortedKeys:
+        if self._expiry.deadlines:
+            self.expire_due()
+        if self._key_index is None:
+            logger.debug('Построение упорядоченного индекса ключей.')
+            self._key_index = SortedKeys(self._database)
+        return self._key_index
+
+    def scan(self, prefix: str) -> List[str]:
+        """
+        Вернуть по возрастанию ключи, начинающиеся с prefix.
+        Сложность - O(log n + k), где k - количество найденных ключей
+        (первый запрос строит индекс ключей за O(n log n)).
+        :param prefix:
+        :return:
+        """
+        return list(self._ordered_keys().prefix(prefix))
+
+    def key_range(self, start: str, stop: str) -> List[str]:
+        """
+        Вернуть по возрастанию ключи от start до stop включительно. Сложность - O(log n + k).
+        :param start:
+        :param stop:
+        :return:
+        """
+        return list(self._ordered_keys().irange(start, stop))
+
+    def keys_page(self, cursor: Optional[str] = None, count: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Вернуть страницу из count ключей, следующих по возрастанию после ключа cursor
+        (с начала, если cursor не указан), и курсор следующей страницы - последний ключ
+        страницы, либо None, если ключей больше нет. Курсор остаётся действительным
+        при любых изменениях данных между запросами. Сложность - O(log n + count).
+        :param cursor:
+        :param count:
+        :return:
+        """
+        count = count or self.KEYS_PAGE_SIZE
+        keys = []
+        iterator = self._ordered_keys().irange(cursor, include_start=False)
+        for key in iterator:
+            keys.append(key)
+            if len(keys) == count:
+                return keys, (key if next(iterator, None) is not None else None)
+        return keys, None
+
+    @staticmethod
+    def format_keys_page(keys: List[str], cursor: Optional[str]) -> str:
+        text = " ".join(keys)
+        if cursor is None:
+            return text
+        return text + '\n' + NEXT_CURSOR_TEXT.format(cursor=cursor)
+
+    def save(self) -> int:
+        """
+        Записать снимок зафиксированных данных на диск и вернуть количество записанных ключей.
+        Выполнение команд приостанавливается на время записи.
+        :return:
+        """
+        logger.debug('save. Запись снимка базы данных.')
+        keys = self._storage(Action.SAVE).save()
+        if keys is None:
+            raise WrongInputException(Action.SAVE, message=WrongInputText.SAVE_FAILED.value)
+        return keys
+
+    def background_save(self) -> None:
+        """
+        Начать запись снимка зафиксированных данных в фоновом процессе.
+        Если предыдущий снимок ещё пишется - возбуждает исключение WrongInputException.
+        :return:
+        """
+        logger.debug('background_save. Запуск фоновой записи снимка базы данных.')
+        if not self._storage(Action.BGSAVE).snapshot():
+            raise WrongInputException(Action.BGSAVE, message=WrongInputText.SAVE_IN_PROGRESS.value)
+
+    def _storage(self, action: Action):
+        if self.storage is None:
+            raise WrongInputException(action, message=WrongInputText.NO_STORAGE.value)
+        return self.storage
 
     def begin_transaction(self) -> None:
         """
         Начать транзакцию для базы данных.
+        Сложность - O(1): копия данных не создаётся, заводится пустой журнал отката.
         :return:
         """
-        logger.debug(f'begin_transaction. Открытие транзакции в базе данных.')
-        self.transaction_stack.append(self.database.copy())
+        logger.debug('begin_transaction. Открытие транзакции в базе данных.')
+        self.transaction_stack.append({})
+        self._expiry_journals.append({})
 
     def rollback_transaction(self) -> None:
         """
         Отменить последнюю активную транзакцию базы данных.
         Если активных транзакций нет - возбуждает исключение WrongInputException.
+        Сложность - O(m), где m - количество ключей, изменённых в транзакции.
         :return:
         """
-        logger.debug(f'begin_transaction. Отмена транзакции в базе данных.')
+        logger.debug('rollback_transaction. Отмена транзакции в базе данных.')
         if self.transaction_stack:
-            self.database = self.transaction_stack.pop()
+            eviction = self.eviction
+            for key, old_value in self.transaction_stack.pop().items():
+                if old_value is _MISSING:
+                    if key in self._database:
+                        if eviction is not None:
+                            eviction.removed(key, self._database[key])
+                        self._discard(key)
+                else:
+                    if eviction is not None:
+                        eviction.stored(key, old_value, self._database.get(key))
+                    self._store(key, old_value)
+            for key, deadline in self._expiry_journals.pop().items():
+                if deadline is None or key not in self._database:
+                    self._expiry.discard(key)
+                else:
+                    self._expiry.set(key, deadline)
+            if eviction is not None and eviction.over_limit():
+                self._evict()
         else:
             raise WrongInputException(Action.ROLLBACK, message=WrongInputText.NO_TRANSACTIONS_TO_ROLLBACK.value)
 
@@ -105,16 +1157,43 @@ class CustomDataBase:
         """
         Внести изменения внесённые в базу данных в ходе активной транзакции.
         Если активных транзакций нет - возбуждает исключение WrongInputException.
+        Журнал транзакции сливается с журналом родительской транзакции, при этом
+        исходные значения родителя имеют приоритет.
+        Сложность - O(min(m, p)), где m и p - размеры журналов транзакции и родителя.
         :return:
         """
-        logger.debug(f'begin_transaction. Внесение данных в транзакции в базу данных.')
+        logger.debug('commit_transaction. Внесение данных в транзакции в базу данных.')
         if self.transaction_stack:
-            self.transaction_stack.pop()
+            journal = self.transaction_stack.pop()
+            expiry_journal = self._expiry_journals.pop()
+            if self.transaction_stack:
+                parent_expiry = self._expiry_journals[-1]
+                for key, deadline in expiry_journal.items():
+                    parent_expiry.setdefault(key, deadline)
+                parent = self.transaction_stack[-1]
+                if len(parent) < len(journal):
+                    journal.update(parent)
+                    self.transaction_stack[-1] = journal
+                else:
+                    for key, old_value in journal.items():
+                        parent.setdefault(key, old_value)
+            elif self._commit_listeners:
+                changes = []
+                for key, old_value in journal.items():
+                    if old_value is _MISSING:
+                        old_value = None
+                    new_value = self._database.get(key)
+                    # Ключ с прежним значением, но новым сроком жизни - тоже изменение.
+                    if new_value != old_value or key in expiry_journal:
+                        changes.append((key, old_value, new_value))
+                if changes:
+                    self._notify_commit(changes)
         else:
             raise WrongInputException(Action.COMMIT, message=WrongInputText.NO_TRANSACTIONS_TO_COMMIT.value)
 
 
-    def execute_command(self, command, key=None, value=None) -> Union[str, int, None]:
+    def execute_command(self, command, key=None, value=None, ttl=None,
+                        arguments=()) -> Union[str, int, None, Iterator[str]]:
         """
         Обработать полученную команду в виде набора аргументов,
          установить какую для взаимодействия с базой данных вызвать,
@@ -124,11 +1203,94 @@ class CustomDataBase:
         :param command:
         :param key:
         :param value:
+        :param ttl:
+        :param arguments:
+        :return:
+        """
+        logger.debug('execute_command. Выполнение команды с параметрами. command=%s, key=%s, value=%s',
+                     command, key, value)
+        if self.optimistic.queue is not None and command is not Action.EXEC and command is not Action.DISCARD:
+            return self.optimistic.enqueue(command, key, value, ttl, arguments)
+        if self._expiry.deadlines:
+            self.expire_due(self.ACTIVE_EXPIRE_LIMIT)
+        if self.metrics is None:
+            return self._dispatch(command, key, value, ttl, arguments)
+        return self._measured(command, self._dispatch, command, key, value, ttl, arguments)
+
+    def execute_get(self, key: str) -> Union[bytes, memoryview]:
+        """
+        Выполнить GET, как execute_command, и вернуть значение в кодировке UTF-8 для ответа
+        протокола (server.DatabaseServer) без промежуточной строки, если движок это позволяет (get_encoded).
+        :param key:
+        :return:
+        """
+        if self.optimistic.queue is not None:
+            return str(self.execute_command(Action.GET, key)).encode()
+        if self._expiry.deadlines:
+            self.expire_due(self.ACTIVE_EXPIRE_LIMIT)
+        if self.metrics is None:
+            return self.get_encoded(key)
+        return self._measured(Action.GET, self.get_encoded, key)
+
+    def _measured(self, command, function: Callable, *arguments) -> Any:
+        # Вызвать function с учётом вызова и задержки команды в metrics.
+        metrics = self.metrics
+        name = command.value if isinstance(command, Action) else str(command)
+        started = perf_counter_ns()
+        try:
+            result = function(*arguments)
+        except WrongInputException:
+            metrics.record(name, perf_counter_ns() - started, error=True)
+            raise
+        metrics.record(name, perf_counter_ns() - started)
+        return result
+
+    def execute_batch(self, commands: Sequence[Tuple]) -> List[Union[str, int, None, WrongInputException]]:
+        """
+        Выполнить пакет команд (кортежей в формате input_filter.ParsedCommand) и вернуть
+        результаты в том же порядке; ошибка команды возвращается как WrongInputException
+        и не прерывает пакет. Изменения пакета фиксируются атомарно, как в mset:
+        подписчики (журнал предзаписи, реплики) получают их одним коммитом.
+        Внутри открытой транзакции пакет входит в её журнал отката.
+        :param commands:
+        :return:
+        """
+        batch = bool(self._commit_listeners) and not self.transaction_stack
+        if batch:
+            self.begin_transaction()
+        results: List[Any] = []
+        try:
+            for command in commands:
+                try:
+                    result = self.execute_command(*command)
+                except WrongInputException as e:
+                    result = e
+                if isinstance(result, Iterator):
+                    # Потоковый результат читает данные, которые изменят следующие команды пакета.
+                    result = ''.join(result)
+                results.append(result)
+        finally:
+            if batch:
+                self.commit_transaction()
+        if batch and self.eviction is not None and self.eviction.over_limit():
+            self._evict()
+        return results
+
+    def _dispatch(self, command, key=None, value=None, ttl=None,
+                  arguments=()) -> Union[str, int, None, Iterator[str]]:
+        """
+        Вызвать метод базы данных, соответствующий команде.
+        FIND без LIMIT и CURSOR возвращает потоковый результат - итератор фрагментов текста,
+        который нужно прочитать до следующей команды.
+        :param command:
+        :param key:
+        :param value:
+        :param ttl:
+        :param arguments:
         :return:
         """
-        logger.debug(f'execute_command. Выполнение команды с параметрами. command={command}, key={None}, value={None}')
         if command is Action.SET:
-            self.set(key, value)
+            self.set(key, value, ttl)
             return
         elif command is Action.GET:
             return self.get(key)
@@ -136,9 +1298,15 @@ class CustomDataBase:
             self.unset(key)
             return
         elif command is Action.COUNTS:
+            if value is None:
+                return self.counts_between(*arguments)
             return self.counts(value)
         elif command is Action.FIND:
-            return " ".join(key for key in self.find(value))
+            if value is None:
+                return self.stream_keys(self.iter_find_between(*arguments))
+            if key is None and not arguments:
+                return self.stream_keys(self.iter_find(value))
+            return self.format_keys_page(*self.find_page(value, key, *arguments))
         elif command is Action.BEGIN:
             self.begin_transaction()
             return
@@ -148,5 +1316,52 @@ class CustomDataBase:
         elif command is Action.COMMIT:
             self.commit_transaction()
             return
+        elif command is Action.STATS:
+            return format_stats(self.stats(), as_json=value == STATS_JSON_OPTION)
+        elif command is Action.SLOWLOG:
+            return execute_slowlog(self.slowlog, value, arguments)
+        elif command is Action.PROFILE:
+            if value == PROFILE_START:
+                self.start_profile()
+                return
+            return self.stop_profile(*arguments)
+        elif command is Action.MSET:
+            self.mset(arguments)
+            return
+        elif command is Action.MGET:
+            return self.format_values(self.mget(arguments))
+        elif command is Action.MUNSET:
+            return self.munset(arguments)
+        elif command is Action.INCR or command is Action.DECR or command is Action.INCRBY or command is Action.DECRBY:
+            return self.increment(key, value)
+        elif command is Action.TTL:
+            return self.ttl(key)
+        elif command is Action.SCAN:
+            return " ".join(self.scan(key))
+        elif command is Action.RANGE:
+            return " ".join(self.key_range(key, value))
+        elif command is Action.KEYS:
+            return self.format_keys_page(*self.keys_page(key))
+        elif command is Action.SAVE:
+            return SAVED_TEXT.format(keys=self.save())
+        elif command is Action.BGSAVE:
+            self.background_save()
+            return BACKGROUND_SAVE_TEXT
+        elif command is Action.MEMORY:
+            return '\n'.join(f'{name}: {amount}' for name, amount in self.memory_usage().items())
+        elif command is Action.WATCH:
+            self.optimistic.watch(arguments)
+            return
+        elif command is Action.UNWATCH:
+            self.optimistic.unwatch()
+            return
+        elif command is Action.MULTI:
+            self.optimistic.multi()
+            return
+        elif command is Action.EXEC:
+            return self.format_results(self.optimistic.execute(self.execute_batch))
+        elif command is Action.DISCARD:
+            self.optimistic.discard()
+            return
 
         raise WrongInputException(message=WrongInputText.WRONG_INPUT_FORMAT.value)
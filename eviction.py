@@ -0,0 +1,263 @@
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+import random
+import sys
+
+# Приблизительные накладные расходы на ключ помимо самих строк ключа и значения:
+# ячейка словаря данных, запись в обратном индексе значений и учёт политики вытеснения.
+ENTRY_OVERHEAD = 200
+
+
+def entry_size(key: str, value: Any) -> int:
+    """
+    Оценить объём памяти, занимаемый одной записью базы данных.
+    :param key:
+    :param value:
+    :return:
+    """
+    return sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD
+
+
+class EvictionPolicy:
+    """
+    Учёт занятой памяти и порядок вытеснения ключей при превышении max_memory.
+    База данных сообщает политике о записи (stored), удалении (removed) и чтении (hit) ключей,
+    а при превышении бюджета выбирает жертву из candidates - ключей в порядке вытеснения.
+    Учёт на каждую операцию - O(1). Наследники реализуют _add, _touch, _remove и candidates.
+    >>>policy = LRUPolicy(max_memory=1024)
+    >>>policy.stored('A', '5', None)
+    >>>next(policy.candidates())
+    'A'
+    """
+
+    name = ''
+
+    def __init__(self, max_memory: int) -> None:
+        self.max_memory = max_memory
+        self.used_memory = 0
+        self.evicted_keys = 0
+        self.hits = 0
+        self.misses = 0
+
+    def over_limit(self) -> bool:
+        return self.used_memory > self.max_memory
+
+    def reset(self, items: Iterable[Tuple[str, Any]]) -> None:
+        """
+        Заново учесть все ключи базы данных (после замены данных целиком).
+        :param items:
+        :return:
+        """
+        self._clear()
+        self.used_memory = 0
+        for key, value in items:
+            self.used_memory += entry_size(key, value)
+            self._add(key)
+
+    def stored(self, key: str, value: Any, old_value: Any) -> None:
+        """
+        Учесть запись значения value по ключу key. old_value - прежнее значение или None.
+        :param key:
+        :param value:
+        :param old_value:
+        :return:
+        """
+        self.used_memory += entry_size(key, value)
+        if old_value is None:
+            self._add(key)
+        else:
+            self.used_memory -= entry_size(key, old_value)
+            self._touch(key)
+
+    def removed(self, key: str, value: Any) -> None:
+        self.used_memory -= entry_size(key, value)
+        self._remove(key)
+
+    def hit(self, key: str) -> None:
+        self.hits += 1
+        self._touch(key)
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            'maxmemory'        : self.max_memory,
+            'maxmemory_policy' : self.name,
+            'used_memory'      : self.used_memory,
+            'evicted_keys'     : self.evicted_keys,
+            'keyspace_hits'    : self.hits,
+            'keyspace_misses'  : self.misses,
+            'hit_rate'         : round(self.hits / requests, 4) if requests else 0,
+        }
+
+    def _clear(self) -> None:
+        raise NotImplementedError
+
+    def _add(self, key: str) -> None:
+        raise NotImplementedError
+
+    def _touch(self, key: str) -> None:
+        raise NotImplementedError
+
+    def _remove(self, key: str) -> None:
+        raise NotImplementedError
+
+    def candidates(self) -> Iterator[str]:
+        """
+        Ключи в порядке вытеснения. Итератор действителен до следующего изменения политики.
+        :return:
+        """
+        raise NotImplementedError
+
+
+class LRUPolicy(EvictionPolicy):
+    """
+    Вытеснение давно не использовавшихся ключей. OrderedDict хранит ключи
+    от самого старого обращения к самому новому.
+    """
+
+    name = 'lru'
+
+    def __init__(self, max_memory: int) -> None:
+        super().__init__(max_memory)
+        self._order: Dict[str, None] = OrderedDict()
+
+    def _clear(self) -> None:
+        self._order.clear()
+
+    def _add(self, key: str) -> None:
+        self._order[key] = None
+
+    def _touch(self, key: str) -> None:
+        self._order.move_to_end(key)
+
+    def _remove(self, key: str) -> None:
+        del self._order[key]
+
+    def candidates(self) -> Iterator[str]:
+        return iter(self._order)
+
+
+class LFUPolicy(EvictionPolicy):
+    """
+    Вытеснение редко используемых ключей, при равной частоте - давно не использовавшихся.
+    Ключи разложены по корзинам частот, непустые частоты связаны в упорядоченный список
+    (_higher/_lower), поэтому все операции, включая поиск минимальной частоты, - O(1).
+    """
+
+    name = 'lfu'
+
+    # Фиктивная частота - голова списка частот.
+    _HEAD = 0
+
+    def __init__(self, max_memory: int) -> None:
+        super().__init__(max_memory)
+        self._frequency: Dict[str, int] = {}
+        # Частота -> ключи с этой частотой от старого обращения к новому.
+        self._buckets: Dict[int, Dict[str, None]] = {}
+        self._higher: Dict[int, int] = {self._HEAD: self._HEAD}
+        self._lower: Dict[int, int] = {self._HEAD: self._HEAD}
+
+    def _clear(self) -> None:
+        self._frequency.clear()
+        self._buckets.clear()
+        self._higher = {self._HEAD: self._HEAD}
+        self._lower = {self._HEAD: self._HEAD}
+
+    def _link(self, frequency: int, after: int) -> Dict[str, None]:
+        following = self._higher[after]
+        self._higher[after] = frequency
+        self._lower[frequency] = after
+        self._higher[frequency] = following
+        self._lower[following] = frequency
+        bucket = self._buckets[frequency] = {}
+        return bucket
+
+    def _unlink(self, frequency: int) -> None:
+        del self._buckets[frequency]
+        lower = self._lower.pop(frequency)
+        higher = self._higher.pop(frequency)
+        self._higher[lower] = higher
+        self._lower[higher] = lower
+
+    def _add(self, key: str) -> None:
+        bucket = self._buckets.get(1)
+        if bucket is None:
+            bucket = self._link(1, self._HEAD)
+        bucket[key] = None
+        self._frequency[key] = 1
+
+    def _touch(self, key: str) -> None:
+        frequency = self._frequency[key]
+        bucket = self._buckets[frequency]
+        del bucket[key]
+        higher = frequency + 1
+        higher_bucket = self._buckets.get(higher)
+        if higher_bucket is None:
+            higher_bucket = self._link(higher, frequency)
+        higher_bucket[key] = None
+        self._frequency[key] = higher
+        if not bucket:
+            self._unlink(frequency)
+
+    def _remove(self, key: str) -> None:
+        frequency = self._frequency.pop(key)
+        bucket = self._buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            self._unlink(frequency)
+
+    def candidates(self) -> Iterator[str]:
+        frequency = self._higher[self._HEAD]
+        while frequency != self._HEAD:
+            yield from self._buckets[frequency]
+            frequency = self._higher[frequency]
+
+
+class RandomPolicy(EvictionPolicy):
+    """
+    Вытеснение случайных ключей. Ключи хранятся в списке, удаление - заменой
+    удаляемого ключа последним элементом списка.
+    """
+
+    name = 'random'
+
+    def __init__(self, max_memory: int) -> None:
+        super().__init__(max_memory)
+        self._keys: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._random = random.Random()
+
+    def _clear(self) -> None:
+        self._keys.clear()
+        self._positions.clear()
+
+    def _add(self, key: str) -> None:
+        self._positions[key] = len(self._keys)
+        self._keys.append(key)
+
+    def _touch(self, key: str) -> None:
+        pass
+
+    def _remove(self, key: str) -> None:
+        position = self._positions.pop(key)
+        last = self._keys.pop()
+        if last != key:
+            self._keys[position] = last
+            self._positions[last] = position
+
+    # Количество случайных попыток, после которых ключи перебираются по порядку
+    # (если случайные ключи оказались закреплены транзакциями).
+    RANDOM_ATTEMPTS = 16
+
+    def candidates(self) -> Iterator[str]:
+        keys = self._keys
+        for _ in range(min(len(keys), self.RANDOM_ATTEMPTS)):
+            yield keys[self._random.randrange(len(keys))]
+        yield from keys
+
+
+EVICTION_POLICIES = {
+    LRUPolicy.name   : LRUPolicy,
+    LFUPolicy.name   : LFUPolicy,
+    RandomPolicy.name: RandomPolicy,
+}
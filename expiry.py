@@ -0,0 +1,58 @@
+from typing import Dict, List, Optional, Tuple
+import heapq
+
+
+class ExpiryHeap:
+    """
+    Сроки жизни ключей: словарь "ключ -> момент истечения" и куча (момент, ключ),
+    упорядоченная по времени, чтобы находить истёкшие ключи без обхода всех данных.
+    При изменении или снятии срока старая запись кучи не удаляется, а пропускается
+    при извлечении (её момент не совпадает со сроком в словаре). Когда таких записей
+    становится больше, чем действующих, куча перестраивается.
+    Установка срока и извлечение истёкшего ключа - O(log n).
+    >>>expiry = ExpiryHeap()
+    >>>expiry.set('A', 10.0)
+    >>>expiry.pop_due(now=11.0)
+    'A'
+    """
+
+    # Размер кучи, начиная с которого проверяется доля устаревших записей.
+    COMPACT_MIN_SIZE = 1024
+
+    def __init__(self) -> None:
+        self.deadlines: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.deadlines
+
+    def get(self, key: str) -> Optional[float]:
+        return self.deadlines.get(key)
+
+    def set(self, key: str, deadline: float) -> None:
+        self.deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if len(self._heap) > self.COMPACT_MIN_SIZE and len(self._heap) > 2 * len(self.deadlines):
+            self._heap = [(deadline, key) for key, deadline in self.deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def discard(self, key: str) -> None:
+        self.deadlines.pop(key, None)
+
+    def pop_due(self, now: float) -> Optional[str]:
+        """
+        Извлечь из кучи ключ, срок которого истёк к моменту now, или вернуть None.
+        Срок ключа остаётся в словаре, пока ключ не будет удалён из базы данных.
+        :param now:
+        :return:
+        """
+        heap = self._heap
+        deadlines = self.deadlines
+        while heap and heap[0][0] <= now:
+            deadline, key = heapq.heappop(heap)
+            if deadlines.get(key) == deadline:
+                return key
+        return None
@@ -1,8 +1,231 @@
-from constants import Action, WrongInputException, WrongInputText
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 import logging
+import sys
+
+from constants import (AND_OPTION, BETWEEN_OPTION, CURSOR_OPTION, EXPIRE_OPTION, INFO_COMMAND, LIMIT_OPTION,
+                       PROFILE_START, PROFILE_STOP, SLOWLOG_GET, SLOWLOG_LEN, SLOWLOG_RESET, STATS_JSON_OPTION,
+                       Action, WrongInputException, WrongInputText)
+from ordered_index import parse_number
 
 logger = logging.getLogger(__name__)
 
+
+class ParsedCommand(NamedTuple):
+    """
+    Результат разбора строки с командой. Поля идут в порядке аргументов
+    CustomDataBase.execute_command, поэтому команду можно выполнить как
+    database.execute_command(*parsed_command).
+    """
+    command: Action
+    # Ключ команды; для KEYS и FIND - курсор, после которого начинается страница.
+    key: Optional[str] = None
+    # Значение команды; для INCR/DECR/INCRBY/DECRBY - приращение (int, отрицательное для DECR),
+    # для SLOWLOG и PROFILE - подкоманда.
+    value: Optional[str] = None
+    # Время жизни ключа в секундах для SET ... EX seconds.
+    ttl: Optional[int] = None
+    # Аргументы команд с переменным числом аргументов: ключи MGET/MUNSET/WATCH, пары (ключ, значение) MSET,
+    # размер страницы FIND ... LIMIT, границы (от, до) COUNTS/FIND BETWEEN,
+    # количество записей SLOWLOG GET, файл отчёта PROFILE STOP.
+    arguments: Tuple = ()
+
+
+def _build_command(action: Action, arguments: List[str]) -> ParsedCommand:
+    return ParsedCommand(action)
+
+
+def _build_key(action: Action, arguments: List[str]) -> ParsedCommand:
+    return ParsedCommand(action, arguments[1])
+
+
+def _build_value(action: Action, arguments: List[str]) -> ParsedCommand:
+    return ParsedCommand(action, None, arguments[1])
+
+
+def _build_key_value(action: Action, arguments: List[str]) -> ParsedCommand:
+    return ParsedCommand(action, arguments[1], arguments[2])
+
+
+def _build_optional_key(action: Action, arguments: List[str]) -> ParsedCommand:
+    return ParsedCommand(action, arguments[1] if len(arguments) > 1 else None)
+
+
+def _build_keys(action: Action, arguments: List[str]) -> ParsedCommand:
+    return ParsedCommand(action, arguments=tuple(arguments[1:]))
+
+
+def _build_pairs(action: Action, arguments: List[str]) -> ParsedCommand:
+    if len(arguments) % 2 == 0:
+        raise WrongInputException(action, message=WrongInputText.NO_ARGUMENT_VALUE.value)
+    return ParsedCommand(action, arguments=tuple(zip(arguments[1::2], arguments[2::2])))
+
+
+def _build_set(action: Action, arguments: List[str]) -> ParsedCommand:
+    if len(arguments) == 3:
+        return _build_key_value(action, arguments)
+    if len(arguments) != 5 or arguments[3].upper() != EXPIRE_OPTION:
+        raise WrongInputException(action, message=WrongInputText.WRONG_INPUT_FORMAT.value)
+    seconds = arguments[4]
+    if not seconds.isdecimal() or not int(seconds):
+        raise WrongInputException(action, message=WrongInputText.WRONG_EXPIRE_TIME.value)
+    return ParsedCommand(action, arguments[1], arguments[2], int(seconds))
+
+
+def _is_range(arguments: List[str]) -> bool:
+    return (len(arguments) == 5 and arguments[1].upper() == BETWEEN_OPTION
+            and arguments[3].upper() == AND_OPTION)
+
+
+def _build_range(action: Action, arguments: List[str]) -> ParsedCommand:
+    low, high = parse_number(arguments[2]), parse_number(arguments[4])
+    if low is None or high is None:
+        raise WrongInputException(action, message=WrongInputText.WRONG_RANGE.value)
+    return ParsedCommand(action, arguments=(low, high))
+
+
+def _build_counts(action: Action, arguments: List[str]) -> ParsedCommand:
+    if _is_range(arguments):
+        return _build_range(action, arguments)
+    if len(arguments) != 2:
+        raise WrongInputException(action, message=WrongInputText.WRONG_INPUT_FORMAT.value)
+    return _build_value(action, arguments)
+
+
+def _build_find(action: Action, arguments: List[str]) -> ParsedCommand:
+    if _is_range(arguments):
+        return _build_range(action, arguments)
+    options = arguments[2:]
+    if len(options) % 2:
+        raise WrongInputException(action, message=WrongInputText.WRONG_INPUT_FORMAT.value)
+    cursor = None
+    limit = ()
+    for option, option_value in zip(options[::2], options[1::2]):
+        option = option.upper()
+        if option == LIMIT_OPTION and not limit:
+            if not option_value.isdecimal() or not int(option_value):
+                raise WrongInputException(action, message=WrongInputText.WRONG_LIMIT.value)
+            limit = (int(option_value),)
+        elif option == CURSOR_OPTION and cursor is None:
+            cursor = option_value
+        else:
+            raise WrongInputException(action, message=WrongInputText.WRONG_INPUT_FORMAT.value)
+    return ParsedCommand(action, cursor, arguments[1], arguments=limit)
+
+
+def _build_increment(action: Action, arguments: List[str]) -> ParsedCommand:
+    amount = 1
+    if len(arguments) == 3:
+        amount = parse_number(arguments[2])
+        if not isinstance(amount, int):
+            raise WrongInputException(action, message=WrongInputText.WRONG_INCREMENT.value)
+    if action is Action.DECR or action is Action.DECRBY:
+        amount = -amount
+    return ParsedCommand(action, arguments[1], amount)
+
+
+def _build_stats(action: Action, arguments: List[str]) -> ParsedCommand:
+    if len(arguments) == 1:
+        return ParsedCommand(action)
+    option = arguments[1].upper()
+    if option != STATS_JSON_OPTION:
+        raise WrongInputException(action, message=WrongInputText.WRONG_INPUT_FORMAT.value)
+    return ParsedCommand(action, None, option)
+
+
+def _build_slowlog(action: Action, arguments: List[str]) -> ParsedCommand:
+    subcommand = arguments[1].upper()
+    if subcommand == SLOWLOG_GET and len(arguments) == 3:
+        if not arguments[2].isdecimal():
+            raise WrongInputException(action, message=WrongInputText.WRONG_INPUT_FORMAT.value)
+        return ParsedCommand(action, value=subcommand, arguments=(int(arguments[2]),))
+    if subcommand not in (SLOWLOG_GET, SLOWLOG_LEN, SLOWLOG_RESET) or len(arguments) != 2:
+        raise WrongInputException(action, message=WrongInputText.WRONG_INPUT_FORMAT.value)
+    return ParsedCommand(action, value=subcommand)
+
+
+def _build_profile(action: Action, arguments: List[str]) -> ParsedCommand:
+    subcommand = arguments[1].upper()
+    if subcommand == PROFILE_STOP and len(arguments) == 3:
+        return ParsedCommand(action, value=subcommand, arguments=(arguments[2],))
+    if subcommand not in (PROFILE_START, PROFILE_STOP) or len(arguments) != 2:
+        raise WrongInputException(action, message=WrongInputText.WRONG_INPUT_FORMAT.value)
+    return ParsedCommand(action, value=subcommand)
+
+
+# Максимальное количество аргументов команд с переменным числом аргументов.
+_ANY_NUMBER = sys.maxsize
+
+# Таблица разбора: команда -> (действие, минимальное и максимальное количество аргументов,
+# построитель результата).
+COMMAND_TABLE: Dict[str, Tuple[Action, int, int, Callable[[Action, List[str]], ParsedCommand]]] = {
+    Action.GET.value     : (Action.GET, 1, 1, _build_key),
+    Action.SET.value     : (Action.SET, 2, 4, _build_set),
+    Action.UNSET.value   : (Action.UNSET, 1, 1, _build_key),
+    Action.COUNTS.value  : (Action.COUNTS, 1, 4, _build_counts),
+    Action.FIND.value    : (Action.FIND, 1, 5, _build_find),
+    Action.END.value     : (Action.END, 0, 0, _build_command),
+    Action.BEGIN.value   : (Action.BEGIN, 0, 0, _build_command),
+    Action.ROLLBACK.value: (Action.ROLLBACK, 0, 0, _build_command),
+    Action.COMMIT.value  : (Action.COMMIT, 0, 0, _build_command),
+    Action.HELP.value    : (Action.HELP, 0, 0, _build_command),
+    Action.STATS.value   : (Action.STATS, 0, 1, _build_stats),
+    Action.MEMORY.value  : (Action.MEMORY, 0, 0, _build_command),
+    Action.TTL.value     : (Action.TTL, 1, 1, _build_key),
+    Action.MSET.value    : (Action.MSET, 2, _ANY_NUMBER, _build_pairs),
+    Action.MGET.value    : (Action.MGET, 1, _ANY_NUMBER, _build_keys),
+    Action.MUNSET.value  : (Action.MUNSET, 1, _ANY_NUMBER, _build_keys),
+    Action.SCAN.value    : (Action.SCAN, 1, 1, _build_key),
+    Action.RANGE.value   : (Action.RANGE, 2, 2, _build_key_value),
+    Action.KEYS.value    : (Action.KEYS, 0, 1, _build_optional_key),
+    Action.SAVE.value    : (Action.SAVE, 0, 0, _build_command),
+    Action.BGSAVE.value  : (Action.BGSAVE, 0, 0, _build_command),
+    Action.WATCH.value   : (Action.WATCH, 1, _ANY_NUMBER, _build_keys),
+    Action.UNWATCH.value : (Action.UNWATCH, 0, 0, _build_command),
+    Action.MULTI.value   : (Action.MULTI, 0, 0, _build_command),
+    Action.EXEC.value    : (Action.EXEC, 0, 0, _build_command),
+    Action.DISCARD.value : (Action.DISCARD, 0, 0, _build_command),
+    Action.INCR.value    : (Action.INCR, 1, 1, _build_increment),
+    Action.DECR.value    : (Action.DECR, 1, 1, _build_increment),
+    Action.INCRBY.value  : (Action.INCRBY, 2, 2, _build_increment),
+    Action.DECRBY.value  : (Action.DECRBY, 2, 2, _build_increment),
+    Action.SLOWLOG.value : (Action.SLOWLOG, 1, 2, _build_slowlog),
+    Action.PROFILE.value : (Action.PROFILE, 1, 2, _build_profile),
+    INFO_COMMAND         : (Action.STATS, 0, 1, _build_stats),
+}
+
+# Сообщение об ошибке, если передано меньше аргументов, чем нужно: индекс - число переданных аргументов.
+_MISSING_ARGUMENT_TEXT = (WrongInputText.NO_ARGUMENT_NAME.value, WrongInputText.NO_ARGUMENT_VALUE.value)
+
+# Строка с неизвестной командой длиннее _MAX_TOKENS слов считается ошибкой формата.
+_MAX_TOKENS = 3
+
+
+def parse_command(input_string: str) -> ParsedCommand:
+    """
+    Разобрать строку с командой за один поиск по таблице COMMAND_TABLE.
+    Если строка невалидна - возбуждает исключение WrongInputException.
+    >>>parse_command('SET A 5')
+    ParsedCommand(command=<Action.SET: 'SET'>, key='A', value='5', ttl=None, arguments=())
+    :param input_string:
+    :return:
+    """
+    arguments = input_string.split()
+    if not arguments:
+        raise WrongInputException(message=WrongInputText.WRONG_INPUT_FORMAT.value)
+    entry = COMMAND_TABLE.get(arguments[0].upper())
+    if entry is None:
+        if len(arguments) > _MAX_TOKENS:
+            raise WrongInputException(message=WrongInputText.WRONG_INPUT_FORMAT.value)
+        raise WrongInputException(message=WrongInputText.UNKNOWN_COMMAND.value)
+    action, min_arguments, max_arguments, build = entry
+    given = len(arguments) - 1
+    if min_arguments <= given <= max_arguments:
+        return build(action, arguments)
+    if given < min_arguments:
+        raise WrongInputException(action, message=_MISSING_ARGUMENT_TEXT[given])
+    raise WrongInputException(action, message=WrongInputText.WRONG_INPUT_FORMAT.value)
+
+
 class InputFilter:
     """
     Класс предназначенный для форматирования входящего текста в понятные
@@ -19,58 +242,32 @@ class InputFilter:
     def __init__(self, input_string):
         self.input_string = input_string
         self.error = None
+        self.parsed_command = None
 
     def is_valid(self) -> bool:
         """
-        Парсинг полученной строки при инициализации, и генерация словаря с
-        параметрами (self.cleaned_data), если строка валидна.
+        Парсинг полученной строки при инициализации, и генерация разобранной
+        команды (self.parsed_command), если строка валидна.
         Возвращает True если строка валидна, и False если нет.
         :return bool:
         """
-        logging.debug(f'Проверка валидности следующей строки "{self.input_string}"')
-        arguments = self.input_string.split()
-        structured_command = {
-            'command': None,
-            'key'    : None,
-            'value'  : None,
-        }
-        if len(arguments) in [1, 2, 3]:
-            for action in Action:
-                if arguments[0].upper() == action.value:
-
-                    structured_command['command'] = action
-
-                    if len(arguments) == 1:
-                        if action in [Action.GET, Action.UNSET,
-                                      Action.COUNTS, Action.FIND]:
-                            self.error = WrongInputException(action, message=WrongInputText.NO_ARGUMENT_NAME.value)
-                        elif action in [Action.SET, ]:
-                            self.error = WrongInputException(action, message=WrongInputText.NO_ARGUMENT_NAME.value)
-
-                    elif len(arguments) == 2:
-                        if action in [Action.GET, Action.UNSET]:
-                            structured_command['key'] = arguments[1]
-                        elif action in [Action.COUNTS, Action.FIND]:
-                            structured_command['value'] = arguments[1]
-                        elif action in [Action.SET, ]:
-                            self.error = WrongInputException(action, message=WrongInputText.NO_ARGUMENT_VALUE.value)
-                        else:
-                            self.error = WrongInputException(action, message=WrongInputText.WRONG_INPUT_FORMAT.value)
-                    elif len(arguments) == 3:
-                        if action in [Action.SET, ]:
-                            structured_command['key'] = arguments[1]
-                            structured_command['value'] = arguments[2]
-                        else:
-                            self.error = WrongInputException(message=WrongInputText.WRONG_INPUT_FORMAT.value)
-
-            if not structured_command['command']:
-                self.error = WrongInputException(message=WrongInputText.UNKNOWN_COMMAND.value)
-        else:
-            self.error = WrongInputException(message=WrongInputText.WRONG_INPUT_FORMAT.value)
-
-        if self.error:
+        logger.debug('Проверка валидности следующей строки "%s"', self.input_string)
+        try:
+            self.parsed_command = parse_command(self.input_string)
+        except WrongInputException as e:
+            self.error = e
             return False
-        else:
-            logger.debug(f'Строка валидна.')
-            self.cleaned_data = structured_command.copy()
-            return True
+        logger.debug('Строка валидна.')
+        return True
+
+    @property
+    def cleaned_data(self) -> dict:
+        """
+        Параметры разобранной команды в виде словаря.
+        :return:
+        """
+        return {
+            'command': self.parsed_command.command,
+            'key'    : self.parsed_command.key,
+            'value'  : self.parsed_command.value,
+        }
@@ -1,54 +1,385 @@
+import time
+
+# Момент начала выполнения main.py, от которого отсчитывается время запуска:
+# импорт модулей, восстановление данных и подготовка к приёму первой команды.
+STARTED = time.perf_counter()
+
+from typing import BinaryIO, Callable, Iterator, Optional, TextIO, Tuple, Union
+import argparse
 import logging
+import logging.handlers
+import sys
 
 from constants import Action, WrongInputException, HELP_TEXT
 from custom_database import CustomDataBase
-from input_filter import InputFilter
+from input_filter import parse_command
+from profiling import SLOWLOG_MAX_LEN, SLOWLOG_THRESHOLD_US, SlowLog
+
+GOODBYE_TEXT = "База данных заканчивает работу."
+
+# Бюджет времени запуска в секундах по умолчанию: превышение сообщается в stderr.
+STARTUP_BUDGET = 1.0
+
+# Размер буферов чтения и записи в пакетном режиме.
+BATCH_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Журнал app.log дописывается между запусками и при превышении размера переименовывается
+# в app.log.1 ... app.log.N, чтобы не расти без ограничений.
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+
+def parse_arguments(argv=None) -> argparse.Namespace:
+    """
+    Разобрать параметры командной строки.
+    :param argv:
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Простейшая база данных с поддержкой транзакций.')
+    parser.add_argument('--batch', nargs='?', const='-', metavar='FILE',
+                        help='Пакетный режим: выполнить команды из файла FILE '
+                             'или из стандартного ввода, если файл не указан.')
+    parser.add_argument('--serve', action='store_true',
+                        help='Запустить TCP-сервер вместо интерактивного режима.')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес TCP-сервера.')
+    parser.add_argument('--port', type=int, default=7878, help='Порт TCP-сервера.')
+    parser.add_argument('--log-level', default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                        help='Уровень журналирования в app.log.')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Считать количество вызовов и задержки команд (команда STATS).')
+    parser.add_argument('--data-dir',
+                        help='Каталог для журнала предзаписи и снимков. '
+                             'Без него данные хранятся только в оперативной памяти.')
+    parser.add_argument('--fsync', choices=['always', 'interval', 'never'], default='interval',
+                        help='Политика сброса журнала на диск.')
+    parser.add_argument('--fsync-interval', type=float, default=1.0,
+                        help='Интервал группового fsync в секундах для политики interval.')
+    parser.add_argument('--snapshot-every', type=int, default=1000000,
+                        help='Количество записей журнала, после которого пишется новый снимок.')
+    parser.add_argument('--compact', action='store_true',
+                        help='Хранить значения в виде идентификаторов словаря значений '
+                             '(экономия памяти при небольшом количестве различных значений).')
+    parser.add_argument('--mmap', metavar='FILE',
+                        help='Хранить данные в отображённой в память хеш-таблице в файле FILE '
+                             '(для данных, не помещающихся в оперативную память).')
+    parser.add_argument('--maxmemory', type=int, metavar='BYTES',
+                        help='Бюджет памяти для данных: при превышении ключи вытесняются.')
+    parser.add_argument('--maxmemory-policy', choices=['lru', 'lfu', 'random'], default='lru',
+                        help='Политика вытеснения ключей при превышении --maxmemory.')
+    parser.add_argument('--shards', type=int,
+                        help='Разделить ключи по хешу между указанным количеством процессов.')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET, metavar='SECONDS',
+                        help='Допустимое время запуска (до готовности к первой команде), '
+                             'при превышении выводится предупреждение.')
+    parser.add_argument('--replicaof', type=parse_address, metavar='HOST:PORT',
+                        help='Работать репликой ведущего сервера HOST:PORT: получать его изменения '
+                             'и выполнять только команды чтения (вместе с --serve).')
+    parser.add_argument('--slowlog-threshold', type=int, default=SLOWLOG_THRESHOLD_US, metavar='MICROSECONDS',
+                        help='Команды дольше порога попадают в журнал медленных команд (SLOWLOG); '
+                             '0 - все команды, отрицательное значение выключает журнал.')
+    parser.add_argument('--slowlog-max-len', type=int, default=SLOWLOG_MAX_LEN,
+                        help='Количество хранимых записей журнала медленных команд.')
+    parser.add_argument('--load', metavar='FILE',
+                        help='Перед началом работы массово загрузить пары "ключ,значение" '
+                             'из CSV-файла FILE (первые два столбца).')
+    parser.add_argument('--load-workers', type=int, default=1, metavar='N',
+                        help='Количество процессов для разбора большого CSV-файла --load '
+                             '(поля в кавычках не должны содержать переводов строк).')
+    arguments = parser.parse_args(argv)
+    if arguments.replicaof and not arguments.serve:
+        parser.error('--replicaof можно использовать только вместе с --serve.')
+    if arguments.shards and (arguments.data_dir or arguments.serve or arguments.metrics or arguments.maxmemory):
+        parser.error('--shards нельзя использовать вместе с --data-dir, --serve, --metrics и --maxmemory.')
+    if arguments.mmap and (arguments.compact or arguments.shards):
+        parser.error('--mmap нельзя использовать вместе с --compact и --shards.')
+    return arguments
 
 
-def main():
+def parse_address(address: str) -> Tuple[str, int]:
+    """
+    Разобрать адрес вида HOST:PORT.
+    :param address:
+    :return:
+    """
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise argparse.ArgumentTypeError(f'адрес должен иметь вид HOST:PORT, получено {address!r}')
+    return host, int(port)
+
+
+def main(argv=None):
     """
     Основная функция для обработки логики с предоставлением пользователю простейшего
     интерфейса, фильтрацией команд пользователя, и исполнения этих команд.
     :return:
     """
-    logging.basicConfig(filename='app.log',
-                        filemode='w',
+    arguments = parse_arguments(argv)
+    logging.basicConfig(handlers=[logging.handlers.RotatingFileHandler(
+                            'app.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)],
                         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                        level=logging.DEBUG)
+                        level=getattr(logging, arguments.log_level))
     logger = logging.getLogger(__name__)
 
-    database = CustomDataBase()
+    storage = None
+    if arguments.shards:
+        from sharding import ShardedDataBase
+        engine = CustomDataBase
+        if arguments.compact:
+            from compact_database import CompactDataBase
+            engine = CompactDataBase
+        database = ShardedDataBase(arguments.shards, engine)
+    elif arguments.data_dir:
+        from persistence import FsyncPolicy, PersistentStorage
+        storage = PersistentStorage(arguments.data_dir,
+                                    fsync_policy=FsyncPolicy(arguments.fsync),
+                                    fsync_interval=arguments.fsync_interval,
+                                    snapshot_every=arguments.snapshot_every)
+        database = storage.open(new_database(arguments))
+    else:
+        database = new_database(arguments)
+    database.slowlog = SlowLog(arguments.slowlog_threshold, arguments.slowlog_max_len)
+    if arguments.metrics:
+        database.enable_metrics()
+    if arguments.maxmemory:
+        database.enable_eviction(arguments.maxmemory, arguments.maxmemory_policy)
+    if arguments.load:
+        load_file(database, arguments.load, arguments.load_workers)
+    report_startup(time.perf_counter() - STARTED, arguments.startup_budget,
+                   verbose=bool(arguments.batch or arguments.serve), logger=logger)
+
+    try:
+        if arguments.serve:
+            run_server(database, arguments.host, arguments.port, arguments.replicaof)
+        elif arguments.batch:
+            run_batch_from(database, arguments.batch, logger)
+        else:
+            run_interactive(database, logger)
+    finally:
+        if storage:
+            storage.close()
+        if arguments.shards or arguments.mmap:
+            database.close()
+
 
+def report_startup(elapsed: float, budget: float, verbose: bool, logger: logging.Logger) -> None:
+    """
+    Сообщить время запуска: в журнал приложения всегда, в stderr - в пакетном и сетевом
+    режимах (verbose) или при превышении бюджета budget.
+    :param elapsed:
+    :param budget:
+    :param verbose:
+    :param logger:
+    :return:
+    """
+    logger.info('Запуск занял %.3f с (бюджет %.3f с).', elapsed, budget)
+    if elapsed > budget:
+        logger.warning('Время запуска %.3f с превысило бюджет %.3f с.', elapsed, budget)
+        print(f'Внимание: запуск занял {elapsed:.3f} с, бюджет {budget:.3f} с.', file=sys.stderr)
+    elif verbose:
+        print(f'Запуск: {elapsed:.3f} с (бюджет {budget:.3f} с)', file=sys.stderr)
+
+
+def new_database(arguments: argparse.Namespace) -> CustomDataBase:
+    """
+    Создать движок базы данных, выбранный параметрами командной строки.
+    :param arguments:
+    :return:
+    """
+    if arguments.mmap:
+        from mmap_database import MmapDataBase
+        return MmapDataBase(arguments.mmap)
+    if arguments.compact:
+        from compact_database import CompactDataBase
+        return CompactDataBase()
+    return CustomDataBase()
+
+
+def load_file(database: CustomDataBase, path: str, workers: int) -> None:
+    """
+    Массово загрузить CSV-файл path и сообщить в stderr количество пар и скорость загрузки.
+    :param database:
+    :param path:
+    :param workers:
+    :return:
+    """
+    from bulk_load import load_csv
+
+    started = time.perf_counter()
+    loaded = load_csv(database, path, workers=workers)
+    elapsed = time.perf_counter() - started
+    rate = loaded / elapsed if elapsed else float('inf')
+    print(f'Загружено пар: {loaded} за {elapsed:.3f} с ({rate:.0f} пар/с)', file=sys.stderr)
+
+
+def execute_line(database: CustomDataBase, line: str,
+                 logger: logging.Logger) -> Tuple[Union[str, Iterator[str], None], bool]:
+    """
+    Выполнить одну строку с командой пользователя.
+    Возвращает текст для вывода (None, если выводить нечего) и признак завершения работы.
+    Потоковый результат (FIND) возвращается итератором фрагментов текста,
+    который нужно вывести функцией write_output до следующей команды.
+    Разбор и выполнение строки замеряются для журнала медленных команд (SLOWLOG)
+    и, после PROFILE START, профилируются.
+    :param database:
+    :param line:
+    :param logger:
+    :return:
+    """
+    started = time.perf_counter_ns()
+    profiler = database.profiler
+    if profiler is None:
+        result = run_line(database, line, logger)
+    else:
+        with profiler:
+            result = run_line(database, line, logger)
+    database.slowlog.record(line, time.perf_counter_ns() - started, database.transaction_depth)
+    return result
+
+
+def run_line(database: CustomDataBase, line: str,
+             logger: logging.Logger) -> Tuple[Union[str, Iterator[str], None], bool]:
+    """
+    Разобрать и выполнить строку с командой. Результат совпадает с execute_line.
+    :param database:
+    :param line:
+    :param logger:
+    :return:
+    """
+    try:
+        parsed_command = parse_command(line)
+
+        if parsed_command.command is Action.END:
+            return GOODBYE_TEXT, True
+        elif parsed_command.command is Action.HELP:
+            return HELP_TEXT, False
+
+        result = database.execute_command(*parsed_command)
+
+        if isinstance(result, Iterator):
+            logger.info("Результат выполненной команды выводится по частям.")
+            return result, False
+        elif result is not None:
+            logger.info("Результат выполненной команды: %s", result)
+            return str(result), False
+
+    except WrongInputException as e:
+        logger.warning(e)
+        return str(e), False
+
+    return None, False
+
+
+def write_output(write: Callable[[str], object], output: Union[str, Iterator[str]]) -> None:
+    """
+    Вывести результат команды и перевод строки. Потоковый результат выводится по мере
+    чтения фрагментов, поэтому объём памяти не зависит от размера ответа.
+    :param write:
+    :param output:
+    :return:
+    """
+    if isinstance(output, str):
+        write(output)
+    else:
+        for chunk in output:
+            write(chunk)
+    write('\n')
+
+
+def run_interactive(database: CustomDataBase, logger: logging.Logger) -> None:
+    """
+    Интерактивный цикл: чтение команд пользователя и вывод результатов.
+    :param database:
+    :param logger:
+    :return:
+    """
     while True:
         try:
             user_input = input("> ")
         except EOFError:
-            print("База данных заканчивает работу.")
+            print(GOODBYE_TEXT)
             break
 
-        try:
-            input_filter = InputFilter(user_input)
+        output, stop = execute_line(database, user_input, logger)
+        if output is not None:
+            write_output(sys.stdout.write, output)
+        if stop:
+            break
 
-            if input_filter.is_valid():
-                if input_filter.cleaned_data['command'] is Action.END:
-                    print("База данных заканчивает работу.")
-                    break
-                elif input_filter.cleaned_data['command'] is Action.HELP:
-                    print(HELP_TEXT)
-                    continue
 
-                result = database.execute_command(**input_filter.cleaned_data)
+def run_batch(database: CustomDataBase, source: BinaryIO, output: TextIO,
+              logger: logging.Logger, encoding: str = 'utf-8') -> int:
+    """
+    Пакетный режим: выполнить все команды из source без приглашения к вводу.
+    Вывод совпадает с выводом интерактивного цикла (за исключением приглашения "> ")
+    и накапливается в буфере output. Возвращает количество выполненных команд.
+    :param database:
+    :param source: файл, открытый в двоичном режиме с крупным буфером чтения.
+    :param output:
+    :param logger:
+    :param encoding:
+    :return:
+    """
+    write = output.write
+    executed = 0
+    for raw_line in source:
+        line = raw_line.decode(encoding)
+        if line.endswith('\n'):
+            line = line[:-1]
+        executed += 1
+        text, stop = execute_line(database, line, logger)
+        if text is not None:
+            write_output(write, text)
+        if stop:
+            break
+    else:
+        write(GOODBYE_TEXT)
+        write('\n')
+    output.flush()
+    return executed
 
-                if result is not None:
-                    logger.info(f"Результат выполненной команды: {result}")
-                    print(result)
 
-            else:
-                raise input_filter.error
+def run_batch_from(database: CustomDataBase, path: str, logger: logging.Logger) -> None:
+    """
+    Запустить пакетный режим для файла path ('-' - стандартный ввод)
+    и сообщить в stderr скорость обработки команд.
+    :param database:
+    :param path:
+    :param logger:
+    :return:
+    """
+    if path == '-':
+        source = open(sys.stdin.fileno(), 'rb', buffering=BATCH_BUFFER_SIZE, closefd=False)
+    else:
+        source = open(path, 'rb', buffering=BATCH_BUFFER_SIZE)
+    output = open(sys.stdout.fileno(), 'w', encoding=sys.stdout.encoding,
+                  buffering=BATCH_BUFFER_SIZE, closefd=False)
+    started = time.perf_counter()
+    with source, output:
+        executed = run_batch(database, source, output, logger, encoding=sys.stdin.encoding or 'utf-8')
+    elapsed = time.perf_counter() - started
+    rate = executed / elapsed if elapsed else float('inf')
+    print(f'Выполнено команд: {executed} за {elapsed:.3f} с ({rate:.0f} команд/с)', file=sys.stderr)
+
+
+def run_server(database: CustomDataBase, host: str, port: int,
+               replica_of: Optional[Tuple[str, int]] = None) -> None:
+    """
+    Запустить асинхронный TCP-сервер и работать до прерывания с клавиатуры.
+    :param database:
+    :param host:
+    :param port:
+    :param replica_of: адрес ведущего сервера, если сервер работает репликой.
+    :return:
+    """
+    import asyncio
+    from server import DatabaseServer
 
-        except WrongInputException as e:
-            logger.warning(e)
-            print(e)
+    print(f'Сервер слушает {host}:{port}', file=sys.stderr)
+    try:
+        asyncio.run(DatabaseServer(database, host, port, replica_of=replica_of).serve_forever())
+    except KeyboardInterrupt:
+        print(GOODBYE_TEXT, file=sys.stderr)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,129 @@
+from typing import Any, Dict, List
+import json
+
+# Количество подкорзин на каждую степень двойки: относительная погрешность перцентилей до 25%.
+_SUB_BUCKET_BITS = 2
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+
+
+def _bucket_index(nanoseconds: int) -> int:
+    bits = nanoseconds.bit_length()
+    if bits <= _SUB_BUCKET_BITS:
+        return nanoseconds
+    shift = bits - _SUB_BUCKET_BITS - 1
+    return (shift + 1) * _SUB_BUCKETS + ((nanoseconds >> shift) & (_SUB_BUCKETS - 1))
+
+
+def _bucket_upper_bound(index: int) -> int:
+    if index < _SUB_BUCKETS:
+        return index
+    shift = index // _SUB_BUCKETS - 1
+    return (((_SUB_BUCKETS + index % _SUB_BUCKETS) + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек с логарифмическими корзинами.
+    Запись - O(1), вычисление перцентиля - O(количество корзин).
+    >>>histogram = LatencyHistogram()
+    >>>histogram.record(1500)
+    >>>histogram.percentile(50)
+    1535
+    """
+
+    __slots__ = ('buckets', 'count', 'total')
+
+    def __init__(self) -> None:
+        self.buckets: List[int] = []
+        self.count = 0
+        self.total = 0
+
+    def record(self, nanoseconds: int) -> None:
+        index = _bucket_index(nanoseconds)
+        buckets = self.buckets
+        if index >= len(buckets):
+            buckets.extend([0] * (index + 1 - len(buckets)))
+        buckets[index] += 1
+        self.count += 1
+        self.total += nanoseconds
+
+    def percentile(self, percent: float) -> int:
+        """
+        Вернуть верхнюю границу корзины, в которую попадает указанный перцентиль, в наносекундах.
+        :param percent:
+        :return:
+        """
+        if not self.count:
+            return 0
+        threshold = self.count * percent / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= threshold:
+                return _bucket_upper_bound(index)
+        return _bucket_upper_bound(len(self.buckets) - 1)
+
+
+class Metrics:
+    """
+    Счётчики вызовов, ошибок и гистограммы задержек по командам.
+    Ключ - значение Action (строка), чтобы результат сразу сериализовался в JSON.
+    """
+
+    def __init__(self) -> None:
+        self.calls: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.latency: Dict[str, LatencyHistogram] = {}
+
+    def record(self, command: str, nanoseconds: int, error: bool = False) -> None:
+        histogram = self.latency.get(command)
+        if histogram is None:
+            histogram = self.latency[command] = LatencyHistogram()
+            self.calls[command] = 0
+            self.errors[command] = 0
+        histogram.record(nanoseconds)
+        self.calls[command] += 1
+        if error:
+            self.errors[command] += 1
+
+    def commands(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Сводка по командам: количество вызовов, ошибок и задержки в микросекундах.
+        :return:
+        """
+        return {
+            command: {
+                'calls'  : self.calls[command],
+                'errors' : self.errors[command],
+                'mean_us': histogram.total / histogram.count / 1000,
+                'p50_us' : histogram.percentile(50) / 1000,
+                'p99_us' : histogram.percentile(99) / 1000,
+            }
+            for command, histogram in self.latency.items()
+        }
+
+
+def format_stats(stats: Dict[str, Any], as_json: bool = False) -> str:
+    """
+    Представить статистику базы данных в виде текста "имя: значение" по строке на показатель
+    или в виде JSON для машинной обработки.
+    :param stats:
+    :param as_json:
+    :return:
+    """
+    if as_json:
+        return json.dumps(stats, ensure_ascii=False, sort_keys=True)
+    lines = []
+    for name, value in stats.items():
+        if name == 'commands':
+            continue
+        lines.append(f'{name}: {value}')
+    commands = stats.get('commands')
+    if commands is None:
+        lines.append('commands: instrumentation disabled')
+    else:
+        for command, summary in commands.items():
+            lines.append(f'command_{command.lower()}: calls={summary["calls"]} errors={summary["errors"]} '
+                         f'mean_us={summary["mean_us"]:.2f} p50_us={summary["p50_us"]:.2f} '
+                         f'p99_us={summary["p99_us"]:.2f}')
+    return '\n'.join(lines)
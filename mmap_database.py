@@ -0,0 +1,623 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import logging
+import mmap
+import os
+import shutil
+import struct
+import zlib
+
+from constants import Action, WrongInputException, WrongInputText
+from custom_database import CustomDataBase, group_by_value
+from ordered_index import Number, parse_number
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b'STDBIDX1'
+DATA_MAGIC = b'STDBDAT1'
+
+# Суффикс файла с записями ключей и значений рядом с файлом индекса.
+DATA_FILE_SUFFIX = '.data'
+
+# Заголовок файла индекса: сигнатура, количество ячеек, живые ключи, надгробия, состояние.
+_INDEX_HEADER = struct.Struct('<8sQQQQ')
+# Заголовок файла данных: сигнатура, конец занятой области, байты удалённых записей.
+_DATA_HEADER = struct.Struct('<8sQQ')
+# Ячейка индекса: смещение записи в файле данных и crc32 ключа.
+_SLOT = struct.Struct('<QI')
+# Заголовок записи: длина ключа, место под значение, длина значения. Далее ключ и значение.
+_RECORD = struct.Struct('<III')
+
+# Смещения, которые не могут принадлежать записи (записи начинаются после заголовка).
+_EMPTY = 0
+_TOMBSTONE = 1
+
+# Состояние файлов: CLEAN - закрыты корректно, DIRTY - открыты или работа была прервана.
+_CLEAN = 0
+_DIRTY = 1
+
+# Начальное количество ячеек индекса (степень двойки) и начальный размер файла данных.
+MIN_CAPACITY = 1024
+MIN_DATA_SIZE = 64 * 1024
+
+# Суффикс копии файлов таблицы, из которой пишется фоновый снимок.
+SNAPSHOT_COPY_SUFFIX = '.bgsave'
+
+# Место под значение выравнивается, чтобы небольшой рост значения не требовал новой записи.
+VALUE_ALIGNMENT = 8
+
+
+def _key_hash(key_bytes: bytes) -> int:
+    # hash() строк различается между процессами, а индекс хранится в файле.
+    return zlib.crc32(key_bytes)
+
+
+def _create_files(path: str, data_path: str, capacity: int) -> None:
+    with open(path, 'wb') as file:
+        file.write(_INDEX_HEADER.pack(INDEX_MAGIC, capacity, 0, 0, _CLEAN))
+        file.truncate(_INDEX_HEADER.size + capacity * _SLOT.size)
+    with open(data_path, 'wb') as file:
+        file.write(_DATA_HEADER.pack(DATA_MAGIC, _DATA_HEADER.size, 0))
+        file.truncate(MIN_DATA_SIZE)
+
+
+def _live_offsets(index: mmap.mmap, capacity: int) -> Iterator[int]:
+    for position in range(_INDEX_HEADER.size, _INDEX_HEADER.size + capacity * _SLOT.size, _SLOT.size):
+        offset = _SLOT.unpack_from(index, position)[0]
+        if offset > _TOMBSTONE:
+            yield offset
+
+
+class MmapHashTable(Mapping):
+    """
+    Хеш-таблица с открытой адресацией (линейное пробирование) в отображённых в память файлах.
+    Файл индекса path хранит ячейки "смещение записи, crc32 ключа", файл path + '.data' -
+    записи с ключами и значениями. Данные читаются прямо из отображения, поэтому
+    в оперативной памяти находятся только используемые страницы файлов.
+    Для чтения ведёт себя как dict, изменяется методами assign/remove.
+    Значение перезаписывается на месте, если помещается в место прежнего значения,
+    удалённые ключи помечаются надгробиями. Когда занято больше MAX_LOAD ячеек
+    или удалённые записи занимают больше половины файла данных, оба файла
+    перестраиваются: живые записи переписываются в новые файлы.
+    Файлы не защищены от сбоев: после аварийного завершения таблица открывается пустой
+    (для долговременного хранения используется persistence.PersistentStorage).
+    >>>table = MmapHashTable('data.idx')
+    >>>table.assign('A', '5')
+    >>>table['A']
+    '5'
+    >>>table.close()
+    """
+
+    # Максимальная доля занятых (живыми ключами и надгробиями) ячеек индекса.
+    MAX_LOAD = 0.7
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.data_path = path + DATA_FILE_SUFFIX
+        self.temporary = False
+        if not (os.path.exists(path) and os.path.exists(self.data_path)):
+            _create_files(path, self.data_path, MIN_CAPACITY)
+        self._map()
+        if self._state != _CLEAN:
+            logger.warning('Файл %s не был корректно закрыт, таблица создаётся заново.', path)
+            self._unmap()
+            _create_files(path, self.data_path, MIN_CAPACITY)
+            self._map()
+        self._write_headers(_DIRTY)
+        logger.debug('Открыта таблица %s: ключей %s, ячеек %s.', path, self._live, self._capacity)
+
+    def _map(self) -> None:
+        self._index_file = open(self.path, 'r+b')
+        self._data_file = open(self.data_path, 'r+b')
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+        self._data = mmap.mmap(self._data_file.fileno(), 0)
+        self._view = memoryview(self._data)
+        magic, self._capacity, self._live, self._tombstones, self._state = _INDEX_HEADER.unpack_from(self._index)
+        data_magic, self._end, self._dead = _DATA_HEADER.unpack_from(self._data)
+        if magic != INDEX_MAGIC or data_magic != DATA_MAGIC:
+            self._unmap()
+            raise ValueError(f'Файл {self.path} не является хеш-таблицей базы данных.')
+
+    def _unmap(self) -> None:
+        self._view.release()
+        self._index.close()
+        self._data.close()
+        self._index_file.close()
+        self._data_file.close()
+
+    def _write_headers(self, state: int) -> None:
+        _INDEX_HEADER.pack_into(self._index, 0, INDEX_MAGIC, self._capacity, self._live, self._tombstones, state)
+        _DATA_HEADER.pack_into(self._data, 0, DATA_MAGIC, self._end, self._dead)
+
+    def _lookup(self, key_bytes: bytes, key_hash: int) -> Tuple[int, int]:
+        """
+        Найти ячейку ключа. Возвращает (номер ячейки, смещение записи), если ключ есть,
+        иначе (номер ячейки для вставки, _EMPTY). Сложность - O(1) в среднем.
+        :param key_bytes:
+        :param key_hash:
+        :return:
+        """
+        index = self._index
+        data = self._data
+        mask = self._capacity - 1
+        slot = key_hash & mask
+        free_slot = -1
+        key_length = len(key_bytes)
+        while True:
+            offset, slot_hash = _SLOT.unpack_from(index, _INDEX_HEADER.size + slot * _SLOT.size)
+            if offset == _EMPTY:
+                return (slot if free_slot < 0 else free_slot), _EMPTY
+            if offset == _TOMBSTONE:
+                if free_slot < 0:
+                    free_slot = slot
+            elif slot_hash == key_hash:
+                start = offset + _RECORD.size
+                if _RECORD.unpack_from(data, offset)[0] == key_length and data[start:start + key_length] == key_bytes:
+                    return slot, offset
+            slot = (slot + 1) & mask
+
+    def _slots(self) -> Iterator[int]:
+        """
+        Смещения всех живых записей в порядке ячеек индекса.
+        :return:
+        """
+        return _live_offsets(self._index, self._capacity)
+
+    def _record(self, offset: int) -> Tuple[int, int, int]:
+        """
+        Вернуть (начало ключа, начало значения, длину значения) записи по смещению.
+        :param offset:
+        :return:
+        """
+        key_length, _, value_length = _RECORD.unpack_from(self._data, offset)
+        key_start = offset + _RECORD.size
+        return key_start, key_start + key_length, value_length
+
+    def value_view(self, key: str) -> Optional[memoryview]:
+        """
+        Вернуть значение ключа в кодировке UTF-8 как memoryview отображения без копирования
+        или None, если ключа нет. Представление действительно до следующего изменения таблицы
+        и должно быть освобождено до него (release), иначе отображение нельзя будет увеличить.
+        :param key:
+        :return:
+        """
+        key_bytes = key.encode()
+        offset = self._lookup(key_bytes, _key_hash(key_bytes))[1]
+        if offset == _EMPTY:
+            return None
+        _, value_start, value_length = self._record(offset)
+        return self._view[value_start:value_start + value_length]
+
+    def __getitem__(self, key: str) -> str:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        key_bytes = key.encode()
+        offset = self._lookup(key_bytes, _key_hash(key_bytes))[1]
+        if offset == _EMPTY:
+            return default
+        _, value_start, value_length = self._record(offset)
+        # Строка декодируется прямо из отображения, без промежуточного объекта bytes.
+        return str(self._view[value_start:value_start + value_length], 'utf-8')
+
+    def __contains__(self, key: object) -> bool:
+        key_bytes = key.encode()
+        return self._lookup(key_bytes, _key_hash(key_bytes))[1] != _EMPTY
+
+    def __iter__(self) -> Iterator[str]:
+        view = self._view
+        for offset in self._slots():
+            key_start, value_start, _ = self._record(offset)
+            yield str(view[key_start:value_start], 'utf-8')
+
+    def __len__(self) -> int:
+        return self._live
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        view = self._view
+        for offset in self._slots():
+            key_start, value_start, value_length = self._record(offset)
+            yield (str(view[key_start:value_start], 'utf-8'),
+                   str(view[value_start:value_start + value_length], 'utf-8'))
+
+    def copy(self) -> Dict[str, str]:
+        return dict(self.items())
+
+    def keys_with(self, value: Any) -> Iterator[str]:
+        """
+        Лениво перебрать ключи со значением value. Сложность - O(n), сравниваются байты в отображении.
+        :param value:
+        :return:
+        """
+        value_bytes = str(value).encode()
+        value_length = len(value_bytes)
+        data = self._data
+        view = self._view
+        for offset in self._slots():
+            key_start, value_start, length = self._record(offset)
+            if length == value_length and data[value_start:value_start + length] == value_bytes:
+                yield str(view[key_start:value_start], 'utf-8')
+
+    def count(self, value: Any) -> int:
+        """
+        Подсчитать ключи со значением value. Сложность - O(n).
+        :param value:
+        :return:
+        """
+        value_bytes = str(value).encode()
+        value_length = len(value_bytes)
+        data = self._data
+        count = 0
+        for offset in self._slots():
+            _, value_start, length = self._record(offset)
+            if length == value_length and data[value_start:value_start + length] == value_bytes:
+                count += 1
+        return count
+
+    def assign(self, key: str, value: Any) -> None:
+        """
+        Записать значение ключа: на месте прежнего значения, если оно помещается,
+        иначе новой записью в конец файла данных.
+        :param key:
+        :param value:
+        :return:
+        """
+        key_bytes = key.encode()
+        value_bytes = str(value).encode()
+        key_hash = _key_hash(key_bytes)
+        slot, offset = self._lookup(key_bytes, key_hash)
+        if offset != _EMPTY:
+            key_length, value_capacity, _ = _RECORD.unpack_from(self._data, offset)
+            if len(value_bytes) <= value_capacity:
+                value_start = offset + _RECORD.size + key_length
+                self._data[value_start:value_start + len(value_bytes)] = value_bytes
+                _RECORD.pack_into(self._data, offset, key_length, value_capacity, len(value_bytes))
+                return
+            self._dead += _RECORD.size + key_length + value_capacity
+        else:
+            if (self._live + self._tombstones + 1) > self._capacity * self.MAX_LOAD:
+                self._rebuild(self._live + 1)
+                slot = self._lookup(key_bytes, key_hash)[0]
+            if _SLOT.unpack_from(self._index, _INDEX_HEADER.size + slot * _SLOT.size)[0] == _TOMBSTONE:
+                self._tombstones -= 1
+            self._live += 1
+        _SLOT.pack_into(self._index, _INDEX_HEADER.size + slot * _SLOT.size,
+                        self._append(key_bytes, value_bytes), key_hash)
+
+    def _append(self, key_bytes: bytes, value_bytes: bytes) -> int:
+        value_capacity = -(-max(len(value_bytes), 1) // VALUE_ALIGNMENT) * VALUE_ALIGNMENT
+        size = _RECORD.size + len(key_bytes) + value_capacity
+        offset = self._end
+        if offset + size > len(self._data):
+            self._grow_data(offset + size)
+        data = self._data
+        _RECORD.pack_into(data, offset, len(key_bytes), value_capacity, len(value_bytes))
+        key_start = offset + _RECORD.size
+        value_start = key_start + len(key_bytes)
+        data[key_start:value_start] = key_bytes
+        data[value_start:value_start + len(value_bytes)] = value_bytes
+        self._end = offset + size
+        return offset
+
+    def _grow_data(self, required: int) -> None:
+        # Отображение нельзя изменить, пока на него есть memoryview.
+        self._view.release()
+        self._data.resize(max(required, len(self._data) * 2))
+        self._view = memoryview(self._data)
+
+    def remove(self, key: str) -> None:
+        key_bytes = key.encode()
+        slot, offset = self._lookup(key_bytes, _key_hash(key_bytes))
+        if offset == _EMPTY:
+            raise KeyError(key)
+        key_length, value_capacity, _ = _RECORD.unpack_from(self._data, offset)
+        _SLOT.pack_into(self._index, _INDEX_HEADER.size + slot * _SLOT.size, _TOMBSTONE, 0)
+        self._live -= 1
+        self._tombstones += 1
+        self._dead += _RECORD.size + key_length + value_capacity
+        if self._dead > MIN_DATA_SIZE and self._dead * 2 > self._end:
+            self._rebuild(self._live)
+
+    def clear(self) -> None:
+        self._unmap()
+        _create_files(self.path, self.data_path, MIN_CAPACITY)
+        self._map()
+        self._write_headers(_DIRTY)
+
+    def _rebuild(self, keys: int) -> None:
+        """
+        Переписать живые записи в новые файлы с индексом, в котором keys ключей
+        занимают не больше половины ячеек. Надгробия и удалённые записи при этом исчезают.
+        Сложность - O(n), амортизированно O(1) на операцию.
+        :param keys:
+        :return:
+        """
+        capacity = MIN_CAPACITY
+        while capacity * self.MAX_LOAD < keys * 2:
+            capacity *= 2
+        old_capacity = self._capacity
+        tmp_path = self.path + '.tmp'
+        tmp_data_path = self.data_path + '.tmp'
+        _create_files(tmp_path, tmp_data_path, capacity)
+        old = self._index_file, self._data_file, self._index, self._data, self._view
+        old_data = self._data
+        offsets = _live_offsets(self._index, old_capacity)
+        self._index_file = open(tmp_path, 'r+b')
+        self._data_file = open(tmp_data_path, 'r+b')
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+        self._data = mmap.mmap(self._data_file.fileno(), 0)
+        self._view = memoryview(self._data)
+        self._capacity = capacity
+        self._tombstones = 0
+        self._end = _DATA_HEADER.size
+        self._dead = 0
+        mask = capacity - 1
+        for offset in offsets:
+            key_length, _, value_length = _RECORD.unpack_from(old_data, offset)
+            key_start = offset + _RECORD.size
+            key_bytes = old_data[key_start:key_start + key_length]
+            value_start = key_start + key_length
+            key_hash = _key_hash(key_bytes)
+            slot = key_hash & mask
+            while _SLOT.unpack_from(self._index, _INDEX_HEADER.size + slot * _SLOT.size)[0] != _EMPTY:
+                slot = (slot + 1) & mask
+            _SLOT.pack_into(self._index, _INDEX_HEADER.size + slot * _SLOT.size,
+                            self._append(key_bytes, old_data[value_start:value_start + value_length]), key_hash)
+        self._write_headers(_DIRTY)
+        index_file, data_file, index, data, view = old
+        view.release()
+        index.close()
+        data.close()
+        index_file.close()
+        data_file.close()
+        os.replace(tmp_data_path, self.data_path)
+        os.replace(tmp_path, self.path)
+        logger.debug('Таблица %s перестроена: ячеек %s -> %s, ключей %s.', self.path, old_capacity, capacity, self._live)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'mmap_capacity'  : self._capacity,
+            'mmap_tombstones': self._tombstones,
+            'mmap_data_bytes': self._end,
+            'mmap_dead_bytes': self._dead,
+        }
+
+    def copy_to(self, path: str, temporary: bool = False) -> 'MmapHashTable':
+        """
+        Скопировать файлы таблицы в path и path + '.data' и открыть копию. Файлы копирует
+        операционная система (shutil.copyfile), данные через память процесса не проходят.
+        Файлы копии с temporary=True удаляются при её закрытии.
+        :param path:
+        :param temporary:
+        :return:
+        """
+        # Копия должна открываться как корректно закрытая таблица.
+        self._write_headers(_CLEAN)
+        try:
+            shutil.copyfile(self.path, path)
+            shutil.copyfile(self.data_path, path + DATA_FILE_SUFFIX)
+        finally:
+            self._write_headers(_DIRTY)
+        copy = MmapHashTable(path)
+        copy.temporary = temporary
+        return copy
+
+    def flush(self) -> None:
+        self._write_headers(_DIRTY)
+        self._index.flush()
+        self._data.flush()
+
+    def close(self) -> None:
+        """
+        Сбросить отображения на диск и закрыть файлы. После этого таблицу можно открыть снова.
+        :return:
+        """
+        self._write_headers(_CLEAN)
+        self._index.flush()
+        self._data.flush()
+        self._unmap()
+        if self.temporary:
+            os.remove(self.path)
+            os.remove(self.data_path)
+
+
+class MmapDataBase(CustomDataBase):
+    """
+    Вариант CustomDataBase, хранящий данные в MmapHashTable в файле path,
+    для наборов данных, не помещающихся в оперативную память.
+    Интерфейс execute_command и транзакции совпадают с CustomDataBase: журналы отката
+    хранят в памяти только исходные значения изменённых в транзакциях ключей.
+    Обратный индекс значений не ведётся, так как занимал бы память пропорционально данным,
+    поэтому COUNTS и FIND просматривают таблицу - O(n).
+    Существующий файл открывается с прежними данными, присваивание database заменяет его содержимое.
+    >>>database = MmapDataBase('data.idx')
+    >>>database.set('A', '5')
+    >>>database.get('A')
+    '5'
+    >>>database.close()
+    """
+
+    # Отображённый файл общий для родителя и дочернего процесса и не копируется при fork:
+    # фоновый снимок пишется из копии файлов таблицы (committed_copy).
+    FORK_SNAPSHOTS = False
+    # Данные не помещаются в память: load записывает в таблицу каждый пакет сразу.
+    LOAD_IN_MEMORY = False
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._table: Optional[MmapHashTable] = None
+        super().__init__()
+
+    def _rebuild_indexes(self) -> None:
+        items = self._database
+        if items is self._table:
+            return
+        if self._table is None:
+            self._table = MmapHashTable(self.path)
+        else:
+            self._table.clear()
+        for key, value in items.items():
+            self._table.assign(key, value)
+        self._database = self._table
+        self._value_index = {}
+
+    def load_grouped(self, groups: Iterable[Tuple[Any, Sequence[str]]]) -> None:
+        if self._table is None:
+            self._table = MmapHashTable(self.path)
+        else:
+            self._table.clear()
+        for value, keys in groups:
+            for key in keys:
+                self._table.assign(key, value)
+        self._database = self._table
+        self._data_replaced()
+
+    def _load_items(self, items: Dict[str, Any]) -> None:
+        # Таблица на диске не умеет вставлять группы, ключи записываются по одному.
+        assign = self._database.assign
+        for key, value in items.items():
+            assign(key, value)
+
+    def committed_groups(self) -> Iterable[Tuple[Any, Iterable[str]]]:
+        return group_by_value(self.iter_committed())
+
+    def committed_copy(self) -> MmapHashTable:
+        """
+        Копия файлов таблицы (MmapHashTable.copy_to), в которой изменения открытых транзакций
+        отменены по журналам отката. Данные не читаются в память процесса, фоновый поток
+        пишет снимок прямо из отображения копии и закрывает её (close удаляет файлы копии).
+        :return:
+        """
+        copy = self._database.copy_to(self.path + SNAPSHOT_COPY_SUFFIX, temporary=True)
+        self._restore_committed(copy.assign, lambda key: key in copy and copy.remove(key))
+        return copy
+
+    def get_encoded(self, key: str) -> memoryview:
+        """
+        Вернуть значение по ключу в кодировке UTF-8 как memoryview отображения без копирования
+        (MmapHashTable.value_view). Проверки и учёт вытеснения совпадают с CustomDataBase.get.
+        Представление нужно освободить (release) до следующего изменения базы данных.
+        :param key:
+        :return:
+        """
+        logger.debug('Получение значения параметра %s из базы данных', key)
+        if self._expiry.deadlines:
+            self._expire_if_due(key)
+        view = self._database.value_view(key)
+        if view is None:
+            logger.warning('Значение %s не найдено в базе данных', key)
+            if self.eviction is not None:
+                self.eviction.misses += 1
+            raise WrongInputException(Action.GET, key=key, message=WrongInputText.NULL.value)
+        if self.eviction is not None:
+            self.eviction.hit(key)
+        return view
+
+    def get(self, key: str) -> Any:
+        # Одно обращение к таблице вместо проверки наличия ключа и чтения значения.
+        with self.get_encoded(key) as view:
+            return str(view, 'utf-8')
+
+    def _store(self, key: str, value: Any) -> None:
+        if self._key_index is not None and key not in self._database:
+            self._key_index.add(key)
+        self._database.assign(key, value)
+
+    def _discard(self, key: str) -> None:
+        self._database.remove(key)
+        if self._key_index is not None:
+            self._key_index.remove(key)
+
+    def counts(self, value: Any) -> int:
+        """
+        Подсчитать количество ключей с указанным значением value.
+        Сложность - O(n), таблица просматривается целиком.
+        :param value:
+        :return:
+        """
+        logger.debug('counts. Поиск сколько раз %s встречается в базе данных.', value)
+        if self._expiry.deadlines:
+            self.expire_due()
+        return self._database.count(value)
+
+    def iter_find(self, value: Any) -> Iterator[str]:
+        """
+        Лениво перебрать ключи, содержащие значение value.
+        Сложность - O(n), таблица просматривается целиком.
+        :param value:
+        :return:
+        """
+        logger.debug('find. Поиск всех ключей для значения %s.', value)
+        if self._expiry.deadlines:
+            self.expire_due()
+        return self._database.keys_with(value)
+
+    def counts_between(self, low: Number, high: Number) -> int:
+        """
+        Подсчитать ключи с числовыми значениями от low до high включительно.
+        Сложность - O(n), таблица просматривается целиком.
+        :param low:
+        :param high:
+        :return:
+        """
+        logger.debug('counts_between. Подсчёт ключей со значениями от %s до %s.', low, high)
+        return len(self._numbers_between(low, high))
+
+    def iter_find_between(self, low: Number, high: Number) -> Iterator[str]:
+        """
+        Лениво перебрать ключи с числовыми значениями от low до high по возрастанию значений.
+        Сложность - O(n + k log k), таблица просматривается целиком.
+        :param low:
+        :param high:
+        :return:
+        """
+        logger.debug('find_between. Поиск ключей со значениями от %s до %s.', low, high)
+        matches = self._numbers_between(low, high)
+        matches.sort(key=lambda match: match[0])
+        return (key for _, key in matches)
+
+    def _numbers_between(self, low: Number, high: Number) -> List[Tuple[Number, str]]:
+        if self._expiry.deadlines:
+            self.expire_due()
+        matches = []
+        for key, value in self._database.items():
+            number = parse_number(value)
+            if number is not None and low <= number <= high:
+                matches.append((number, key))
+        return matches
+
+    def find_page(self, value: Any, cursor: Optional[str] = None,
+                  count: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Страница ключей со значением value после cursor. Интерфейс совпадает с CustomDataBase.find_page.
+        Ключи перебираются по упорядоченному индексу, значение каждого читается из таблицы.
+        :param value:
+        :param cursor:
+        :param count:
+        :return:
+        """
+        logger.debug('find_page. Поиск %s ключей для значения %s после %s.', count, value, cursor)
+        table = self._database
+        value = str(value)
+        return self._scan_page(lambda key: table.get(key) == value, cursor, count or self.KEYS_PAGE_SIZE)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update(self._database.stats())
+        return stats
+
+    def memory_usage(self) -> Dict[str, int]:
+        # Данные находятся в файлах: в памяти из них только используемые страницы.
+        stats = self._database.stats()
+        return self._memory_report(stats['mmap_capacity'] * _SLOT.size + stats['mmap_data_bytes'],
+                                   len(self._database))
+
+    def close(self) -> None:
+        """
+        Закрыть файлы таблицы.
+        :return:
+        """
+        self._table.close()
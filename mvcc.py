@@ -0,0 +1,151 @@
+from bisect import bisect_right
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from custom_database import Change, CustomDataBase
+
+logger = logging.getLogger(__name__)
+
+
+class VersionStore:
+    """
+    Хранилище прежних версий значений для изоляции снимков (snapshot isolation).
+    Последние зафиксированные значения хранит сама CustomDataBase, а VersionStore
+    по подписке на коммиты запоминает старые значения изменённых ключей,
+    пока существует хотя бы один снимок, которому они могут понадобиться.
+    Каждый коммит получает номер (timestamp). Снимок с номером s видит
+    состояние базы данных после коммита s.
+    >>>versions = VersionStore(database)
+    >>>snapshot = versions.acquire_snapshot()
+    >>>database.set('A', '6')
+    >>>versions.read('A', snapshot)
+    '5'
+    >>>versions.release_snapshot(snapshot)
+    """
+
+    def __init__(self, database: CustomDataBase) -> None:
+        self.database = database
+        self.timestamp = 0
+        # Ключ -> список (номер коммита, значение до этого коммита) по возрастанию номеров.
+        self._history: Dict[str, List[Tuple[int, Optional[Any]]]] = {}
+        # Номера коммитов по порядку с изменёнными ключами - для сборки мусора без полного обхода.
+        self._commit_log: Deque[Tuple[int, str]] = deque()
+        # Номер снимка -> количество сеансов, использующих его.
+        self._snapshots: Dict[int, int] = {}
+        database.add_commit_listener(self._on_commit)
+
+    def _on_commit(self, changes: List[Change]) -> None:
+        self.timestamp += 1
+        if not self._snapshots:
+            return
+        timestamp = self.timestamp
+        for key, old_value, _ in changes:
+            self._history.setdefault(key, []).append((timestamp, old_value))
+            self._commit_log.append((timestamp, key))
+
+    def acquire_snapshot(self) -> int:
+        """
+        Зарегистрировать снимок текущего зафиксированного состояния и вернуть его номер.
+        :return:
+        """
+        snapshot = self.timestamp
+        self._snapshots[snapshot] = self._snapshots.get(snapshot, 0) + 1
+        return snapshot
+
+    def release_snapshot(self, snapshot: int) -> None:
+        """
+        Освободить снимок и удалить версии, которые больше не видит ни один снимок.
+        Сложность - O(количество удалённых версий).
+        :param snapshot:
+        :return:
+        """
+        count = self._snapshots[snapshot] - 1
+        if count:
+            self._snapshots[snapshot] = count
+            return
+        del self._snapshots[snapshot]
+        self._collect_garbage()
+
+    def _collect_garbage(self) -> None:
+        # Версия (T, значение) нужна только снимкам с номером меньше T.
+        oldest = min(self._snapshots) if self._snapshots else self.timestamp
+        commit_log = self._commit_log
+        history = self._history
+        collected = 0
+        while commit_log and commit_log[0][0] <= oldest:
+            _, key = commit_log.popleft()
+            versions = history[key]
+            del versions[0]
+            if not versions:
+                del history[key]
+            collected += 1
+        if collected:
+            logger.debug('Удалено устаревших версий: %s', collected)
+
+    def read(self, key: str, snapshot: int) -> Optional[Any]:
+        """
+        Вернуть значение ключа, видимое снимку snapshot, или None, если ключа в снимке нет.
+        Сложность - O(log v), где v - количество версий ключа.
+        :param key:
+        :param snapshot:
+        :return:
+        """
+        versions = self._history.get(key)
+        if versions:
+            position = bisect_right(versions, snapshot, key=lambda version: version[0])
+            if position < len(versions):
+                return versions[position][1]
+        return self.database.database.get(key)
+
+    def changed_since(self, snapshot: int) -> Iterable[str]:
+        """
+        Ключи, изменённые после снимка snapshot.
+        :param snapshot:
+        :return:
+        """
+        return (key for key, versions in self._history.items() if versions[-1][0] > snapshot)
+
+    def conflicts(self, keys: Iterable[str], snapshot: int) -> List[str]:
+        """
+        Вернуть ключи из keys, изменённые другими коммитами после снимка snapshot.
+        :param keys:
+        :param snapshot:
+        :return:
+        """
+        history = self._history
+        return [key for key in keys if key in history and history[key][-1][0] > snapshot]
+
+    def counts(self, value: Any, snapshot: int) -> int:
+        """
+        Подсчитать ключи со значением value в снимке snapshot.
+        Сложность - O(h), где h - количество ключей с сохранёнными версиями.
+        :param value:
+        :param snapshot:
+        :return:
+        """
+        count = self.database.counts(value)
+        latest = self.database.database
+        for key in self.changed_since(snapshot):
+            count += (self.read(key, snapshot) == value) - (latest.get(key) == value)
+        return count
+
+    def find(self, value: Any, snapshot: int) -> List[str]:
+        """
+        Вернуть ключи со значением value в снимке snapshot.
+        :param value:
+        :param snapshot:
+        :return:
+        """
+        changed = {key: self.read(key, snapshot) for key in self.changed_since(snapshot)}
+        result = [key for key in self.database.find(value) if key not in changed]
+        result.extend(key for key, old_value in changed.items() if old_value == value)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'mvcc_timestamp'     : self.timestamp,
+            'mvcc_snapshots'     : sum(self._snapshots.values()),
+            'mvcc_versioned_keys': len(self._history),
+            'mvcc_versions'      : len(self._commit_log),
+        }
@@ -0,0 +1,170 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+from constants import QUEUED_TEXT, Action, WrongInputException, WrongInputText
+
+logger = logging.getLogger(__name__)
+
+# Команды, которые нельзя ставить в очередь MULTI: управление транзакциями и отслеживанием ключей.
+_NOT_QUEUED = (Action.BEGIN, Action.ROLLBACK, Action.COMMIT, Action.WATCH, Action.UNWATCH, Action.MULTI)
+
+
+class KeyVersions:
+    """
+    Номера версий отслеживаемых командой WATCH ключей. По подписке на зафиксированные
+    изменения базы данных номер версии ключа увеличивается при каждом его изменении
+    (в том числе удалении по сроку жизни и вытеснении). Версии хранятся только для ключей,
+    которые отслеживает хотя бы один клиент, поэтому остальные коммиты обходятся в O(k)
+    проверок по словарю, где k - количество изменённых ключей.
+    >>>versions = KeyVersions(database)
+    >>>version = versions.watch('A')
+    >>>database.set('A', '6')
+    >>>versions.changed({'A': version})
+    ['A']
+    """
+
+    def __init__(self, database) -> None:
+        # Ключ -> номер версии и количество клиентов, отслеживающих ключ.
+        self._versions: Dict[str, int] = {}
+        self._watchers: Dict[str, int] = {}
+        database.add_commit_listener(self._on_commit)
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def _on_commit(self, changes: List[Tuple[str, Optional[Any], Optional[Any]]]) -> None:
+        versions = self._versions
+        if versions:
+            for key, _, _ in changes:
+                if key in versions:
+                    versions[key] += 1
+
+    def watch(self, key: str) -> int:
+        """
+        Начать отслеживание ключа и вернуть номер его текущей версии.
+        :param key:
+        :return:
+        """
+        self._watchers[key] = self._watchers.get(key, 0) + 1
+        return self._versions.setdefault(key, 0)
+
+    def unwatch(self, key: str) -> None:
+        count = self._watchers[key] - 1
+        if count:
+            self._watchers[key] = count
+        else:
+            del self._watchers[key]
+            del self._versions[key]
+
+    def changed(self, watched: Dict[str, int]) -> List[str]:
+        """
+        Вернуть ключи из watched (ключ -> версия при WATCH), изменённые после WATCH.
+        :param watched:
+        :return:
+        """
+        versions = self._versions
+        return [key for key, version in watched.items() if versions[key] != version]
+
+
+class OptimisticTransaction:
+    """
+    Оптимистичная транзакция одного клиента: WATCH запоминает версии ключей, MULTI начинает
+    очередь команд, которые не выполняются до EXEC, а EXEC выполняет всю очередь одним пакетом,
+    если ни один отслеживаемый ключ не изменился, и отменяет её иначе. Данные не копируются
+    и журнал отката не ведётся, пока очередь не выполняется; DISCARD отбрасывает очередь.
+    Работает независимо от транзакций BEGIN/COMMIT: EXEC внутри открытой транзакции
+    выполняет очередь в ней.
+    >>>transaction = OptimisticTransaction(database)
+    >>>transaction.watch(['A'])
+    >>>transaction.multi()
+    >>>transaction.enqueue(Action.SET, 'A', '6')
+    'QUEUED'
+    >>>transaction.execute(database.execute_batch)
+    [None]
+    """
+
+    def __init__(self, database) -> None:
+        self.database = database
+        # Отслеживаемые ключи: ключ -> номер версии при WATCH.
+        self.watched: Dict[str, int] = {}
+        # Очередь команд после MULTI (кортежи в формате input_filter.ParsedCommand).
+        # None - MULTI не вызывалась.
+        self.queue: Optional[List[Tuple]] = None
+
+    def watch(self, keys: Sequence[str]) -> None:
+        """
+        Отслеживать изменения ключей keys до EXEC, DISCARD или UNWATCH.
+        :param keys:
+        :return:
+        """
+        if self.queue is not None:
+            raise WrongInputException(Action.WATCH, message=WrongInputText.NOT_ALLOWED_IN_MULTI.value.format(
+                command=Action.WATCH.value))
+        versions = self.database.key_versions()
+        for key in keys:
+            if key not in self.watched:
+                self.watched[key] = versions.watch(key)
+
+    def unwatch(self) -> None:
+        if self.watched:
+            versions = self.database.key_versions()
+            for key in self.watched:
+                versions.unwatch(key)
+            self.watched = {}
+
+    def multi(self) -> None:
+        if self.queue is not None:
+            raise WrongInputException(Action.MULTI, message=WrongInputText.NOT_ALLOWED_IN_MULTI.value.format(
+                command=Action.MULTI.value))
+        self.queue = []
+
+    def enqueue(self, command, key=None, value=None, ttl=None, arguments=()) -> str:
+        """
+        Поставить команду в очередь MULTI. Аргументы совпадают с CustomDataBase.execute_command.
+        :param command:
+        :param key:
+        :param value:
+        :param ttl:
+        :param arguments:
+        :return:
+        """
+        if command in _NOT_QUEUED:
+            raise WrongInputException(command, message=WrongInputText.NOT_ALLOWED_IN_MULTI.value.format(
+                command=command.value))
+        self.queue.append((command, key, value, ttl, arguments))
+        return QUEUED_TEXT
+
+    def discard(self) -> None:
+        if self.queue is None:
+            raise WrongInputException(Action.DISCARD, message=WrongInputText.NO_MULTI.value)
+        self.queue = None
+        self.unwatch()
+
+    def close(self) -> None:
+        """
+        Отбросить очередь команд и снять отслеживание ключей (при разрыве соединения клиента).
+        :return:
+        """
+        self.queue = None
+        self.unwatch()
+
+    def execute(self, execute_batch: Callable[[List[Tuple]], List[Any]]) -> List[Any]:
+        """
+        Выполнить очередь MULTI функцией execute_batch и вернуть результаты команд.
+        Если отслеживаемые ключи изменились после WATCH - очередь отбрасывается
+        и возбуждается исключение WrongInputException. В обоих случаях отслеживание ключей снимается.
+        :param execute_batch:
+        :return:
+        """
+        if self.queue is None:
+            raise WrongInputException(Action.EXEC, message=WrongInputText.NO_MULTI.value)
+        queue = self.queue
+        self.queue = None
+        changed = self.database.key_versions().changed(self.watched) if self.watched else None
+        self.unwatch()
+        if changed:
+            logger.info('EXEC отменён, изменены отслеживаемые ключи: %s', changed)
+            raise WrongInputException(Action.EXEC, message=WrongInputText.WATCHED_KEYS_CHANGED.value.format(
+                keys=' '.join(changed)))
+        logger.debug('EXEC. Выполнение %s команд из очереди.', len(queue))
+        return execute_batch(queue)
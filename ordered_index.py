@@ -0,0 +1,185 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Iterable, Iterator, List, Optional, Union
+import re
+
+
+class SortedKeys:
+    """
+    Упорядоченное множество ключей на отсортированных блоках.
+    Ключи хранятся в списке блоков - отсортированных списков длиной до 2 * BLOCK_SIZE,
+    и в списке максимумов блоков, по которому двоичным поиском находится нужный блок.
+    Добавление и удаление - O(log n + BLOCK_SIZE), перебор k ключей начиная
+    с заданного - O(log n + k).
+    >>>keys = SortedKeys(['b', 'a', 'c'])
+    >>>list(keys.irange('b'))
+    ['b', 'c']
+    """
+
+    BLOCK_SIZE = 1000
+
+    def __init__(self, keys: Iterable[str] = ()) -> None:
+        ordered = sorted(keys)
+        size = self.BLOCK_SIZE
+        self._blocks: List[List[str]] = [ordered[start:start + size] for start in range(0, len(ordered), size)]
+        self._maxes: List[str] = [block[-1] for block in self._blocks]
+        self._length = len(ordered)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[str]:
+        for block in self._blocks:
+            yield from block
+
+    def add(self, key: str) -> None:
+        """
+        Добавить ключ, которого ещё нет в множестве.
+        :param key:
+        :return:
+        """
+        maxes = self._maxes
+        self._length += 1
+        if not maxes:
+            self._blocks.append([key])
+            maxes.append(key)
+            return
+        position = bisect_left(maxes, key)
+        if position == len(maxes):
+            position -= 1
+            block = self._blocks[position]
+            block.append(key)
+            maxes[position] = key
+        else:
+            block = self._blocks[position]
+            insort(block, key)
+        if len(block) > 2 * self.BLOCK_SIZE:
+            half = self.BLOCK_SIZE
+            self._blocks[position:position + 1] = [block[:half], block[half:]]
+            maxes[position:position + 1] = [block[half - 1], block[-1]]
+
+    def remove(self, key: str) -> None:
+        """
+        Удалить ключ, который есть в множестве.
+        :param key:
+        :return:
+        """
+        position = bisect_left(self._maxes, key)
+        block = self._blocks[position]
+        index = bisect_left(block, key)
+        del block[index]
+        self._length -= 1
+        if not block:
+            del self._blocks[position]
+            del self._maxes[position]
+        elif index == len(block):
+            self._maxes[position] = block[-1]
+
+    def irange(self, start: Optional[str] = None, stop: Optional[str] = None,
+               include_start: bool = True) -> Iterator[str]:
+        """
+        Перебрать по возрастанию ключи от start до stop включительно.
+        None означает отсутствие границы; include_start=False исключает сам start.
+        Итератор действителен до следующего изменения множества.
+        :param start:
+        :param stop:
+        :param include_start:
+        :return:
+        """
+        blocks = self._blocks
+        if start is None:
+            position, index = 0, 0
+        else:
+            search = bisect_left if include_start else bisect_right
+            position = search(self._maxes, start)
+            if position == len(blocks):
+                return
+            index = search(blocks[position], start)
+        for position in range(position, len(blocks)):
+            block = blocks[position]
+            if stop is not None and block[-1] > stop:
+                for key in block[index:]:
+                    if key > stop:
+                        return
+                    yield key
+                return
+            yield from block[index:] if index else block
+            index = 0
+
+    def prefix(self, prefix: str) -> Iterator[str]:
+        """
+        Перебрать по возрастанию ключи, начинающиеся с prefix.
+        :param prefix:
+        :return:
+        """
+        for key in self.irange(prefix):
+            if not key.startswith(prefix):
+                return
+            yield key
+
+
+# Числовое значение: целое или десятичная дробь, например -12 или 3.5.
+_NUMBER = re.compile(r'-?\d+(\.\d+)?')
+
+Number = Union[int, float]
+
+
+def parse_number(text: str) -> Optional[Number]:
+    """
+    Разобрать строковое значение как число: int для целых, float для десятичных дробей.
+    Вернуть None, если значение не числовое.
+    >>>parse_number('-12')
+    -12
+    >>>parse_number('abc')
+    :param text:
+    :return:
+    """
+    match = _NUMBER.fullmatch(text)
+    if match is None:
+        return None
+    return float(text) if match.group(1) else int(text)
+
+
+class NumericIndex:
+    """
+    Различные числовые значения базы данных по возрастанию чисел: множество пар (число, значение)
+    в SortedKeys. Одно число может иметь несколько записей ('5' и '05').
+    Добавление и удаление значения - O(log d + BLOCK_SIZE), перебор значений
+    из диапазона - O(log d + r), где d - количество различных числовых значений,
+    r - количество значений в диапазоне.
+    >>>index = NumericIndex(['10', '9', 'abc'])
+    >>>list(index.irange(5, 100))
+    ['9', '10']
+    """
+
+    def __init__(self, values: Iterable[str] = ()) -> None:
+        items = []
+        for value in values:
+            number = parse_number(value)
+            if number is not None:
+                items.append((number, value))
+        self._items = SortedKeys(items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, value: str) -> None:
+        number = parse_number(value)
+        if number is not None:
+            self._items.add((number, value))
+
+    def remove(self, value: str) -> None:
+        number = parse_number(value)
+        if number is not None:
+            self._items.remove((number, value))
+
+    def irange(self, low: Number, high: Number) -> Iterator[str]:
+        """
+        Перебрать значения с числами от low до high включительно по возрастанию чисел.
+        :param low:
+        :param high:
+        :return:
+        """
+        for number, value in self._items.irange((low,)):
+            if number > high:
+                return
+            yield value
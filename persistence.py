@@ -0,0 +1,808 @@
+from array import array
+from enum import Enum
+from itertools import accumulate, chain, pairwise
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, List, Mapping, Optional, Tuple
+import gc
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from custom_database import Change, CustomDataBase, group_by_value
+
+logger = logging.getLogger(__name__)
+
+WAL_FILE_NAME = 'database.wal'
+OLD_WAL_FILE_NAME = 'database.wal.old'
+SNAPSHOT_FILE_NAME = 'database.snapshot'
+
+# Снимок версии 1 - магическое число и записи в формате журнала предзаписи. Читается для совместимости.
+RECORDS_SNAPSHOT_MAGIC = b'STDBSNP1'
+
+# Снимок версии 2:
+#   заголовок _SNAPSHOT_HEADER - магическое число, версия, флаги (0), количество ключей и значений;
+#   словарь значений - длины значений, количества ключей каждого значения (массивы uint32)
+#   и сами значения подряд;
+#   ключи, сгруппированные по значениям в порядке словаря, блоками до SNAPSHOT_BATCH_SIZE ключей:
+#   количество ключей блока (uint32), длины ключей (массив uint32) и сами ключи подряд;
+#   если в флагах установлен _SNAPSHOT_FLAG_EXPIRES - сроки жизни: количество ключей со сроком (uint64)
+#   и блоки до SNAPSHOT_BATCH_SIZE ключей: количество (uint32), длины ключей (массив uint32), ключи подряд
+#   и моменты истечения по системным часам (массив float64, time.time());
+#   crc32 всего предшествующего содержимого файла (uint32).
+# Все числа - little-endian, строки - UTF-8.
+SNAPSHOT_MAGIC = b'STDBSNAP'
+SNAPSHOT_VERSION = 2
+_SNAPSHOT_HEADER = struct.Struct('<8sHHQQ')
+_SNAPSHOT_COUNT = struct.Struct('<I')
+_SNAPSHOT_CRC = struct.Struct('<I')
+_SNAPSHOT_EXPIRES = struct.Struct('<Q')
+_SNAPSHOT_FLAG_EXPIRES = 1
+
+# Заголовок записи журнала: операция, длина ключа, длина значения.
+# После заголовка идут ключ, значение, для _OP_SET_EXPIRE - момент истечения срока жизни
+# по системным часам (float64, time.time()), и crc32 всей записи.
+_RECORD_HEADER = struct.Struct('<BII')
+_RECORD_EXPIRE = struct.Struct('<d')
+_RECORD_CRC = struct.Struct('<I')
+
+_OP_SET = 1
+_OP_UNSET = 2
+_OP_SET_EXPIRE = 3
+
+# Запись журнала: ключ, значение (None - удаление) и момент истечения срока жизни (None - без срока).
+Record = Tuple[str, Optional[str], Optional[float]]
+
+# Количество записей снимка, после которого буфер записывается в файл и сообщается ход записи.
+SNAPSHOT_BATCH_SIZE = 10000
+
+# Ход фоновой записи снимка в памяти, общей для родителя и дочернего процесса: записано ключей.
+_PROGRESS = struct.Struct('<Q')
+
+
+class FsyncPolicy(Enum):
+    """
+    Политики сброса журнала предзаписи на диск.
+    """
+    ALWAYS = 'always'      # fsync после каждого коммита
+    INTERVAL = 'interval'  # групповой коммит: fsync раз в fsync_interval секунд
+    NEVER = 'never'        # fsync выполняет операционная система по своему усмотрению
+
+
+def encode_record(key: str, value: Optional[str], expire_at: Optional[float] = None) -> bytes:
+    """
+    Закодировать одно изменение в запись журнала.
+    value равное None означает удаление ключа, expire_at - момент истечения
+    срока жизни ключа по системным часам (time.time()).
+    :param key:
+    :param value:
+    :param expire_at:
+    :return:
+    """
+    key_bytes = key.encode()
+    if value is None:
+        body = _RECORD_HEADER.pack(_OP_UNSET, len(key_bytes), 0) + key_bytes
+    elif expire_at is None:
+        value_bytes = str(value).encode()
+        body = _RECORD_HEADER.pack(_OP_SET, len(key_bytes), len(value_bytes)) + key_bytes + value_bytes
+    else:
+        value_bytes = str(value).encode()
+        body = (_RECORD_HEADER.pack(_OP_SET_EXPIRE, len(key_bytes), len(value_bytes)) + key_bytes + value_bytes
+                + _RECORD_EXPIRE.pack(expire_at))
+    return body + _RECORD_CRC.pack(zlib.crc32(body))
+
+
+def read_records(path: str, offset: int = 0) -> Generator[Record, None, int]:
+    """
+    Прочитать записи журнала из файла, начиная со смещения offset.
+    Чтение останавливается на первой неполной или повреждённой записи -
+    это хвост, не успевший попасть на диск. Значение генератора (StopIteration.value) -
+    смещение конца последней целой записи.
+    :param path:
+    :param offset:
+    :return:
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    return (yield from decode_records(data, offset, path))
+
+
+def decode_records(data: bytes, offset: int = 0, source: str = '') -> Generator[Record, None, int]:
+    """
+    Декодировать записи журнала из буфера data, начиная со смещения offset.
+    Декодирование останавливается на первой неполной или повреждённой записи.
+    Значение генератора - смещение конца последней целой записи.
+    :param data:
+    :param offset:
+    :param source: имя источника данных для сообщений в журнале приложения.
+    :return:
+    """
+    header_size = _RECORD_HEADER.size
+    crc_size = _RECORD_CRC.size
+    while offset + header_size <= len(data):
+        op, key_length, value_length = _RECORD_HEADER.unpack_from(data, offset)
+        end = offset + header_size + key_length + value_length
+        if op == _OP_SET_EXPIRE:
+            end += _RECORD_EXPIRE.size
+        if end + crc_size > len(data) or op not in (_OP_SET, _OP_UNSET, _OP_SET_EXPIRE):
+            logger.warning('Неполная запись в конце журнала %s, смещение %s', source, offset)
+            return offset
+        (crc,) = _RECORD_CRC.unpack_from(data, end)
+        if zlib.crc32(data[offset:end]) != crc:
+            logger.warning('Повреждённая запись в журнале %s, смещение %s', source, offset)
+            return offset
+        key_start = offset + header_size
+        key = data[key_start:key_start + key_length].decode()
+        if op == _OP_SET:
+            yield key, data[key_start + key_length:end].decode(), None
+        elif op == _OP_SET_EXPIRE:
+            value_end = end - _RECORD_EXPIRE.size
+            yield key, data[key_start + key_length:value_end].decode(), _RECORD_EXPIRE.unpack_from(data, value_end)[0]
+        else:
+            yield key, None, None
+        offset = end + crc_size
+    if offset < len(data):
+        logger.warning('Неполная запись в конце журнала %s, смещение %s', source, offset)
+    return offset
+
+
+class WriteAheadLog:
+    """
+    Журнал предзаписи. Записи буферизуются в памяти процесса и сбрасываются на диск
+    в соответствии с политикой FsyncPolicy. При политике INTERVAL фоновый поток
+    выполняет один fsync на все коммиты, накопившиеся за интервал (групповой коммит).
+    """
+
+    def __init__(self, path: str, fsync_policy: FsyncPolicy = FsyncPolicy.INTERVAL,
+                 fsync_interval: float = 1.0) -> None:
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.records_written = 0
+        self.fsync_count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab', buffering=1024 * 1024)
+        self._dirty = False
+        self._closed = threading.Event()
+        self._flusher = None
+        if fsync_policy is FsyncPolicy.INTERVAL:
+            self._flusher = threading.Thread(target=self._flush_loop, name='wal-fsync', daemon=True)
+            self._flusher.start()
+
+    def append(self, changes: List[Record]) -> None:
+        """
+        Дописать в журнал зафиксированные изменения одного коммита.
+        :param changes:
+        :return:
+        """
+        data = b''.join(encode_record(*change) for change in changes)
+        with self._lock:
+            self._file.write(data)
+            self.records_written += len(changes)
+            if self.fsync_policy is FsyncPolicy.ALWAYS:
+                self._sync()
+            else:
+                self._dirty = True
+
+    def sync(self) -> None:
+        """
+        Принудительно сбросить журнал на диск.
+        :return:
+        """
+        with self._lock:
+            self._sync()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.fsync_count += 1
+        self._dirty = False
+
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self.fsync_interval):
+            with self._lock:
+                if self._dirty:
+                    self._sync()
+
+    def rotate(self, new_path: str) -> None:
+        """
+        Переименовать текущий файл журнала в new_path и начать новый файл.
+        :param new_path:
+        :return:
+        """
+        with self._lock:
+            self._sync()
+            self._file.close()
+            os.replace(self.path, new_path)
+            self._file = open(self.path, 'ab', buffering=1024 * 1024)
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._flusher:
+            self._flusher.join()
+        with self._lock:
+            if self.fsync_policy is not FsyncPolicy.NEVER:
+                self._sync()
+            else:
+                self._file.flush()
+            self._file.close()
+
+
+def write_snapshot(path: str, groups: Iterable[Tuple[Any, Iterable[str]]],
+                   progress: Optional[Callable[[int], None]] = None,
+                   expires: Optional[Dict[str, float]] = None) -> int:
+    """
+    Атомарно записать снимок данных версии SNAPSHOT_VERSION: сначала во временный файл,
+    затем fsync и переименование поверх старого снимка.
+    Возвращает количество записанных ключей.
+    :param path:
+    :param groups: пары (значение, ключи), например CustomDataBase.committed_groups().
+    :param progress: вызывается с количеством записанных ключей после каждых SNAPSHOT_BATCH_SIZE ключей.
+    :param expires: моменты истечения сроков жизни ключей, например CustomDataBase.committed_expires().
+    :return:
+    """
+    values = []
+    groups_keys = []
+    for value, keys in groups:
+        values.append(str(value).encode())
+        groups_keys.append(keys)
+    counts = _lengths_array(map(len, groups_keys))
+    dictionary = (_lengths_array(map(len, values)).tobytes(), counts.tobytes(), b''.join(values))
+    return _write_snapshot_file(path, sum(counts), len(values), dictionary,
+                                chain.from_iterable(groups_keys), progress, expires)
+
+
+def write_snapshot_pairs(path: str, pairs: Callable[[], Iterable[Tuple[str, Any]]], total: int,
+                         progress: Optional[Callable[[int], None]] = None,
+                         expires: Optional[Dict[str, float]] = None) -> int:
+    """
+    Записать снимок, как write_snapshot, не собирая данные в памяти: pairs() при каждом вызове
+    заново перебирает те же total пар (ключ, значение), и файл пишется за три прохода -
+    длины значений, значения и ключи. Каждый ключ образует в словаре значений свою группу,
+    поэтому снимок больше, чем у write_snapshot, зато память не зависит от объёма данных
+    (снимки MmapDataBase).
+    :param path:
+    :param pairs:
+    :param total:
+    :param progress:
+    :param expires:
+    :return:
+    """
+    def value_batches() -> Iterator[List[bytes]]:
+        items = iter(pairs())
+        while True:
+            batch = [str(value).encode() for _, (_, value) in zip(range(SNAPSHOT_BATCH_SIZE), items)]
+            if not batch:
+                return
+            yield batch
+
+    def counts() -> Iterator[bytes]:
+        one = _lengths_array((1,))
+        for start in range(0, total, SNAPSHOT_BATCH_SIZE):
+            yield (one * min(SNAPSHOT_BATCH_SIZE, total - start)).tobytes()
+
+    dictionary = chain((_lengths_array(map(len, batch)).tobytes() for batch in value_batches()),
+                       counts(),
+                       (b''.join(batch) for batch in value_batches()))
+    return _write_snapshot_file(path, total, total, dictionary, (key for key, _ in pairs()), progress, expires)
+
+
+def _write_snapshot_file(path: str, total: int, groups: int, dictionary: Iterable[bytes], keys: Iterator[str],
+                         progress: Optional[Callable[[int], None]], expires: Optional[Dict[str, float]]) -> int:
+    """
+    Записать файл снимка: заголовок, фрагменты словаря значений dictionary, total ключей keys
+    блоками и сроки жизни. Возвращает количество записанных ключей.
+    :param path:
+    :param total:
+    :param groups: количество значений в словаре.
+    :param dictionary:
+    :param keys:
+    :param progress:
+    :param expires:
+    :return:
+    """
+    tmp_path = path + '.tmp'
+    written = 0
+    with open(tmp_path, 'wb', buffering=1024 * 1024) as file:
+        crc = 0
+
+        def write(data: bytes) -> None:
+            nonlocal crc
+            crc = zlib.crc32(data, crc)
+            file.write(data)
+
+        flags = _SNAPSHOT_FLAG_EXPIRES if expires else 0
+        write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, total, groups))
+        for chunk in dictionary:
+            write(chunk)
+        while written < total:
+            batch = [key.encode() for _, key in zip(range(SNAPSHOT_BATCH_SIZE), keys)]
+            if not batch:
+                raise ValueError(f'Снимок {path}: получено ключей {written} из {total}.')
+            write(_SNAPSHOT_COUNT.pack(len(batch)) + _lengths_array(map(len, batch)).tobytes() + b''.join(batch))
+            written += len(batch)
+            if progress:
+                progress(written)
+        if expires:
+            write(_SNAPSHOT_EXPIRES.pack(len(expires)))
+            items = iter(expires.items())
+            while True:
+                batch = [(key.encode(), expire_at) for _, (key, expire_at) in zip(range(SNAPSHOT_BATCH_SIZE), items)]
+                if not batch:
+                    break
+                moments = array('d', (expire_at for _, expire_at in batch))
+                if sys.byteorder == 'big':
+                    moments.byteswap()
+                write(_SNAPSHOT_COUNT.pack(len(batch)) + _lengths_array(len(key) for key, _ in batch).tobytes()
+                      + b''.join(key for key, _ in batch) + moments.tobytes())
+        file.write(_SNAPSHOT_CRC.pack(crc))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(os.path.dirname(path))
+    if progress:
+        progress(written)
+    return written
+
+
+def _lengths_array(lengths: Iterable[int]) -> array:
+    lengths = array('I', lengths)
+    if sys.byteorder == 'big':
+        lengths.byteswap()
+    return lengths
+
+
+def _read_lengths(view: memoryview, position: int, count: int) -> array:
+    lengths = array('I')
+    lengths.frombytes(view[position:position + lengths.itemsize * count])
+    if sys.byteorder == 'big':
+        lengths.byteswap()
+    return lengths
+
+
+def _split_strings(view: memoryview, position: int, lengths: array) -> Tuple[List[str], int]:
+    """
+    Декодировать строки с длинами lengths, записанные подряд начиная с position.
+    Если все строки ASCII, блок декодируется одним вызовом и режется по длинам.
+    Возвращает строки и позицию после блока.
+    :param view:
+    :param position:
+    :param lengths:
+    :return:
+    """
+    end = position + sum(lengths)
+    text = str(view[position:end], 'utf-8')
+    offsets = pairwise(accumulate(lengths, initial=0))
+    if len(text) == end - position:
+        return [text[start:stop] for start, stop in offsets], end
+    data = view[position:end].tobytes()
+    return [data[start:stop].decode() for start, stop in offsets], end
+
+
+def decode_snapshot(buffer, expires: Optional[Dict[str, float]] = None) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Декодировать снимок версии SNAPSHOT_VERSION из буфера (bytes или mmap) в пары (значение, ключи).
+    Контрольная сумма проверяется до выдачи первой пары, поэтому повреждённый снимок
+    не загружается частично. Длины и счётчики читаются прямо из буфера без разбора
+    по одному ключу, строки декодируются блоками.
+    :param buffer:
+    :param expires: словарь, в который до выдачи первой пары записываются моменты истечения
+    сроков жизни ключей (time.time()).
+    :return:
+    """
+    view = memoryview(buffer)
+    try:
+        end = len(view) - _SNAPSHOT_CRC.size
+        if end < _SNAPSHOT_HEADER.size:
+            raise ValueError('Снимок базы данных обрезан.')
+        magic, version, flags, total, value_count = _SNAPSHOT_HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('Данные не являются снимком базы данных.')
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f'Неподдерживаемая версия снимка: {version}.')
+        (crc,) = _SNAPSHOT_CRC.unpack_from(view, end)
+        if zlib.crc32(view[:end]) != crc:
+            raise ValueError('Контрольная сумма снимка не совпадает, снимок повреждён.')
+        position = _SNAPSHOT_HEADER.size
+        value_lengths = _read_lengths(view, position, value_count)
+        position += value_lengths.itemsize * value_count
+        counts = _read_lengths(view, position, value_count)
+        position += counts.itemsize * value_count
+        values, position = _split_strings(view, position, value_lengths)
+        keys: List[str] = []
+        while len(keys) < total:
+            (count,) = _SNAPSHOT_COUNT.unpack_from(view, position)
+            position += _SNAPSHOT_COUNT.size
+            lengths = _read_lengths(view, position, count)
+            position += lengths.itemsize * count
+            batch, position = _split_strings(view, position, lengths)
+            keys.extend(batch)
+        if flags & _SNAPSHOT_FLAG_EXPIRES and expires is not None:
+            (expiring,) = _SNAPSHOT_EXPIRES.unpack_from(view, position)
+            position += _SNAPSHOT_EXPIRES.size
+            while expiring:
+                (count,) = _SNAPSHOT_COUNT.unpack_from(view, position)
+                position += _SNAPSHOT_COUNT.size
+                lengths = _read_lengths(view, position, count)
+                position += lengths.itemsize * count
+                batch, position = _split_strings(view, position, lengths)
+                moments = array('d')
+                moments.frombytes(view[position:position + moments.itemsize * count])
+                if sys.byteorder == 'big':
+                    moments.byteswap()
+                position += moments.itemsize * count
+                expires.update(zip(batch, moments))
+                expiring -= count
+    finally:
+        view.release()
+    start = 0
+    for value, count in zip(values, counts):
+        yield value, keys[start:start + count]
+        start += count
+
+
+def read_snapshot_groups(path: str, expires: Optional[Dict[str, float]] = None) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Прочитать снимок из файла, отображённого в память, в пары (значение, ключи).
+    Снимки версии 1 (записи журнала) также читаются.
+    :param path:
+    :param expires: словарь для моментов истечения сроков жизни ключей, как в decode_snapshot.
+    :return:
+    """
+    with open(path, 'rb') as file:
+        magic = file.read(len(SNAPSHOT_MAGIC))
+        if magic == RECORDS_SNAPSHOT_MAGIC:
+            yield from group_by_value((key, value) for key, value, _ in
+                                      read_records(path, len(RECORDS_SNAPSHOT_MAGIC)))
+            return
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f'Файл {path} не является снимком базы данных.')
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from decode_snapshot(mapped, expires)
+
+
+def read_snapshot(path: str) -> Dict[str, str]:
+    """
+    Прочитать снимок данных в словарь.
+    :param path:
+    :return:
+    """
+    return {key: value for value, keys in read_snapshot_groups(path) for key in keys}
+
+
+def _fsync_directory(path: str) -> None:
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path or '.', os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class BackgroundSave:
+    """
+    Запись снимков зафиксированного состояния базы данных с метриками хода и длительности.
+    В фоновом режиме (start) снимок пишет дочерний процесс, созданный os.fork: память
+    родителя и потомка общая и копируется системой постранично только при изменении
+    (copy-on-write), поэтому родитель продолжает выполнять команды, а потомок записывает
+    данные на момент fork. Изменения открытых транзакций в снимок не попадают.
+    Количество записанных ключей потомок сообщает через общую анонимную память,
+    его завершения ожидает фоновый поток родителя.
+    Если fork недоступен или данные движка не копируются при fork (CustomDataBase.FORK_SNAPSHOTS),
+    фоновый поток записывает копию зафиксированных данных (CustomDataBase.committed_copy):
+    словарь в памяти или, у MmapDataBase, копию файлов таблицы, из которой снимок пишется проходами.
+    >>>saver = BackgroundSave('database.snapshot')
+    >>>saver.start(database)
+    >>>saver.wait()
+    True
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.saves = 0
+        self.failed_saves = 0
+        self.last_status = 'none'
+        self.last_keys = 0
+        # Длительность записи последнего снимка и паузы выполнения команд на fork, в секундах.
+        self.last_duration = 0.0
+        self.last_fork_duration = 0.0
+        self._started = 0.0
+        self._total = 0
+        self._progress = mmap.mmap(-1, _PROGRESS.size)
+        self._waiter: Optional[threading.Thread] = None
+
+    @property
+    def in_progress(self) -> bool:
+        return self._waiter is not None and self._waiter.is_alive()
+
+    def save(self, database: CustomDataBase) -> Optional[int]:
+        """
+        Записать снимок в текущем процессе и вернуть количество ключей (None при ошибке записи).
+        :param database:
+        :return:
+        """
+        self.wait()
+        self._begin(database)
+        try:
+            keys = write_snapshot(self.path, database.committed_groups(), self._report, database.committed_expires())
+        except OSError:
+            logger.exception('Ошибка записи снимка %s.', self.path)
+            keys = None
+        self._finish(keys)
+        return keys
+
+    def start(self, database: CustomDataBase, on_done: Optional[Callable[[bool], None]] = None) -> bool:
+        """
+        Начать запись снимка в фоне. Возвращает False, если предыдущий снимок ещё пишется.
+        :param database:
+        :param on_done: вызывается в фоновом потоке с признаком успешной записи.
+        :return:
+        """
+        if self.in_progress:
+            return False
+        self._begin(database)
+        if hasattr(os, 'fork') and database.FORK_SNAPSHOTS:
+            target, arguments = self._wait_child, (self._fork(database), on_done)
+        else:
+            target, arguments = self._write_copy, (database.committed_copy(), database.committed_expires(), on_done)
+        self.last_fork_duration = time.perf_counter() - self._started
+        self._waiter = threading.Thread(target=target, args=arguments, name='bgsave', daemon=True)
+        self._waiter.start()
+        return True
+
+    def wait(self) -> bool:
+        """
+        Дождаться окончания фоновой записи и вернуть признак успешной записи последнего снимка.
+        :return:
+        """
+        if self._waiter is not None:
+            self._waiter.join()
+        return self.last_status == 'ok'
+
+    def _begin(self, database: CustomDataBase) -> None:
+        self._started = time.perf_counter()
+        self._total = len(database.database)
+        self._report(0)
+
+    def _report(self, written: int) -> None:
+        _PROGRESS.pack_into(self._progress, 0, written)
+
+    def _fork(self, database: CustomDataBase) -> int:
+        pid = os.fork()
+        if pid:
+            return pid
+        # Дочерний процесс. Сборщик мусора отключается, чтобы обход всех объектов
+        # не копировал страницы памяти; выход через os._exit не сбрасывает
+        # унаследованные буферы родителя (журнала предзаписи, вывода).
+        gc.disable()
+        try:
+            write_snapshot(self.path, database.committed_groups(), self._report, database.committed_expires())
+        except BaseException:
+            logger.exception('Ошибка записи снимка %s в дочернем процессе.', self.path)
+            os._exit(1)
+        os._exit(0)
+
+    def _wait_child(self, pid: int, on_done: Optional[Callable[[bool], None]]) -> None:
+        _, status = os.waitpid(pid, 0)
+        success = os.waitstatus_to_exitcode(status) == 0
+        self._finish(_PROGRESS.unpack_from(self._progress)[0] if success else None)
+        if on_done:
+            on_done(success)
+
+    def _write_copy(self, items: Mapping[str, Any], expires: Dict[str, float],
+                    on_done: Optional[Callable[[bool], None]]) -> None:
+        try:
+            if isinstance(items, dict):
+                keys = write_snapshot(self.path, group_by_value(items.items()), self._report, expires)
+            else:
+                keys = write_snapshot_pairs(self.path, items.items, len(items), self._report, expires)
+        except (OSError, ValueError):
+            logger.exception('Ошибка записи снимка %s.', self.path)
+            keys = None
+        finally:
+            close = getattr(items, 'close', None)
+            if close is not None:
+                close()
+        self._finish(keys)
+        if on_done:
+            on_done(keys is not None)
+
+    def _finish(self, keys: Optional[int]) -> None:
+        self.last_duration = time.perf_counter() - self._started
+        if keys is None:
+            self.failed_saves += 1
+            self.last_status = 'failed'
+            return
+        self.saves += 1
+        self.last_status = 'ok'
+        self.last_keys = keys
+        logger.info('Снимок из %s ключей записан за %.3f с.', keys, self.last_duration)
+
+    def progress(self) -> float:
+        """
+        Доля записанных ключей текущего снимка в процентах.
+        :return:
+        """
+        if not self._total:
+            return 100.0
+        (written,) = _PROGRESS.unpack_from(self._progress)
+        return min(100.0, round(written * 100 / self._total, 1))
+
+    def stats(self) -> Dict[str, Any]:
+        in_progress = self.in_progress
+        return {
+            'bgsave_in_progress'   : int(in_progress),
+            'bgsave_progress'      : self.progress() if in_progress else 100.0,
+            'saves'                : self.saves,
+            'failed_saves'         : self.failed_saves,
+            'last_save_status'     : self.last_status,
+            'last_save_keys'       : self.last_keys,
+            'last_save_duration_ms': round(self.last_duration * 1000, 3),
+            'last_fork_ms'         : round(self.last_fork_duration * 1000, 3),
+        }
+
+    def close(self) -> None:
+        self.wait()
+        self._progress.close()
+
+
+class PersistentStorage:
+    """
+    Долговременное хранение для CustomDataBase: журнал предзаписи и периодические снимки.
+    Зафиксированные изменения дописываются в журнал; после snapshot_every записей
+    журнал переименовывается, а компактный снимок зафиксированных данных пишется
+    в фоновом процессе (BackgroundSave), после чего старый журнал удаляется.
+    При запуске данные восстанавливаются из снимка и хвоста журнала.
+    >>>storage = PersistentStorage('data')
+    >>>database = storage.open()
+    >>>database.set('A', '5')
+    >>>storage.close()
+    """
+
+    def __init__(self, data_dir: str, fsync_policy: FsyncPolicy = FsyncPolicy.INTERVAL,
+                 fsync_interval: float = 1.0, snapshot_every: Optional[int] = 1000000) -> None:
+        self.data_dir = data_dir
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.wal_path = os.path.join(data_dir, WAL_FILE_NAME)
+        self.old_wal_path = os.path.join(data_dir, OLD_WAL_FILE_NAME)
+        self.snapshot_path = os.path.join(data_dir, SNAPSHOT_FILE_NAME)
+        self.database = None
+        self.wal = None
+        self._records_since_snapshot = 0
+        self.saver = BackgroundSave(self.snapshot_path)
+
+    def open(self, database: Optional[CustomDataBase] = None) -> CustomDataBase:
+        """
+        Восстановить данные с диска в database (или в новую базу данных)
+        и подписать журнал на её зафиксированные изменения.
+        :param database:
+        :return:
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+        if database is None:
+            database = CustomDataBase()
+        self.load(database)
+        if os.path.exists(self.old_wal_path):
+            # Прошлый снимок не был дописан. Старый журнал нельзя перезаписывать
+            # при следующей ротации, поэтому сначала сохраняем восстановленные данные.
+            logger.info('Запись снимка из %s ключей.', len(database.database))
+            write_snapshot(self.snapshot_path, database.committed_groups(), expires=database.committed_expires())
+            self._snapshot_written(True)
+        self.database = database
+        self.wal = WriteAheadLog(self.wal_path, self.fsync_policy, self.fsync_interval)
+        database.add_commit_listener(self._on_commit)
+        database.storage = self
+        return database
+
+    def load(self, database: CustomDataBase) -> None:
+        """
+        Загрузить в database снимок и применить к нему записи журналов.
+        Снимок загружается целыми группами ключей с одинаковым значением (load_grouped),
+        из записей журналов применяется только последнее изменение каждого ключа.
+        Повторное применение записей старого журнала к более новому снимку безопасно:
+        снимок отражает состояние после всех записей старого журнала.
+        Сроки жизни ключей восстанавливаются по моментам истечения из снимка и журналов,
+        ключи с истёкшим за время простоя сроком удаляются.
+        Неполный или повреждённый хвост текущего журнала обрезается: иначе новые записи
+        дописывались бы после него, и при следующем запуске чтение останавливалось бы перед ними.
+        :param database:
+        :return:
+        """
+        started = time.perf_counter()
+        expires: Dict[str, float] = {}
+        if os.path.exists(self.snapshot_path):
+            database.load_grouped(read_snapshot_groups(self.snapshot_path, expires))
+        else:
+            database.load_grouped(())
+        loaded = time.perf_counter()
+        changes: Dict[str, Record] = {}
+        replayed = 0
+        for path in (self.old_wal_path, self.wal_path):
+            if not os.path.exists(path):
+                continue
+            records = read_records(path)
+            try:
+                while True:
+                    record = next(records)
+                    changes[record[0]] = record
+                    replayed += 1
+            except StopIteration as stop:
+                valid_length = stop.value
+            if path == self.wal_path and valid_length < os.path.getsize(path):
+                logger.warning('Журнал %s обрезан до %s байт.', path, valid_length)
+                with open(path, 'r+b') as file:
+                    file.truncate(valid_length)
+                    os.fsync(file.fileno())
+        removed = [key for key, (_, value, _) in changes.items() if value is None]
+        if removed:
+            database.munset(removed)
+        # Ключи снимка со сроком жизни, не изменённые журналами, восстанавливаются со своими значениями.
+        data = database.database
+        records = [(key, data[key], expire_at) for key, expire_at in expires.items()
+                   if key not in changes and key in data]
+        records.extend(record for record in changes.values() if record[1] is not None)
+        database.restore(records)
+        logger.info('Восстановлено %s ключей за %.3f с (снимок - %.3f с), применено %s записей журнала.',
+                    len(database.database), time.perf_counter() - started, loaded - started, replayed)
+
+    def _on_commit(self, changes: List[Change]) -> None:
+        expire_at = self.database.expire_at
+        self.wal.append([(key, value, None if value is None else expire_at(key)) for key, _, value in changes])
+        self._records_since_snapshot += len(changes)
+        if self.snapshot_every and self._records_since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self, wait: bool = False) -> bool:
+        """
+        Начать запись снимка в фоновом процессе. Возвращает False, если предыдущий
+        снимок ещё пишется.
+        :param wait: дождаться окончания записи снимка.
+        :return:
+        """
+        if self.saver.in_progress:
+            return False
+        if os.path.exists(self.old_wal_path):
+            logger.warning('Предыдущий снимок не был записан, запись снимка без ротации журнала.')
+            self._snapshot_written(self.saver.save(self.database) is not None)
+            return True
+        self.wal.rotate(self.old_wal_path)
+        self._records_since_snapshot = 0
+        self.saver.start(self.database, on_done=self._snapshot_written)
+        if wait:
+            self.saver.wait()
+        return True
+
+    def save(self) -> Optional[int]:
+        """
+        Записать снимок в текущем процессе и вернуть количество ключей (None при ошибке записи).
+        :return:
+        """
+        self.saver.wait()
+        if not os.path.exists(self.old_wal_path):
+            self.wal.rotate(self.old_wal_path)
+            self._records_since_snapshot = 0
+        keys = self.saver.save(self.database)
+        self._snapshot_written(keys is not None)
+        return keys
+
+    def _snapshot_written(self, success: bool) -> None:
+        # Старый журнал удаляется, только если снимок, отражающий его записи, записан.
+        if success and os.path.exists(self.old_wal_path):
+            os.remove(self.old_wal_path)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.saver.stats()
+        stats['changes_since_last_save'] = self._records_since_snapshot
+        return stats
+
+    def close(self) -> None:
+        self.saver.close()
+        if self.wal:
+            self.wal.close()
+            self.wal = None
@@ -0,0 +1,195 @@
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional, Tuple, Union
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+
+from constants import (OK_TEXT, PROFILE_SAVED_TEXT, SLOWLOG_GET, SLOWLOG_LEN, Action, WrongInputException,
+                       WrongInputText)
+
+logger = logging.getLogger(__name__)
+
+# Порог журнала медленных команд в микросекундах и количество хранимых записей.
+SLOWLOG_THRESHOLD_US = 10000
+SLOWLOG_MAX_LEN = 128
+
+# Длина текста команды в записи журнала: длинные MSET и MGET обрезаются.
+SLOWLOG_MAX_COMMAND_LENGTH = 256
+
+# Каталог отчётов PROFILE STOP, файл отчёта по умолчанию и количество функций в отчёте.
+# Клиент указывает только имя файла: команда доступна по сети, и путь, выбранный клиентом,
+# позволял бы перезаписывать любые файлы с правами сервера.
+PROFILE_DIR = 'profiles'
+PROFILE_REPORT_FILE = 'profile.txt'
+PROFILE_REPORT_LINES = 50
+
+
+class SlowLogEntry(NamedTuple):
+    id: int
+    # Время завершения команды (time.time()).
+    timestamp: float
+    duration_us: int
+    # Строка команды с аргументами.
+    command: str
+    # Глубина транзакций клиента на момент завершения команды.
+    transaction_depth: int
+
+
+class SlowLog:
+    """
+    Журнал медленных команд: последние max_len команд, выполнявшихся дольше threshold_us
+    микросекунд, вместе с аргументами, длительностью и глубиной транзакций.
+    Запись быстрой команды - одно сравнение, поэтому журнал включён всегда.
+    Отрицательный порог выключает журнал, нулевой - записывает все команды.
+    >>>slowlog = SlowLog(threshold_us=1000)
+    >>>slowlog.record('FIND 5', 2500000, 0)
+    >>>slowlog.get()
+    [SlowLogEntry(id=0, timestamp=..., duration_us=2500, command='FIND 5', transaction_depth=0)]
+    """
+
+    def __init__(self, threshold_us: int = SLOWLOG_THRESHOLD_US, max_len: int = SLOWLOG_MAX_LEN) -> None:
+        self.threshold_us = threshold_us
+        self.entries: Deque[SlowLogEntry] = deque(maxlen=max_len)
+        # Номер следующей записи. Не сбрасывается командой SLOWLOG RESET.
+        self.next_id = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def record(self, command: str, nanoseconds: int, transaction_depth: int) -> None:
+        """
+        Записать команду, если она выполнялась не меньше порога.
+        :param command: строка команды.
+        :param nanoseconds: длительность выполнения.
+        :param transaction_depth:
+        :return:
+        """
+        if self.threshold_us < 0 or nanoseconds < self.threshold_us * 1000:
+            return
+        duration_us = nanoseconds // 1000
+        logger.warning('Медленная команда (%s мкс): %s', duration_us, command[:SLOWLOG_MAX_COMMAND_LENGTH])
+        self.entries.append(SlowLogEntry(self.next_id, time.time(), duration_us,
+                                         command[:SLOWLOG_MAX_COMMAND_LENGTH], transaction_depth))
+        self.next_id += 1
+
+    def get(self, count: Optional[int] = None) -> List[SlowLogEntry]:
+        """
+        Вернуть count последних записей (все, если count не указан), начиная с самой новой.
+        :param count:
+        :return:
+        """
+        entries = list(reversed(self.entries))
+        return entries if count is None else entries[:count]
+
+    def reset(self) -> None:
+        self.entries.clear()
+
+    @staticmethod
+    def format(entries: List[SlowLogEntry]) -> str:
+        """
+        Представить записи журнала по строке на команду:
+        номер, время, длительность в микросекундах, глубина транзакций и команда.
+        :param entries:
+        :return:
+        """
+        return '\n'.join(
+            f'{entry.id} {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.timestamp))} '
+            f'{entry.duration_us}us depth={entry.transaction_depth} {entry.command}'
+            for entry in entries)
+
+
+class CommandProfiler:
+    """
+    Профилировщик команд на основе cProfile. Включается только на время разбора
+    и выполнения строк с командами (with profiler: ...), поэтому ожидание ввода
+    и сетевой обмен в отчёт не попадают. Вложенные with допустимы.
+    >>>profiler = CommandProfiler()
+    >>>with profiler:
+    >>>    database.execute_command(*parse_command('GET A'))
+    >>>profiler.report('profile.txt')
+    """
+
+    def __init__(self) -> None:
+        self._profile = cProfile.Profile()
+        self._depth = 0
+        self.commands = 0
+
+    def __enter__(self) -> 'CommandProfiler':
+        if not self._depth:
+            self._profile.enable()
+            self.commands += 1
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._depth -= 1
+        if not self._depth:
+            self._profile.disable()
+
+    def report(self, path: str, lines: int = PROFILE_REPORT_LINES) -> None:
+        """
+        Записать в файл path отчёт: lines функций с наибольшим суммарным временем.
+        :param path:
+        :param lines:
+        :return:
+        """
+        self._profile.disable()
+        text = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=text)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(lines)
+        with open(path, 'w', encoding='utf-8') as report:
+            report.write(f'Команд: {self.commands}\n')
+            report.write(text.getvalue())
+        logger.info('Отчёт профилировщика записан в %s, команд: %s', path, self.commands)
+
+
+def execute_slowlog(slowlog: SlowLog, subcommand: str, arguments: Tuple = ()) -> Union[str, int]:
+    """
+    Выполнить команду SLOWLOG GET [N], SLOWLOG LEN или SLOWLOG RESET.
+    :param slowlog:
+    :param subcommand:
+    :param arguments: количество записей для SLOWLOG GET.
+    :return:
+    """
+    if subcommand == SLOWLOG_GET:
+        return SlowLog.format(slowlog.get(*arguments))
+    elif subcommand == SLOWLOG_LEN:
+        return len(slowlog)
+    slowlog.reset()
+    return OK_TEXT
+
+
+def report_path(name: Optional[str] = None) -> str:
+    """
+    Путь файла отчёта с именем name в каталоге PROFILE_DIR. Имя с каталогами
+    (в том числе '..') не принимается - возбуждает исключение WrongInputException.
+    :param name:
+    :return:
+    """
+    name = name or PROFILE_REPORT_FILE
+    if name in ('.', '..') or os.path.basename(name) != name or (os.altsep and os.altsep in name):
+        raise WrongInputException(Action.PROFILE, message=WrongInputText.PROFILE_WRONG_FILE.value)
+    return os.path.join(PROFILE_DIR, name)
+
+
+def stop_profile(profiler: Optional[CommandProfiler], name: Optional[str] = None) -> str:
+    """
+    Закончить профилирование (PROFILE STOP) и записать отчёт в файл name каталога PROFILE_DIR.
+    :param profiler: работающий профилировщик, None - профилирование не запущено.
+    :param name: имя файла без каталогов.
+    :return: ответ команды.
+    """
+    if profiler is None:
+        raise WrongInputException(Action.PROFILE, message=WrongInputText.PROFILE_NOT_RUNNING.value)
+    path = report_path(name)
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.report(path)
+    except OSError as e:
+        logger.exception('Не удалось записать отчёт профилировщика в %s', path)
+        raise WrongInputException(Action.PROFILE, message=WrongInputText.PROFILE_REPORT_FAILED.value.format(
+            error=e.strerror or e))
+    return PROFILE_SAVED_TEXT.format(path=path, commands=profiler.commands)
@@ -0,0 +1,382 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import os
+import struct
+import tempfile
+import time
+
+from constants import Action
+from custom_database import Change, CustomDataBase
+from persistence import BackgroundSave, decode_records, decode_snapshot, encode_record
+
+logger = logging.getLogger(__name__)
+
+# Строки протокола репликации. Реплика начинает соединение строкой
+# SYNC <идентификатор потока> <смещение> и раз в ACK_INTERVAL секунд сообщает
+# применённое смещение строкой ACK <смещение>. Ведущий сервер отвечает
+# CONTINUE (дальше идут недостающие кадры) или
+# FULLRESYNC <идентификатор потока> <смещение снимка> <размер снимка> (дальше снимок и кадры после него).
+SYNC_COMMAND = 'SYNC'
+ACK_COMMAND = 'ACK'
+CONTINUE_REPLY = 'CONTINUE'
+FULL_RESYNC_REPLY = 'FULLRESYNC'
+
+# Заголовок кадра потока изменений: длина записей одного коммита и время коммита
+# на ведущем сервере (time.time()). За заголовком идут записи в формате журнала предзаписи.
+# Кадр без записей - проверка связи, отправляется, если коммитов не было HEARTBEAT_INTERVAL секунд.
+_FRAME_HEADER = struct.Struct('<Id')
+
+HEARTBEAT_INTERVAL = 1.0
+ACK_INTERVAL = 1.0
+RECONNECT_INTERVAL = 1.0
+
+# Объём последних кадров потока (backlog), по которому переподключившаяся реплика
+# догоняет ведущий сервер без полного снимка.
+BACKLOG_SIZE = 1024 * 1024
+
+# Объём неотправленных реплике данных, после которого реплика считается отставшей и отключается.
+MAX_FOLLOWER_BUFFER = 64 * 1024 * 1024
+
+SNAPSHOT_CHUNK_SIZE = 1024 * 1024
+
+# Команды, изменяющие данные. Реплика их не выполняет.
+WRITE_COMMANDS = frozenset({Action.SET, Action.UNSET, Action.MSET, Action.MUNSET,
+                            Action.INCR, Action.DECR, Action.INCRBY, Action.DECRBY})
+
+
+class _FollowerLink:
+    """
+    Подключённая реплика на стороне ведущего сервера.
+    """
+
+    __slots__ = ('writer', 'address', 'acked_offset', 'acked_at')
+
+    def __init__(self, writer: asyncio.StreamWriter, offset: int) -> None:
+        self.writer = writer
+        self.address = writer.get_extra_info('peername')
+        self.acked_offset = offset
+        self.acked_at = time.monotonic()
+
+
+class ReplicationLeader:
+    """
+    Ведущая сторона репликации. Зафиксированные изменения базы данных (подписка на коммиты)
+    кодируются в кадры потока, отправляются подключённым репликам и сохраняются
+    в журнале последних кадров (backlog) размером backlog_size байт.
+    Позиция в потоке - смещение в байтах от начала потока с идентификатором replication_id.
+    Реплика, переподключившаяся со смещением, которое ещё есть в backlog, получает только
+    недостающие кадры; иначе - полный снимок зафиксированных данных, который записывает
+    дочерний процесс (persistence.BackgroundSave), и кадры после снимка.
+    Реплика, не успевающая принимать поток, отключается и после переподключения
+    синхронизируется заново.
+    Подписка на коммиты оформляется при подключении первой реплики.
+    >>>leader = ReplicationLeader(database)
+    >>>await leader.serve_follower(reader, writer, 'SYNC ? -1')
+    """
+
+    def __init__(self, database: CustomDataBase, backlog_size: int = BACKLOG_SIZE) -> None:
+        self.database = database
+        self.backlog_size = backlog_size
+        self.replication_id = os.urandom(8).hex()
+        self.offset = 0
+        self.full_resyncs = 0
+        self.partial_resyncs = 0
+        self.lagging_followers = 0
+        self._backlog = bytearray()
+        # Смещение первого байта backlog в потоке.
+        self._backlog_start = 0
+        self._links: Dict[asyncio.StreamWriter, _FollowerLink] = {}
+        self._last_frame = time.monotonic()
+        self._subscribed = False
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._snapshot_dir: Optional[tempfile.TemporaryDirectory] = None
+        self._saver: Optional[BackgroundSave] = None
+        self._snapshot_lock = asyncio.Lock()
+
+    def _subscribe(self) -> None:
+        if self._subscribed:
+            return
+        self._subscribed = True
+        self.database.add_commit_listener(self._on_commit)
+        self.database.replication = self
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    def _on_commit(self, changes: List[Change]) -> None:
+        expire_at = self.database.expire_at
+        self._append(b''.join(encode_record(key, value, None if value is None else expire_at(key))
+                              for key, _, value in changes))
+
+    def _append(self, records: bytes) -> None:
+        """
+        Добавить кадр с записями коммита в поток, backlog и буферы отправки реплик.
+        :param records:
+        :return:
+        """
+        frame = _FRAME_HEADER.pack(len(records), time.time()) + records
+        self.offset += len(frame)
+        backlog = self._backlog
+        backlog += frame
+        # backlog обрезается, когда вдвое превышает размер, чтобы сдвиг данных был амортизированно O(1).
+        if len(backlog) > 2 * self.backlog_size:
+            excess = len(backlog) - self.backlog_size
+            del backlog[:excess]
+            self._backlog_start += excess
+        for link in list(self._links.values()):
+            if link.writer.transport.get_write_buffer_size() > MAX_FOLLOWER_BUFFER:
+                logger.warning('Реплика %s не успевает принимать изменения и отключена.', link.address)
+                self.lagging_followers += 1
+                del self._links[link.writer]
+                link.writer.close()
+            else:
+                link.writer.write(frame)
+        self._last_frame = time.monotonic()
+
+    def _since(self, offset: int) -> Optional[bytes]:
+        """
+        Кадры потока начиная со смещения offset или None, если их уже нет в backlog.
+        :param offset:
+        :return:
+        """
+        if not self._backlog_start <= offset <= self.offset:
+            return None
+        return bytes(self._backlog[offset - self._backlog_start:])
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if self._links and time.monotonic() - self._last_frame >= HEARTBEAT_INTERVAL:
+                self._append(b'')
+
+    async def serve_follower(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, line: str) -> None:
+        """
+        Обслужить соединение реплики, начатое строкой SYNC <идентификатор потока> <смещение>:
+        синхронизировать реплику, затем принимать подтверждения применённых смещений.
+        Кадры новых коммитов отправляются из _append.
+        :param reader:
+        :param writer:
+        :param line:
+        :return:
+        """
+        try:
+            _, replication_id, offset = line.split()
+            offset = int(offset)
+        except ValueError:
+            writer.write(b'-' + line.strip().encode() + b'\n')
+            return
+        self._subscribe()
+        backlog = self._since(offset) if replication_id == self.replication_id else None
+        if backlog is not None:
+            logger.info('Частичная синхронизация реплики со смещения %s.', offset)
+            self.partial_resyncs += 1
+            writer.write(f'{CONTINUE_REPLY}\n'.encode() + backlog)
+        else:
+            offset = await self._send_snapshot(writer)
+            if offset is None:
+                return
+        link = self._links[writer] = _FollowerLink(writer, offset)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, acked = line.decode().partition(' ')
+                if command == ACK_COMMAND:
+                    link.acked_offset = int(acked)
+                    link.acked_at = time.monotonic()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self._links.pop(writer, None)
+
+    async def _send_snapshot(self, writer: asyncio.StreamWriter) -> Optional[int]:
+        """
+        Записать снимок зафиксированных данных в дочернем процессе, отправить его реплике
+        вместе с кадрами, накопившимися за время записи, и вернуть смещение,
+        с которого реплика получает поток. None - снимок записать не удалось
+        или накопившихся кадров уже нет в backlog.
+        :param writer:
+        :return:
+        """
+        async with self._snapshot_lock:
+            if self._saver is None:
+                self._snapshot_dir = tempfile.TemporaryDirectory(prefix='replication')
+                self._saver = BackgroundSave(os.path.join(self._snapshot_dir.name, 'replication.snapshot'))
+            loop = asyncio.get_running_loop()
+            done = loop.create_future()
+            # Между снимком и смещением нет коммитов: fork выполняется в цикле событий между командами.
+            offset = self.offset
+            self._saver.start(self.database,
+                              on_done=lambda success: loop.call_soon_threadsafe(done.set_result, success))
+            if not await done:
+                logger.error('Не удалось записать снимок для полной синхронизации реплики.')
+                return None
+            path = self._saver.path
+            writer.write(f'{FULL_RESYNC_REPLY} {self.replication_id} {offset} {os.path.getsize(path)}\n'.encode())
+            with open(path, 'rb') as file:
+                while True:
+                    chunk = file.read(SNAPSHOT_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+            backlog = self._since(offset)
+            if backlog is None:
+                logger.warning('Изменения за время передачи снимка не поместились в backlog, '
+                               'реплика будет синхронизирована заново.')
+                return None
+            writer.write(backlog)
+            self.full_resyncs += 1
+            logger.info('Полная синхронизация реплики: %s ключей.', self._saver.last_keys)
+            return offset
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            'role'                : 'leader',
+            'replication_id'      : self.replication_id,
+            'replication_offset'  : self.offset,
+            'replication_backlog' : len(self._backlog),
+            'connected_followers' : len(self._links),
+            'full_resyncs'        : self.full_resyncs,
+            'partial_resyncs'     : self.partial_resyncs,
+            'lagging_followers'   : self.lagging_followers,
+        }
+        now = time.monotonic()
+        for number, link in enumerate(self._links.values()):
+            stats[f'follower_{number}'] = (f'address={link.address[0]}:{link.address[1]} '
+                                           f'offset={link.acked_offset} '
+                                           f'lag_bytes={self.offset - link.acked_offset} '
+                                           f'ack_seconds_ago={now - link.acked_at:.1f}')
+        return stats
+
+    def close(self) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        for writer in list(self._links):
+            writer.close()
+        self._links.clear()
+        if self._saver is not None:
+            self._saver.close()
+            self._snapshot_dir.cleanup()
+
+
+class ReplicationFollower:
+    """
+    Реплика: подключается к ведущему серверу, получает полный снимок или недостающие
+    кадры потока и применяет коммиты ведущего сервера к своей базе данных в порядке потока.
+    Кадры применяются в том же цикле событий, в котором реплика выполняет команды чтения,
+    поэтому каждый коммит ведущего сервера виден клиентам реплики целиком.
+    При разрыве соединения реплика переподключается каждые RECONNECT_INTERVAL секунд
+    с последним применённым смещением.
+    Отставание (replication_lag_ms) - задержка применения последнего кадра
+    относительно времени коммита на ведущем сервере.
+    >>>follower = ReplicationFollower(CustomDataBase(), '127.0.0.1', 7878)
+    >>>asyncio.create_task(follower.run())
+    """
+
+    def __init__(self, database: CustomDataBase, host: str, port: int) -> None:
+        self.database = database
+        self.host = host
+        self.port = port
+        self.replication_id = '?'
+        self.offset = -1
+        self.connected = False
+        self.full_resyncs = 0
+        self.partial_resyncs = 0
+        self.lag = 0.0
+        self._last_io: Optional[float] = None
+        database.replication = self
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self._replicate()
+            except (OSError, EOFError, ValueError) as e:
+                logger.warning('Соединение с ведущим сервером %s:%s потеряно: %s', self.host, self.port, e)
+            self.connected = False
+            await asyncio.sleep(RECONNECT_INTERVAL)
+
+    async def _replicate(self) -> None:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(f'{SYNC_COMMAND} {self.replication_id} {self.offset}\n'.encode())
+            reply = (await reader.readline()).decode().split()
+            if reply and reply[0] == FULL_RESYNC_REPLY:
+                _, replication_id, offset, size = reply
+                self._load_snapshot(await reader.readexactly(int(size)))
+                self.replication_id = replication_id
+                self.offset = int(offset)
+                self.full_resyncs += 1
+            elif reply and reply[0] == CONTINUE_REPLY:
+                self.partial_resyncs += 1
+            else:
+                raise ValueError(f'неожиданный ответ {" ".join(reply)!r}')
+            logger.info('Реплика синхронизирована с %s:%s, смещение %s.', self.host, self.port, self.offset)
+            self.connected = True
+            acks = asyncio.create_task(self._send_acks(writer))
+            try:
+                while True:
+                    length, committed_at = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+                    if length:
+                        self.apply(await reader.readexactly(length))
+                    self.offset += _FRAME_HEADER.size + length
+                    self.lag = max(0.0, time.time() - committed_at)
+                    self._last_io = time.monotonic()
+            finally:
+                acks.cancel()
+        finally:
+            writer.close()
+
+    async def _send_acks(self, writer: asyncio.StreamWriter) -> None:
+        while True:
+            writer.write(f'{ACK_COMMAND} {self.offset}\n'.encode())
+            await writer.drain()
+            await asyncio.sleep(ACK_INTERVAL)
+
+    def _load_snapshot(self, snapshot: bytes) -> None:
+        """
+        Привести данные реплики к снимку ведущего сервера. Изменения применяются
+        командами MUNSET и restore (как MSET, вместе со сроками жизни), а не заменой словаря данных,
+        чтобы подписчики на коммиты реплики (снимки MVCC, журнал предзаписи) получили их
+        как обычные коммиты.
+        :param snapshot:
+        :return:
+        """
+        expires: Dict[str, float] = {}
+        data = {key: value for value, keys in decode_snapshot(snapshot, expires) for key in keys}
+        stale = [key for key in self.database.database if key not in data]
+        if stale:
+            self.database.munset(stale)
+        self.database.restore([(key, value, expires.get(key)) for key, value in data.items()])
+        logger.info('Загружен снимок ведущего сервера: %s ключей.', len(data))
+
+    def apply(self, records: bytes) -> None:
+        """
+        Применить записи одного коммита ведущего сервера.
+        Каждый ключ встречается в коммите один раз, поэтому порядок записи и удаления не важен.
+        :param records:
+        :return:
+        """
+        restored, removed = [], []
+        for record in decode_records(records, 0, 'replication'):
+            if record[1] is None:
+                removed.append(record[0])
+            else:
+                restored.append(record)
+        if restored:
+            self.database.restore(restored)
+        if removed:
+            self.database.munset(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'role'               : 'follower',
+            'leader'             : f'{self.host}:{self.port}',
+            'leader_link'        : 'up' if self.connected else 'down',
+            'replication_id'     : self.replication_id,
+            'replication_offset' : self.offset,
+            'replication_lag_ms' : round(self.lag * 1000, 3),
+            'last_io_seconds_ago': round(time.monotonic() - self._last_io, 1) if self._last_io else -1,
+            'full_resyncs'       : self.full_resyncs,
+            'partial_resyncs'    : self.partial_resyncs,
+        }
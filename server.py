@@ -0,0 +1,260 @@
+from time import perf_counter_ns
+from typing import Iterator, List, Optional, Tuple, Union
+import asyncio
+import logging
+
+from constants import HELP_TEXT, Action, WrongInputException, WrongInputText
+from custom_database import CustomDataBase
+from input_filter import parse_command
+from mvcc import VersionStore
+from replication import SYNC_COMMAND, WRITE_COMMANDS, ReplicationFollower, ReplicationLeader
+from session import Session
+
+logger = logging.getLogger(__name__)
+
+# Ответы протокола. Каждый ответ начинается с символа типа:
+#   +текст   - результат команды в одну строку (+OK, если результата нет);
+#   -текст   - ошибка;
+#   *N       - результат из N строк, которые следуют за этой строкой.
+OK_REPLY = b'+OK\n'
+
+# Начало строки, которой реплика открывает соединение репликации.
+SYNC_PREFIX = SYNC_COMMAND.encode() + b' '
+
+# Максимальная длина строки запроса и ответ на более длинную строку, после которого соединение закрывается.
+MAX_LINE_LENGTH = 64 * 1024 * 1024
+LINE_TOO_LONG_REPLY = b'-Line too long\n'
+
+# Размер блока, читаемого из соединения за один вызов.
+READ_SIZE = 64 * 1024
+
+# Период фонового удаления ключей с истёкшим сроком жизни и максимум ключей за один проход.
+EXPIRE_INTERVAL = 0.1
+EXPIRE_BATCH_SIZE = 1000
+
+
+def encode_reply(result) -> bytes:
+    """
+    Закодировать результат команды в ответ протокола.
+    :param result:
+    :return:
+    """
+    if result is None:
+        return OK_REPLY
+    if isinstance(result, Iterator):
+        # Потоковый результат FIND читается сразу: следующая команда может изменить данные.
+        # Объём ответа ограничивают параметром LIMIT.
+        text = ''.join(result)
+    else:
+        text = str(result)
+    if '\n' not in text:
+        return b'+' + text.encode() + b'\n'
+    lines = text.split('\n')
+    return f'*{len(lines)}\n'.encode() + text.encode() + b'\n'
+
+
+def encode_value(value: Union[bytes, memoryview]) -> bytes:
+    """
+    Закодировать в ответ значение GET, полученное в UTF-8 (CustomDataBase.execute_get):
+    байты копируются в ответ один раз, memoryview после этого освобождается.
+    :param value:
+    :return:
+    """
+    try:
+        reply = b''.join((b'+', value, b'\n'))
+    finally:
+        if isinstance(value, memoryview):
+            value.release()
+    if reply.find(b'\n', 1, -1) >= 0:
+        return encode_reply(reply[1:-1].decode())
+    return reply
+
+
+def encode_error(error: WrongInputException) -> bytes:
+    return b'-' + error.message.replace('\n', ' ').encode() + b'\n'
+
+
+class DatabaseServer:
+    """
+    Асинхронный TCP-сервер, принимающий те же строки с командами, что и main.py.
+    Каждое соединение получает свой сеанс (session.Session) со своим стеком транзакций.
+    Транзакции сеансов читают согласованные снимки данных (mvcc.VersionStore)
+    и отменяются при конфликте записи с другим сеансом.
+    Клиент может отправлять команды пакетами, не дожидаясь ответов: ответы приходят
+    в порядке команд, по одному на каждую строку запроса.
+    Сервер является ведущим для реплик (replication.ReplicationLeader), подключившихся
+    строкой SYNC, а если указан replica_of (адрес и порт ведущего сервера) - сам работает
+    репликой: применяет поток изменений ведущего сервера и выполняет только команды чтения.
+    >>>server = DatabaseServer(CustomDataBase(), port=7878)
+    >>>asyncio.run(server.serve_forever())
+    """
+
+    def __init__(self, database: CustomDataBase, host: str = '127.0.0.1', port: int = 7878,
+                 backlog: int = 4096, replica_of: Optional[Tuple[str, int]] = None) -> None:
+        self.database = database
+        self.versions = VersionStore(database)
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.connections = 0
+        self.server: Optional[asyncio.base_events.Server] = None
+        self._expire_task: Optional[asyncio.Task] = None
+        self.leader: Optional[ReplicationLeader] = None
+        self.follower: Optional[ReplicationFollower] = None
+        if replica_of is None:
+            self.leader = ReplicationLeader(database)
+        else:
+            self.follower = ReplicationFollower(database, *replica_of)
+        self._replication_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                 backlog=self.backlog, limit=MAX_LINE_LENGTH)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self._expire_task = asyncio.create_task(self._expire_keys())
+        if self.follower is not None:
+            self._replication_task = asyncio.create_task(self.follower.run())
+        logger.info('Сервер слушает %s:%s', self.host, self.port)
+
+    async def serve_forever(self) -> None:
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _expire_keys(self) -> None:
+        """
+        Фоновая задача цикла событий: удалять ключи с истёкшим сроком жизни,
+        даже если к ним никто не обращается. Проход ограничен EXPIRE_BATCH_SIZE ключами,
+        чтобы не задерживать обработку команд; если истёкших ключей больше,
+        следующий проход начинается сразу.
+        :return:
+        """
+        while True:
+            expired = self.database.expire_due(EXPIRE_BATCH_SIZE)
+            await asyncio.sleep(0 if expired == EXPIRE_BATCH_SIZE else EXPIRE_INTERVAL)
+
+    async def close(self) -> None:
+        if self._expire_task is not None:
+            self._expire_task.cancel()
+        if self._replication_task is not None:
+            self._replication_task.cancel()
+        if self.leader is not None:
+            self.leader.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def execute_line(self, session: Session, line: bytes) -> Tuple[bytes, bool]:
+        """
+        Выполнить одну строку запроса. Возвращает ответ и признак закрытия соединения.
+        Разбор и выполнение строки замеряются для журнала медленных команд (SLOWLOG)
+        и, после PROFILE START, профилируются.
+        :param session:
+        :param line:
+        :return:
+        """
+        database = self.database
+        started = perf_counter_ns()
+        profiler = database.profiler
+        if profiler is None:
+            result = self.run_line(session, line)
+        else:
+            with profiler:
+                result = self.run_line(session, line)
+        elapsed = perf_counter_ns() - started
+        if elapsed >= database.slowlog.threshold_us * 1000:
+            database.slowlog.record(line.decode(errors='replace'), elapsed, session.transaction_depth)
+        return result
+
+    def run_line(self, session: Session, line: bytes) -> Tuple[bytes, bool]:
+        """
+        Разобрать и выполнить строку запроса. Результат совпадает с execute_line.
+        :param session:
+        :param line:
+        :return:
+        """
+        try:
+            parsed_command = parse_command(line.decode())
+            if parsed_command.command is Action.END:
+                return OK_REPLY, True
+            elif parsed_command.command is Action.HELP:
+                return encode_reply(HELP_TEXT), False
+            elif self.follower is not None and parsed_command.command in WRITE_COMMANDS:
+                raise WrongInputException(parsed_command.command, message=WrongInputText.READ_ONLY_REPLICA.value)
+            elif (parsed_command.command is Action.GET and not session.transaction_stack
+                  and session.optimistic.queue is None):
+                # Вне транзакций сеанса значение читается из базы данных сразу в кодировке ответа.
+                return encode_value(session.database.execute_get(parsed_command.key)), False
+            return encode_reply(session.execute_command(*parsed_command)), False
+        except WrongInputException as e:
+            return encode_error(e), False
+        except UnicodeDecodeError:
+            return b'-Invalid encoding\n', False
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = Session(self.database, self.versions)
+        self.connections += 1
+        # Начало строки, перевод строки которой ещё не получен.
+        buffer = bytearray()
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if data:
+                    # Перевод строки ищется только в новом блоке, поэтому длинная строка,
+                    # приходящая многими блоками, не просматривается заново с начала.
+                    end = data.rfind(b'\n')
+                    if end < 0:
+                        buffer += data
+                        if len(buffer) > MAX_LINE_LENGTH:
+                            writer.write(LINE_TOO_LONG_REPLY)
+                            await writer.drain()
+                            break
+                        continue
+                    end += len(buffer)
+                    buffer += data
+                    lines = bytes(buffer[:end]).split(b'\n')
+                    del buffer[:end + 1]
+                elif buffer:
+                    # Последняя строка перед закрытием соединения может не заканчиваться переводом строки.
+                    lines = [bytes(buffer)]
+                else:
+                    break
+                # Все строки, полученные одним блоком, выполняются без возврата в цикл событий,
+                # а ответы на них отправляются одной записью.
+                if await self.execute_lines(session, lines, reader, writer) or not data:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            # Незафиксированные транзакции сеанса отбрасываются при разрыве соединения.
+            session.close()
+            writer.close()
+
+    async def execute_lines(self, session: Session, lines: List[bytes],
+                            reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """
+        Выполнить строки запросов и отправить ответы одной записью. Возвращает True,
+        если соединение нужно закрыть: после END или после обслуживания соединения реплики.
+        :param session:
+        :param lines:
+        :param reader:
+        :param writer:
+        :return:
+        """
+        replies: List[bytes] = []
+        stop = False
+        for line in lines:
+            if line.startswith(SYNC_PREFIX) and self.leader is not None:
+                # Реплика ждёт ответа на SYNC, поэтому других строк после неё в блоке нет.
+                writer.write(b''.join(replies))
+                await self.leader.serve_follower(reader, writer, line.decode())
+                return True
+            reply, stop = self.execute_line(session, line)
+            replies.append(reply)
+            if stop:
+                break
+        writer.write(b''.join(replies))
+        await writer.drain()
+        return stop
@@ -0,0 +1,481 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple, Union
+import logging
+
+from constants import STATS_JSON_OPTION, Action, WrongInputException, WrongInputText
+from custom_database import CustomDataBase, page_after
+from metrics import format_stats
+from mvcc import VersionStore
+from ordered_index import Number, parse_number
+from optimistic import OptimisticTransaction
+
+logger = logging.getLogger(__name__)
+
+# Маркер удалённого в транзакции сеанса ключа.
+_DELETED = object()
+# Маркер в стеке сроков жизни: ключ изменён командой INCR, срок жизни сохраняется.
+_KEEP_TTL = object()
+
+
+class Session:
+    """
+    Клиентский сеанс работы с общей базой данных CustomDataBase со своим стеком транзакций.
+    Изменения внутри транзакций сеанса накапливаются в собственных словарях сеанса
+    и не видны другим сеансам до коммита самой внешней транзакции,
+    после чего применяются к общей базе данных одним коммитом.
+    Вне транзакций команды выполняются непосредственно над общей базой данных.
+    Если передано хранилище версий mvcc.VersionStore, транзакция читает согласованный
+    снимок данных на момент BEGIN, а COMMIT отменяет транзакцию, если изменённые в ней
+    ключи успел изменить другой сеанс (побеждает первый зафиксировавший).
+    >>>database = CustomDataBase()
+    >>>session = Session(database)
+    >>>session.begin_transaction()
+    >>>session.set('A', '5')
+    >>>database.database
+    {}
+    >>>session.commit_transaction()
+    >>>database.database
+    {'A': '5'}
+    """
+
+    def __init__(self, database: CustomDataBase, versions: Optional[VersionStore] = None) -> None:
+        self.database = database
+        self.versions = versions
+        # Стек изменений транзакций: ключ -> новое значение или _DELETED.
+        self.transaction_stack: List[Dict[str, Any]] = []
+        # Параллельный стек сроков жизни ключей, записанных командой SET ... EX
+        # (или _KEEP_TTL для ключей, изменённых командой INCR).
+        self.ttl_stack: List[Dict[str, Any]] = []
+        # Номер снимка, который читает открытая транзакция.
+        self.snapshot: Optional[int] = None
+        # Состояние WATCH/MULTI сеанса. Версии ключей общие для всех сеансов базы данных.
+        self.optimistic = OptimisticTransaction(database)
+
+    @property
+    def transaction_depth(self) -> int:
+        return len(self.transaction_stack)
+
+    def _base_value(self, key: str) -> Any:
+        """
+        Значение ключа без учёта изменений сеанса: из снимка транзакции,
+        либо последнее зафиксированное.
+        :param key:
+        :return:
+        """
+        if self.snapshot is None:
+            return self.database.database.get(key, _DELETED)
+        value = self.versions.read(key, self.snapshot)
+        return _DELETED if value is None else value
+
+    def _lookup(self, key: str) -> Any:
+        for changes in reversed(self.transaction_stack):
+            if key in changes:
+                return changes[key]
+        return self._base_value(key)
+
+    def _merged_changes(self) -> Dict[str, Any]:
+        merged = {}
+        for changes in self.transaction_stack:
+            merged.update(changes)
+        return merged
+
+    def get(self, key: str) -> Any:
+        """
+        Вернуть значение по ключу с учётом изменений открытых транзакций сеанса.
+        :param key:
+        :return:
+        """
+        if not self.transaction_stack:
+            return self.database.get(key)
+        value = self._lookup(key)
+        if value is _DELETED:
+            raise WrongInputException(Action.GET, key=key, message=WrongInputText.NULL.value)
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        if not self.transaction_stack:
+            self.database.set(key, value, ttl)
+            return
+        self.transaction_stack[-1][key] = value
+        if ttl is None:
+            self.ttl_stack[-1].pop(key, None)
+        else:
+            self.ttl_stack[-1][key] = ttl
+
+    def increment(self, key: str, amount: int) -> int:
+        if not self.transaction_stack:
+            return self.database.increment(key, amount)
+        value = self._lookup(key)
+        number = self.database._integer(key, None if value is _DELETED else value) + amount
+        ttl = self._pending_ttl(key)
+        self.transaction_stack[-1][key] = str(number)
+        self.ttl_stack[-1][key] = ttl
+        return number
+
+    def _pending_ttl(self, key: str) -> Any:
+        # Срок жизни, который получит ключ при коммите: записанный последней изменившей ключ
+        # транзакцией сеанса (None - снят командой SET без EX), иначе сохраняется текущий.
+        for changes, ttls in zip(reversed(self.transaction_stack), reversed(self.ttl_stack)):
+            if key in changes:
+                return ttls.get(key)
+        return _KEEP_TTL
+
+    def unset(self, key: str) -> None:
+        if not self.transaction_stack:
+            self.database.unset(key)
+        elif self._lookup(key) is _DELETED:
+            raise WrongInputException(Action.UNSET, key=key,
+                                      message=f"Ошибка: Аргумент {key} отсутствует в базе данных.")
+        else:
+            self.transaction_stack[-1][key] = _DELETED
+            self.ttl_stack[-1].pop(key, None)
+
+    def mset(self, pairs: Sequence[Tuple[str, str]]) -> None:
+        if not self.transaction_stack:
+            self.database.mset(pairs)
+            return
+        self.transaction_stack[-1].update(pairs)
+        ttls = self.ttl_stack[-1]
+        if ttls:
+            for key, _ in pairs:
+                ttls.pop(key, None)
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        if not self.transaction_stack:
+            return self.database.mget(keys)
+        values = [self._lookup(key) for key in keys]
+        return [None if value is _DELETED else value for value in values]
+
+    def munset(self, keys: Sequence[str]) -> int:
+        if not self.transaction_stack:
+            return self.database.munset(keys)
+        removed = 0
+        for key in keys:
+            if self._lookup(key) is not _DELETED:
+                self.transaction_stack[-1][key] = _DELETED
+                self.ttl_stack[-1].pop(key, None)
+                removed += 1
+        return removed
+
+    def counts(self, value: Any) -> int:
+        """
+        Подсчитать ключи со значением value.
+        Сложность - O(1) вне транзакций, O(m) внутри, где m - количество изменений сеанса.
+        :param value:
+        :return:
+        """
+        if not self.transaction_stack:
+            return self.database.counts(value)
+        if self.snapshot is None:
+            count = self.database.counts(value)
+        else:
+            count = self.versions.counts(value, self.snapshot)
+        for key, new_value in self._merged_changes().items():
+            count += (new_value == value) - (self._base_value(key) == value)
+        return count
+
+    def find(self, value: Any) -> List[str]:
+        """
+        Вернуть ключи со значением value с учётом изменений открытых транзакций сеанса.
+        :param value:
+        :return:
+        """
+        if not self.transaction_stack:
+            return self.database.find(value)
+        if self.snapshot is None:
+            keys = self.database.find(value)
+        else:
+            keys = self.versions.find(value, self.snapshot)
+        changes = self._merged_changes()
+        result = [key for key in keys if key not in changes or changes[key] == value]
+        result.extend(key for key, new_value in changes.items()
+                      if new_value == value and self._base_value(key) != value)
+        return result
+
+    def counts_between(self, low: Number, high: Number) -> int:
+        """
+        Подсчитать ключи с числовыми значениями от low до high с учётом транзакции сеанса.
+        Результат общей базы данных поправляется по ключам из _changed_keys.
+        :param low:
+        :param high:
+        :return:
+        """
+        count = self.database.counts_between(low, high)
+        if self.transaction_stack:
+            committed = self.database.database
+            for key in self._changed_keys():
+                count += (self._in_range(self._lookup(key), low, high)
+                          - self._in_range(committed.get(key, _DELETED), low, high))
+        return count
+
+    def find_between(self, low: Number, high: Number) -> List[str]:
+        """
+        Вернуть ключи с числовыми значениями от low до high по возрастанию значений
+        с учётом транзакции сеанса.
+        :param low:
+        :param high:
+        :return:
+        """
+        keys = self.database.find_between(low, high)
+        if not self.transaction_stack:
+            return keys
+        changed = self._changed_keys()
+        committed = self.database.database
+        matches = [(parse_number(committed[key]), key) for key in keys if key not in changed]
+        for key in changed:
+            value = self._lookup(key)
+            if self._in_range(value, low, high):
+                matches.append((parse_number(value), key))
+        matches.sort(key=lambda match: match[0])
+        return [key for _, key in matches]
+
+    @staticmethod
+    def _in_range(value: Any, low: Number, high: Number) -> bool:
+        if value is _DELETED:
+            return False
+        number = parse_number(value)
+        return number is not None and low <= number <= high
+
+    def find_page(self, value: Any, cursor: Optional[str] = None,
+                  count: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Страница ключей со значением value после cursor с учётом транзакции сеанса.
+        Интерфейс совпадает с CustomDataBase.find_page.
+        :param value:
+        :param cursor:
+        :param count:
+        :return:
+        """
+        count = count or self.database.KEYS_PAGE_SIZE
+        if not self.transaction_stack:
+            return self.database.find_page(value, cursor, count)
+        return page_after(self.find(value), cursor, count)
+
+    def _changed_keys(self) -> Set[str]:
+        """
+        Ключи, значение которых в транзакции сеанса может отличаться от последнего
+        зафиксированного: изменённые сеансом и изменённые другими после снимка.
+        :return:
+        """
+        changed = set(self._merged_changes())
+        if self.snapshot is not None:
+            changed.update(self.versions.changed_since(self.snapshot))
+        return changed
+
+    def _visible_keys(self, keys: List[str], matches: Callable[[str], bool]) -> List[str]:
+        """
+        Поправить упорядоченный список ключей общей базы данных с учётом транзакции сеанса:
+        из изменённых ключей, удовлетворяющих matches, остаются только существующие в транзакции.
+        :param keys:
+        :param matches:
+        :return:
+        """
+        changed = self._changed_keys()
+        visible = {key for key in keys if key not in changed}
+        visible.update(key for key in changed if matches(key) and self._lookup(key) is not _DELETED)
+        return sorted(visible)
+
+    def scan(self, prefix: str) -> List[str]:
+        keys = self.database.scan(prefix)
+        if not self.transaction_stack:
+            return keys
+        return self._visible_keys(keys, lambda key: key.startswith(prefix))
+
+    def key_range(self, start: str, stop: str) -> List[str]:
+        keys = self.database.key_range(start, stop)
+        if not self.transaction_stack:
+            return keys
+        return self._visible_keys(keys, lambda key: start <= key <= stop)
+
+    def keys_page(self, cursor: Optional[str] = None, count: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Страница ключей после cursor с учётом транзакции сеанса.
+        Интерфейс совпадает с CustomDataBase.keys_page.
+        :param cursor:
+        :param count:
+        :return:
+        """
+        count = count or self.database.KEYS_PAGE_SIZE
+        keys, next_cursor = self.database.keys_page(cursor, count)
+        if not self.transaction_stack:
+            return keys, next_cursor
+        # Страница общей базы данных покрывает ключи до next_cursor включительно.
+        keys = self._visible_keys(keys, lambda key: ((cursor is None or key > cursor)
+                                                     and (next_cursor is None or key <= next_cursor)))
+        if len(keys) > count:
+            keys = keys[:count]
+            return keys, keys[-1]
+        return keys, next_cursor
+
+    def begin_transaction(self) -> None:
+        if self.versions is not None and not self.transaction_stack:
+            self.snapshot = self.versions.acquire_snapshot()
+        self.transaction_stack.append({})
+        self.ttl_stack.append({})
+
+    def rollback_transaction(self) -> None:
+        if not self.transaction_stack:
+            raise WrongInputException(Action.ROLLBACK, message=WrongInputText.NO_TRANSACTIONS_TO_ROLLBACK.value)
+        self.transaction_stack.pop()
+        self.ttl_stack.pop()
+        if not self.transaction_stack:
+            self._release_snapshot()
+
+    def _release_snapshot(self) -> None:
+        if self.snapshot is not None:
+            self.versions.release_snapshot(self.snapshot)
+            self.snapshot = None
+
+    def close(self) -> None:
+        """
+        Отбросить незафиксированные транзакции сеанса и освободить его снимок.
+        :return:
+        """
+        self.transaction_stack.clear()
+        self.ttl_stack.clear()
+        self._release_snapshot()
+        self.optimistic.close()
+
+    def commit_transaction(self) -> None:
+        """
+        Зафиксировать текущую транзакцию сеанса. Изменения вложенной транзакции переходят
+        в родительскую, изменения самой внешней применяются к общей базе данных.
+        При конфликте с коммитом другого сеанса транзакция отменяется
+        и возбуждается исключение WrongInputException.
+        :return:
+        """
+        if not self.transaction_stack:
+            raise WrongInputException(Action.COMMIT, message=WrongInputText.NO_TRANSACTIONS_TO_COMMIT.value)
+        changes = self.transaction_stack.pop()
+        ttls = self.ttl_stack.pop()
+        if self.transaction_stack:
+            self.transaction_stack[-1].update(changes)
+            parent_ttls = self.ttl_stack[-1]
+            for key in changes:
+                parent_ttls.pop(key, None)
+            parent_ttls.update(ttls)
+            return
+        try:
+            if self.snapshot is not None:
+                conflicts = self.versions.conflicts(changes, self.snapshot)
+                if conflicts:
+                    raise WrongInputException(Action.COMMIT, message=WrongInputText.TRANSACTION_CONFLICT.value.format(
+                        keys=' '.join(conflicts)))
+            self._apply(changes, ttls)
+        finally:
+            self._release_snapshot()
+
+    def _apply(self, changes: Dict[str, Any], ttls: Dict[str, Any]) -> None:
+        # Изменения применяются внутри транзакции общей базы данных,
+        # чтобы подписчики (журнал предзаписи) получили их одним коммитом.
+        # Удаление - через munset: ключ, срок жизни которого истёк после чтения, пропускается.
+        # При ошибке общая транзакция откатывается, чтобы не остаться открытой.
+        database = self.database
+        database.begin_transaction()
+        try:
+            database.munset([key for key, value in changes.items() if value is _DELETED])
+            for key, value in changes.items():
+                if value is not _DELETED:
+                    ttl = ttls.get(key)
+                    if ttl is _KEEP_TTL:
+                        database.set(key, value, keep_ttl=True)
+                    else:
+                        database.set(key, value, ttl)
+        except BaseException:
+            database.rollback_transaction()
+            raise
+        database.commit_transaction()
+
+    def execute_batch(self, commands: Sequence[Tuple]) -> List[Union[str, int, None, WrongInputException]]:
+        """
+        Выполнить пакет команд (очередь EXEC). Вне транзакций сеанса пакет выполняется
+        над общей базой данных и фиксируется одним коммитом, внутри - попадает в транзакцию сеанса.
+        Интерфейс совпадает с CustomDataBase.execute_batch.
+        :param commands:
+        :return:
+        """
+        if not self.transaction_stack:
+            return self.database.execute_batch(commands)
+        results: List[Any] = []
+        for command in commands:
+            try:
+                results.append(self.execute_command(*command))
+            except WrongInputException as e:
+                results.append(e)
+        return results
+
+    def execute_command(self, command, key=None, value=None, ttl=None, arguments=()) -> Union[str, int, None]:
+        """
+        Выполнить команду в рамках сеанса. Интерфейс совпадает с CustomDataBase.execute_command.
+        :param command:
+        :param key:
+        :param value:
+        :param ttl:
+        :param arguments:
+        :return:
+        """
+        optimistic = self.optimistic
+        if optimistic.queue is not None and command is not Action.EXEC and command is not Action.DISCARD:
+            return optimistic.enqueue(command, key, value, ttl, arguments)
+        elif command is Action.WATCH:
+            optimistic.watch(arguments)
+            return
+        elif command is Action.UNWATCH:
+            optimistic.unwatch()
+            return
+        elif command is Action.MULTI:
+            optimistic.multi()
+            return
+        elif command is Action.EXEC:
+            return self.database.format_results(optimistic.execute(self.execute_batch))
+        elif command is Action.DISCARD:
+            optimistic.discard()
+            return
+        elif command is Action.BEGIN:
+            self.begin_transaction()
+            return
+        elif command is Action.ROLLBACK:
+            self.rollback_transaction()
+            return
+        elif command is Action.COMMIT:
+            self.commit_transaction()
+            return
+        elif command is Action.STATS and self.versions is not None:
+            stats = self.database.stats()
+            stats.update(self.versions.stats())
+            return format_stats(stats, as_json=value == STATS_JSON_OPTION)
+        elif not self.transaction_stack:
+            return self.database.execute_command(command, key, value, ttl, arguments)
+        elif command is Action.GET:
+            return self.get(key)
+        elif command is Action.SET:
+            self.set(key, value, ttl)
+            return
+        elif command is Action.UNSET:
+            self.unset(key)
+            return
+        elif command is Action.COUNTS:
+            if value is None:
+                return self.counts_between(*arguments)
+            return self.counts(value)
+        elif command is Action.FIND:
+            if value is None:
+                return " ".join(self.find_between(*arguments))
+            if key is None and not arguments:
+                return " ".join(self.find(value))
+            return self.database.format_keys_page(*self.find_page(value, key, *arguments))
+        elif command is Action.INCR or command is Action.DECR or command is Action.INCRBY or command is Action.DECRBY:
+            return self.increment(key, value)
+        elif command is Action.MSET:
+            self.mset(arguments)
+            return
+        elif command is Action.MGET:
+            return self.database.format_values(self.mget(arguments))
+        elif command is Action.MUNSET:
+            return self.munset(arguments)
+        elif command is Action.SCAN:
+            return " ".join(self.scan(key))
+        elif command is Action.RANGE:
+            return " ".join(self.key_range(key, value))
+        elif command is Action.KEYS:
+            return self.database.format_keys_page(*self.keys_page(key))
+        return self.database.execute_command(command, key, value, ttl, arguments)
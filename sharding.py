@@ -0,0 +1,430 @@
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type, Union
+import heapq
+import logging
+import multiprocessing
+import os
+import zlib
+
+from constants import PROFILE_START, STATS_JSON_OPTION, Action, WrongInputException, WrongInputText
+from custom_database import LOAD_BATCH_SIZE, CustomDataBase
+from metrics import format_stats
+from ordered_index import Number
+from profiling import CommandProfiler, SlowLog, execute_slowlog, stop_profile
+
+logger = logging.getLogger(__name__)
+
+# Вызов метода CustomDataBase в процессе сегмента: (имя метода, аргументы).
+Call = Tuple[str, tuple]
+
+# Команды, которые относятся к одному ключу и выполняются одним сегментом.
+_KEY_COMMANDS = {
+    Action.GET  : 'get',
+    Action.SET  : 'set',
+    Action.UNSET: 'unset',
+    Action.TTL  : 'ttl',
+}
+
+_ERROR = 'error'
+_FAILURE = 'failure'
+_OK = 'ok'
+
+
+def shard_for(key: str, shards: int) -> int:
+    """
+    Номер сегмента для ключа. Используется crc32, а не hash(), так как hash() строк
+    в разных процессах различается.
+    :param key:
+    :param shards:
+    :return:
+    """
+    return zlib.crc32(key.encode()) % shards
+
+
+def _shard_worker(connection, engine: Type[CustomDataBase] = CustomDataBase) -> None:
+    """
+    Цикл процесса сегмента: принимает пакеты вызовов, выполняет их над своей базой данных
+    класса engine и отправляет пакет результатов. None завершает работу.
+    Любое исключение вызова возвращается результатом с ошибкой: если бы процесс завершился,
+    родительский процесс ждал бы ответа сегмента бесконечно.
+    :param connection:
+    :param engine:
+    :return:
+    """
+    database = engine()
+    while True:
+        calls = connection.recv()
+        if calls is None:
+            break
+        results = []
+        for method, arguments in calls:
+            try:
+                results.append((_OK, getattr(database, method)(*arguments)))
+            except WrongInputException as e:
+                results.append((_ERROR, e.message))
+            except Exception as e:
+                logger.exception('Ошибка сегмента при вызове %s.', method)
+                results.append((_FAILURE, f'{type(e).__name__}: {e}'))
+        connection.send(results)
+    connection.close()
+
+
+def _unwrap(result: Tuple[str, Any]) -> Any:
+    status, value = result
+    if status == _ERROR:
+        raise WrongInputException(message=value)
+    if status == _FAILURE:
+        raise RuntimeError(f'Ошибка в процессе сегмента: {value}')
+    return value
+
+
+class ShardedDataBase:
+    """
+    База данных, разделённая по хешу ключа между несколькими процессами.
+    Каждый процесс (сегмент) хранит свою часть ключей в CustomDataBase.
+    GET/SET/UNSET выполняет один сегмент, COUNTS и FIND - все сегменты
+    с объединением результатов. BEGIN/ROLLBACK/COMMIT выполняются всеми сегментами,
+    поэтому глубина транзакций у них всегда одинакова.
+    Сегменты хранят данные в базах данных класса engine (CustomDataBase или CompactDataBase).
+    Интерфейс execute_command совпадает с CustomDataBase.execute_command,
+    а execute_batch выполняет пакет команд, распределяя его между сегментами параллельно.
+    >>>database = ShardedDataBase(shards=4)
+    >>>database.set('A', '5')
+    >>>database.get('A')
+    '5'
+    >>>database.close()
+    """
+
+    def __init__(self, shards: Optional[int] = None, engine: Type[CustomDataBase] = CustomDataBase) -> None:
+        self.shards = shards or os.cpu_count() or 1
+        self.engine = engine
+        self.transaction_depth = 0
+        # Журнал медленных команд и профилировщик, как у CustomDataBase. Замеряется
+        # процесс, принимающий команды: разбор, распределение по сегментам и ожидание ответов.
+        self.slowlog = SlowLog()
+        self.profiler: Optional[CommandProfiler] = None
+        self._connections = []
+        self._processes = []
+        for number in range(self.shards):
+            parent_connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_shard_worker, args=(child_connection, engine),
+                                              name=f'shard-{number}', daemon=True)
+            process.start()
+            child_connection.close()
+            self._connections.append(parent_connection)
+            self._processes.append(process)
+        logger.debug('Запущено сегментов %s: %s', engine.__name__, self.shards)
+
+    def _call(self, shard: int, method: str, *arguments) -> Any:
+        connection = self._connections[shard]
+        connection.send([(method, arguments)])
+        return _unwrap(connection.recv()[0])
+
+    def _broadcast(self, method: str, *arguments) -> List[Any]:
+        call = [(method, arguments)]
+        for connection in self._connections:
+            connection.send(call)
+        results = [connection.recv()[0] for connection in self._connections]
+        return [_unwrap(result) for result in results]
+
+    def _scatter(self, calls: List[List[Call]]) -> List[List[Tuple[str, Any]]]:
+        """
+        Отправить каждому сегменту его пакет вызовов (пустые пакеты не отправляются),
+        чтобы сегменты выполняли их параллельно, и собрать пакеты результатов.
+        :param calls: пакеты вызовов по номерам сегментов.
+        :return:
+        """
+        for shard, shard_calls in enumerate(calls):
+            if shard_calls:
+                self._connections[shard].send(shard_calls)
+        return [self._connections[shard].recv() if shard_calls else []
+                for shard, shard_calls in enumerate(calls)]
+
+    def _split_keys(self, keys: Sequence[str]) -> List[List[str]]:
+        keys_by_shard: List[List[str]] = [[] for _ in range(self.shards)]
+        for key in keys:
+            keys_by_shard[shard_for(key, self.shards)].append(key)
+        return keys_by_shard
+
+    def get(self, key: str) -> Any:
+        return self._call(shard_for(key, self.shards), 'get', key)
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        self._call(shard_for(key, self.shards), 'set', key, value, ttl)
+
+    def unset(self, key: str) -> None:
+        self._call(shard_for(key, self.shards), 'unset', key)
+
+    def mset(self, pairs: Sequence[Tuple[str, str]]) -> None:
+        """
+        Установить значения нескольких ключей: каждый сегмент получает свои пары одним вызовом.
+        Внутри сегмента изменения атомарны, между сегментами - нет.
+        :param pairs:
+        :return:
+        """
+        pairs_by_shard: List[List[Tuple[str, str]]] = [[] for _ in range(self.shards)]
+        for key, value in pairs:
+            pairs_by_shard[shard_for(key, self.shards)].append((key, value))
+        for results in self._scatter([[('mset', (shard_pairs,))] if shard_pairs else []
+                                      for shard_pairs in pairs_by_shard]):
+            for result in results:
+                _unwrap(result)
+
+    def load(self, pairs: Iterable[Tuple[str, str]], batch_size: int = LOAD_BATCH_SIZE) -> int:
+        """
+        Массово загрузить пары (ключ, значение): пакет делится между сегментами,
+        и сегменты загружают свои части методом CustomDataBase.load параллельно.
+        Возвращает количество загруженных пар.
+        :param pairs:
+        :param batch_size:
+        :return:
+        """
+        loaded = 0
+        iterator = iter(pairs)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                break
+            pairs_by_shard: List[List[Tuple[str, str]]] = [[] for _ in range(self.shards)]
+            for key, value in batch:
+                pairs_by_shard[shard_for(key, self.shards)].append((key, value))
+            for results in self._scatter([[('load', (shard_pairs,))] if shard_pairs else []
+                                          for shard_pairs in pairs_by_shard]):
+                for result in results:
+                    _unwrap(result)
+            loaded += len(batch)
+        return loaded
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        keys_by_shard = self._split_keys(keys)
+        results = self._scatter([[('mget', (shard_keys,))] if shard_keys else [] for shard_keys in keys_by_shard])
+        found = {}
+        for shard_keys, shard_results in zip(keys_by_shard, results):
+            if shard_keys:
+                found.update(zip(shard_keys, _unwrap(shard_results[0])))
+        return [found[key] for key in keys]
+
+    def munset(self, keys: Sequence[str]) -> int:
+        results = self._scatter([[('munset', (shard_keys,))] if shard_keys else []
+                                 for shard_keys in self._split_keys(keys)])
+        return sum(_unwrap(shard_results[0]) for shard_results in results if shard_results)
+
+    def ttl(self, key: str) -> int:
+        return self._call(shard_for(key, self.shards), 'ttl', key)
+
+    def counts(self, value: Any) -> int:
+        return sum(self._broadcast('counts', value))
+
+    def find(self, value: Any) -> List[str]:
+        keys = []
+        for shard_keys in self._broadcast('find', value):
+            keys.extend(shard_keys)
+        return keys
+
+    def increment(self, key: str, amount: int) -> int:
+        return self._call(shard_for(key, self.shards), 'increment', key, amount)
+
+    def counts_between(self, low: Number, high: Number) -> int:
+        return sum(self._broadcast('counts_between', low, high))
+
+    def find_between(self, low: Number, high: Number) -> List[str]:
+        """
+        Ключи с числовыми значениями от low до high по возрастанию значений.
+        Каждый сегмент одним вызовом возвращает пары (число, ключ), упорядоченные
+        по своим значениям, и списки сливаются по числам.
+        :param low:
+        :param high:
+        :return:
+        """
+        pages = self._broadcast('numbers_between', low, high)
+        return [key for _, key in heapq.merge(*pages, key=lambda match: match[0])]
+
+    def scan(self, prefix: str) -> List[str]:
+        return list(heapq.merge(*self._broadcast('scan', prefix)))
+
+    def key_range(self, start: str, stop: str) -> List[str]:
+        return list(heapq.merge(*self._broadcast('key_range', start, stop)))
+
+    def keys_page(self, cursor: Optional[str] = None, count: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Страница ключей после cursor: каждый сегмент возвращает свою страницу,
+        страницы сливаются, и из результата берутся первые count ключей.
+        :param cursor:
+        :param count:
+        :return:
+        """
+        count = count or CustomDataBase.KEYS_PAGE_SIZE
+        return self._merge_pages(self._broadcast('keys_page', cursor, count), count)
+
+    def find_page(self, value: Any, cursor: Optional[str] = None,
+                  count: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Страница ключей со значением value после cursor, собранная из страниц сегментов, как в keys_page.
+        :param value:
+        :param cursor:
+        :param count:
+        :return:
+        """
+        count = count or CustomDataBase.KEYS_PAGE_SIZE
+        return self._merge_pages(self._broadcast('find_page', value, cursor, count), count)
+
+    @staticmethod
+    def _merge_pages(pages: List[Tuple[List[str], Optional[str]]], count: int) -> Tuple[List[str], Optional[str]]:
+        merged = list(heapq.merge(*(keys for keys, _ in pages)))
+        keys = merged[:count]
+        more = len(merged) > count or any(shard_cursor is not None for _, shard_cursor in pages)
+        return keys, (keys[-1] if more and keys else None)
+
+    def begin_transaction(self) -> None:
+        self._broadcast('begin_transaction')
+        self.transaction_depth += 1
+
+    def rollback_transaction(self) -> None:
+        if not self.transaction_depth:
+            raise WrongInputException(Action.ROLLBACK, message=WrongInputText.NO_TRANSACTIONS_TO_ROLLBACK.value)
+        self._broadcast('rollback_transaction')
+        self.transaction_depth -= 1
+
+    def commit_transaction(self) -> None:
+        if not self.transaction_depth:
+            raise WrongInputException(Action.COMMIT, message=WrongInputText.NO_TRANSACTIONS_TO_COMMIT.value)
+        self._broadcast('commit_transaction')
+        self.transaction_depth -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        shard_stats = self._broadcast('stats')
+        return {
+            'shards'            : self.shards,
+            'keys'              : sum(stats['keys'] for stats in shard_stats),
+            'transaction_depth' : self.transaction_depth,
+            'journal_entries'   : sum(stats['journal_entries'] for stats in shard_stats),
+            'value_index_values': sum(stats['value_index_values'] for stats in shard_stats),
+            'keys_per_shard'    : [stats['keys'] for stats in shard_stats],
+        }
+
+    def execute_command(self, command, key=None, value=None, ttl=None, arguments=()) -> Union[str, int, None]:
+        """
+        Выполнить одну команду. Интерфейс совпадает с CustomDataBase.execute_command.
+        :param command:
+        :param key:
+        :param value:
+        :param ttl:
+        :param arguments:
+        :return:
+        """
+        if command is Action.SET:
+            self.set(key, value, ttl)
+            return
+        elif command is Action.GET:
+            return self.get(key)
+        elif command is Action.UNSET:
+            self.unset(key)
+            return
+        elif command is Action.MSET:
+            self.mset(arguments)
+            return
+        elif command is Action.MGET:
+            return CustomDataBase.format_values(self.mget(arguments))
+        elif command is Action.MUNSET:
+            return self.munset(arguments)
+        elif command is Action.TTL:
+            return self.ttl(key)
+        elif command is Action.INCR or command is Action.DECR or command is Action.INCRBY or command is Action.DECRBY:
+            return self.increment(key, value)
+        elif command is Action.COUNTS:
+            if value is None:
+                return self.counts_between(*arguments)
+            return self.counts(value)
+        elif command is Action.FIND:
+            if value is None:
+                return " ".join(self.find_between(*arguments))
+            if key is None and not arguments:
+                return " ".join(self.find(value))
+            return CustomDataBase.format_keys_page(*self.find_page(value, key, *arguments))
+        elif command is Action.SCAN:
+            return " ".join(self.scan(key))
+        elif command is Action.RANGE:
+            return " ".join(self.key_range(key, value))
+        elif command is Action.KEYS:
+            return CustomDataBase.format_keys_page(*self.keys_page(key))
+        elif command is Action.BEGIN:
+            self.begin_transaction()
+            return
+        elif command is Action.ROLLBACK:
+            self.rollback_transaction()
+            return
+        elif command is Action.COMMIT:
+            self.commit_transaction()
+            return
+        elif command is Action.STATS:
+            return format_stats(self.stats(), as_json=value == STATS_JSON_OPTION)
+        elif command is Action.SLOWLOG:
+            return execute_slowlog(self.slowlog, value, arguments)
+        elif command is Action.PROFILE:
+            if value == PROFILE_START:
+                if self.profiler is not None:
+                    raise WrongInputException(Action.PROFILE, message=WrongInputText.PROFILE_RUNNING.value)
+                self.profiler = CommandProfiler()
+                return
+            reply = stop_profile(self.profiler, *arguments)
+            self.profiler = None
+            return reply
+
+        raise WrongInputException(message=WrongInputText.WRONG_INPUT_FORMAT.value)
+
+    def execute_batch(self, commands: Sequence[Tuple]) -> List[Union[str, int, None, WrongInputException]]:
+        """
+        Выполнить пакет команд (кортежей в формате input_filter.ParsedCommand) и вернуть
+        результаты в том же порядке; ошибка команды возвращается как WrongInputException.
+        Подряд идущие команды GET/SET/UNSET отправляются сегментам одним сообщением на сегмент
+        и выполняются параллельно: команды над разными ключами независимы, а порядок команд
+        над одним ключом сохраняется внутри его сегмента. Остальные команды разделяют пакет.
+        :param commands:
+        :return:
+        """
+        results: List[Any] = [None] * len(commands)
+        position = 0
+        while position < len(commands):
+            command = commands[position]
+            if command[0] not in _KEY_COMMANDS:
+                try:
+                    results[position] = self.execute_command(*command)
+                except WrongInputException as e:
+                    results[position] = e
+                position += 1
+                continue
+            calls: List[List[Call]] = [[] for _ in range(self.shards)]
+            positions: List[List[int]] = [[] for _ in range(self.shards)]
+            while position < len(commands) and commands[position][0] in _KEY_COMMANDS:
+                command, key, value, ttl = commands[position][:4]
+                shard = shard_for(key, self.shards)
+                if command is Action.SET:
+                    calls[shard].append(('set', (key, value, ttl)))
+                else:
+                    calls[shard].append((_KEY_COMMANDS[command], (key,)))
+                positions[shard].append(position)
+                position += 1
+            for shard_positions, shard_results in zip(positions, self._scatter(calls)):
+                for index, result in zip(shard_positions, shard_results):
+                    try:
+                        results[index] = _unwrap(result)
+                    except WrongInputException as e:
+                        results[index] = e
+        return results
+
+    def close(self) -> None:
+        """
+        Завершить процессы сегментов.
+        :return:
+        """
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
+        self._processes = []
@@ -1,8 +1,31 @@
+import asyncio
+import io
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
 
-from constants import Action, WrongInputException, WrongInputText
+import bulk_load
+from constants import BACKGROUND_SAVE_TEXT, SAVED_TEXT, Action, WrongInputException, WrongInputText
+from compact_database import CompactDataBase
+from concurrent_database import ThreadSafeDataBase
 from custom_database import CustomDataBase
-from input_filter import InputFilter
+from eviction import entry_size
+from input_filter import InputFilter, ParsedCommand, parse_command
+from main import GOODBYE_TEXT, execute_line, run_batch
+from metrics import LatencyHistogram
+from mmap_database import MmapDataBase
+from mvcc import VersionStore
+from persistence import (RECORDS_SNAPSHOT_MAGIC, BackgroundSave, FsyncPolicy, PersistentStorage, encode_record,
+                         read_snapshot, write_snapshot)
+from profiling import SlowLog
+from server import DatabaseServer
+from session import Session
+from sharding import ShardedDataBase
 
 
 class InputFilterCase(unittest.TestCase):
@@ -191,6 +214,19 @@ class InputFilterCase(unittest.TestCase):
         self.assertIsInstance(test_filter.error, WrongInputException)
         self.assertEqual(test_filter.error.message, WrongInputText.WRONG_INPUT_FORMAT.value)
 
+    def test_parse_command(self):
+        self.assertEqual(parse_command('set A 5'), ParsedCommand(Action.SET, 'A', '5'))
+        self.assertEqual(parse_command('  Get   A '), ParsedCommand(Action.GET, 'A'))
+        self.assertEqual(parse_command('FIND 5'), ParsedCommand(Action.FIND, None, '5'))
+        self.assertEqual(parse_command('commit'), ParsedCommand(Action.COMMIT))
+        with self.assertRaises(WrongInputException) as context:
+            parse_command('UNKNOWN A')
+        self.assertEqual(context.exception.message, WrongInputText.UNKNOWN_COMMAND.value)
+
+        database = CustomDataBase()
+        database.execute_command(*parse_command('SET A 5'))
+        self.assertEqual(database.execute_command(*parse_command('GET A')), '5')
+
 
 class CustomDataBaseCase(unittest.TestCase):
 
@@ -223,11 +259,37 @@ class CustomDataBaseCase(unittest.TestCase):
         self.assertListEqual(self.test_database.find('4'), ['B', 'C'])
         self.assertListEqual(self.test_database.find('0'), [])
 
+    def test_value_index(self):
+        self.test_database.set('A', '4')
+        self.test_database.set('B', '4')
+        self.test_database.set('A', '5')
+        self.assertEqual(self.test_database.counts('4'), 1)
+        self.assertEqual(self.test_database.counts('5'), 1)
+        self.test_database.unset('B')
+        self.assertEqual(self.test_database.counts('4'), 0)
+        self.assertListEqual(self.test_database.find('4'), [])
+        self.assertListEqual(self.test_database.find('5'), ['A'])
+
+    def test_value_index_nested_transactions(self):
+        self.test_database.database = {'A': '5', 'B': '4', 'C': '4'}
+        self.test_database.begin_transaction()
+        self.test_database.set('A', '4')
+        self.test_database.begin_transaction()
+        self.test_database.unset('B')
+        self.test_database.set('D', '4')
+        self.assertListEqual(sorted(self.test_database.find('4')), ['A', 'C', 'D'])
+        self.test_database.rollback_transaction()
+        self.assertListEqual(sorted(self.test_database.find('4')), ['A', 'B', 'C'])
+        self.assertEqual(self.test_database.counts('5'), 0)
+        self.test_database.commit_transaction()
+        self.assertEqual(self.test_database.counts('4'), 3)
+        self.assertEqual(self.test_database.counts('5'), 0)
+
     def test_begin_transaction(self):
         self.test_database.database = {'A': '5', 'B': '4', 'C': '4'}
         self.test_database.begin_transaction()
         self.test_database.set('I_AM_ONLY_IN_TRANSACTION', '55')
-        self.assertDictEqual(self.test_database.transaction_stack[0], {'A': '5', 'B': '4', 'C': '4'})
+        self.assertListEqual(list(self.test_database.transaction_stack[0]), ['I_AM_ONLY_IN_TRANSACTION'])
         self.assertDictEqual(self.test_database.database, {'A'                       : '5',
                                                            'B'                       : '4',
                                                            'C'                       : '4',
@@ -237,7 +299,7 @@ class CustomDataBaseCase(unittest.TestCase):
         self.test_database.database = {'A': '5', 'B': '4', 'C': '4'}
         self.test_database.begin_transaction()
         self.test_database.set('I_AM_ONLY_IN_TRANSACTION', '55')
-        self.assertDictEqual(self.test_database.transaction_stack[0], {'A': '5', 'B': '4', 'C': '4'})
+        self.assertListEqual(list(self.test_database.transaction_stack[0]), ['I_AM_ONLY_IN_TRANSACTION'])
         self.assertDictEqual(self.test_database.database, {'A'                       : '5',
                                                            'B'                       : '4',
                                                            'C'                       : '4',
@@ -289,6 +351,24 @@ class CustomDataBaseCase(unittest.TestCase):
                              {'A': '5', 'B': '4', 'C': '4', 'TR1': '11'})
         self.assertListEqual(self.test_database.transaction_stack, [])
 
+    def test_transaction_journal(self):
+        self.test_database.database = {'A': '5', 'B': '4'}
+        self.test_database.begin_transaction()
+        self.test_database.set('A', '6')
+        self.test_database.set('A', '7')
+        self.test_database.unset('B')
+        self.assertEqual(len(self.test_database.transaction_stack[0]), 2)
+        self.test_database.begin_transaction()
+        self.test_database.set('B', '8')
+        self.test_database.set('C', '9')
+        self.test_database.commit_transaction()
+        self.assertEqual(len(self.test_database.transaction_stack), 1)
+        self.assertEqual(len(self.test_database.transaction_stack[0]), 3)
+        self.test_database.rollback_transaction()
+        self.assertDictEqual(self.test_database.database, {'A': '5', 'B': '4'})
+        self.assertListEqual(self.test_database.find('4'), ['B'])
+        self.assertEqual(self.test_database.counts('8'), 0)
+
     def test_execute_command_set_get_unset(self):
         self.assertRaises(WrongInputException, self.test_database.execute_command, 'very', 'strange', 'arguments')
 
@@ -308,9 +388,36 @@ class CustomDataBaseCase(unittest.TestCase):
         self.assertEqual(self.test_database.execute_command(Action.COUNTS, value='4'),
                          self.test_database.counts('4'))
 
-        self.assertEqual(self.test_database.execute_command(Action.FIND, value='4'),
+        self.assertEqual(''.join(self.test_database.execute_command(Action.FIND, value='4')),
                          " ".join(key for key in self.test_database.find('4')))
 
+    def test_stats(self):
+        self.test_database.database = {'A': '5', 'B': '4', 'C': '4'}
+        self.test_database.begin_transaction()
+        self.test_database.set('A', '6')
+        stats = self.test_database.stats()
+        self.assertEqual(stats['keys'], 3)
+        self.assertEqual(stats['transaction_depth'], 1)
+        self.assertEqual(stats['journal_entries'], 1)
+        self.assertEqual(stats['value_index_values'], 2)
+        self.assertNotIn('commands', stats)
+
+        self.test_database.enable_metrics()
+        self.test_database.execute_command(Action.GET, key='A')
+        self.assertRaises(WrongInputException, self.test_database.execute_command, Action.GET, 'Z')
+        commands = self.test_database.stats()['commands']
+        self.assertEqual(commands['GET']['calls'], 2)
+        self.assertEqual(commands['GET']['errors'], 1)
+        self.assertIn('command_get: calls=2', self.test_database.execute_command(Action.STATS))
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram()
+        for nanoseconds in range(1, 1001):
+            histogram.record(nanoseconds * 1000)
+        self.assertEqual(histogram.count, 1000)
+        self.assertTrue(500000 <= histogram.percentile(50) <= 500000 * 1.25)
+        self.assertTrue(990000 <= histogram.percentile(99) <= 990000 * 1.25)
+
     def test_execute_command_begin_rollback_commit_transaction(self):
         self.test_database.database = {'A': '5', 'B': '4', 'C': '4'}
 
@@ -333,5 +440,1293 @@ class CustomDataBaseCase(unittest.TestCase):
         self.assertDictEqual(self.test_database.database, {'A': '5', 'B': '4', 'C': '4', 'TR2': '22'})
 
 
+class EvictionCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_database = CustomDataBase()
+
+    def fill(self, policy, keys=3):
+        self.test_database.enable_eviction(keys * entry_size('A', '5'), policy)
+        for key in ('A', 'B', 'C')[:keys]:
+            self.test_database.set(key, '5')
+
+    def test_lru(self):
+        self.fill('lru')
+        self.test_database.get('A')
+        self.test_database.set('D', '5')
+        self.assertListEqual(sorted(self.test_database.database), ['A', 'C', 'D'])
+        self.assertEqual(self.test_database.counts('5'), 3)
+        stats = self.test_database.stats()
+        self.assertEqual(stats['evicted_keys'], 1)
+        self.assertEqual(stats['keyspace_hits'], 1)
+
+    def test_lfu(self):
+        self.fill('lfu')
+        for key in ('A', 'A', 'B', 'C', 'C'):
+            self.test_database.get(key)
+        self.test_database.set('D', '5')
+        self.test_database.set('E', '5')
+        self.assertListEqual(sorted(self.test_database.database), ['A', 'C', 'E'])
+
+    def test_random(self):
+        self.fill('random')
+        for key in ('D', 'E', 'F'):
+            self.test_database.set(key, '5')
+        self.assertEqual(len(self.test_database.database), 3)
+        self.assertIn('F', self.test_database.database)
+        self.assertListEqual(sorted(self.test_database.find('5')), sorted(self.test_database.database))
+
+    def test_transaction_keys_are_not_evicted(self):
+        self.fill('lru', keys=2)
+        self.test_database.begin_transaction()
+        self.test_database.set('A', '6')
+        self.test_database.set('C', '5')
+        self.assertListEqual(sorted(self.test_database.database), ['A', 'C'])
+        self.test_database.set('D', '5')
+        self.assertListEqual(sorted(self.test_database.database), ['A', 'C', 'D'])
+        self.test_database.rollback_transaction()
+        self.assertDictEqual(self.test_database.database, {'A': '5'})
+        self.assertEqual(self.test_database.stats()['used_memory'], entry_size('A', '5'))
+
+
+class ExpiryCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.test_database = CustomDataBase()
+        self.test_database.clock = lambda: self.now
+
+    def test_parse_expire(self):
+        self.assertEqual(parse_command('SET A 5 ex 10'), ParsedCommand(Action.SET, 'A', '5', 10))
+        self.assertEqual(parse_command('TTL A'), ParsedCommand(Action.TTL, 'A'))
+        for seconds in ('0', '²', '-1'):
+            with self.assertRaises(WrongInputException) as error:
+                parse_command(f'SET A 5 EX {seconds}')
+            self.assertEqual(error.exception.message, WrongInputText.WRONG_EXPIRE_TIME.value)
+        with self.assertRaises(WrongInputException) as error:
+            parse_command('SET A 5 EX')
+        self.assertEqual(error.exception.message, WrongInputText.WRONG_INPUT_FORMAT.value)
+
+    def test_expire(self):
+        for line in ('SET A 5 EX 10', 'SET B 5 EX 20', 'SET C 5'):
+            self.test_database.execute_command(*parse_command(line))
+        self.assertEqual(self.test_database.execute_command(*parse_command('TTL A')), 10)
+        self.assertEqual(self.test_database.ttl('C'), -1)
+        self.assertEqual(self.test_database.ttl('D'), -2)
+        self.now += 10
+        self.assertRaises(WrongInputException, self.test_database.get, 'A')
+        self.assertEqual(self.test_database.counts('5'), 2)
+        self.test_database.set('B', '6')
+        self.now += 100
+        self.assertEqual(self.test_database.expire_due(), 0)
+        self.assertDictEqual(self.test_database.database, {'B': '6', 'C': '5'})
+        self.assertEqual(self.test_database.stats()['expired_keys'], 1)
+
+    def test_expire_due_uses_heap_order(self):
+        for number in range(100):
+            self.test_database.set(f'key{number}', 'value', ttl=100 - number)
+        self.now += 50
+        self.assertEqual(self.test_database.expire_due(limit=10), 10)
+        self.assertEqual(self.test_database.expire_due(), 40)
+        self.assertEqual(sorted(self.test_database.database)[:2], ['key0', 'key1'])
+        self.assertEqual(self.test_database.find('value')[-1], 'key49')
+
+    def test_transactions(self):
+        self.test_database.set('A', '5', ttl=10)
+        self.test_database.begin_transaction()
+        self.test_database.set('A', '6')
+        self.assertEqual(self.test_database.ttl('A'), -1)
+        self.test_database.rollback_transaction()
+        self.assertEqual(self.test_database.ttl('A'), 10)
+
+        self.test_database.begin_transaction()
+        self.test_database.set('B', '5', ttl=5)
+        self.now += 20
+        self.assertRaises(WrongInputException, self.test_database.get, 'A')
+        self.test_database.rollback_transaction()
+        self.assertNotIn('B', self.test_database.database)
+        self.assertEqual(self.test_database.ttl('A'), -2)
+        self.assertEqual(self.test_database.stats()['expires'], 0)
+
+    def test_session_commit_keeps_ttl(self):
+        session = Session(self.test_database)
+        session.begin_transaction()
+        session.execute_command(*parse_command('SET A 5 EX 30'))
+        session.commit_transaction()
+        self.assertEqual(self.test_database.ttl('A'), 30)
+
+
+class KeyIndexCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_database = CustomDataBase()
+        self.test_database.database = {'user:1': 'a', 'user:2': 'b', 'user:10': 'c', 'order:1': 'd', 'zeta': 'e'}
+
+    def test_scan_and_range(self):
+        self.assertEqual(self.test_database.execute_command(*parse_command('SCAN user:')), 'user:1 user:10 user:2')
+        self.assertEqual(self.test_database.execute_command(*parse_command('RANGE order:1 user:10')),
+                         'order:1 user:1 user:10')
+        self.assertListEqual(self.test_database.scan('missing'), [])
+        self.test_database.set('user:3', 'f')
+        self.test_database.unset('user:1')
+        self.assertListEqual(self.test_database.scan('user:'), ['user:10', 'user:2', 'user:3'])
+
+    def test_keys_cursor(self):
+        self.test_database.KEYS_PAGE_SIZE = 2
+        self.assertEqual(self.test_database.execute_command(*parse_command('KEYS')), 'order:1 user:1\nCURSOR user:1')
+        self.test_database.unset('user:1')
+        self.assertTupleEqual(self.test_database.keys_page('user:1'), (['user:10', 'user:2'], 'user:2'))
+        self.assertTupleEqual(self.test_database.keys_page('user:2'), (['zeta'], None))
+
+    def test_index_follows_rollback(self):
+        self.test_database.scan('')
+        self.test_database.begin_transaction()
+        self.test_database.unset('user:2')
+        self.test_database.set('user:5', 'g')
+        self.test_database.begin_transaction()
+        self.test_database.unset('zeta')
+        self.test_database.commit_transaction()
+        self.assertListEqual(self.test_database.key_range('user:2', 'zz'), ['user:5'])
+        self.test_database.rollback_transaction()
+        self.assertListEqual(self.test_database.scan(''), sorted(self.test_database.database))
+
+    def test_session_transaction(self):
+        session = Session(self.test_database, VersionStore(self.test_database))
+        session.begin_transaction()
+        session.set('user:3', 'f')
+        session.unset('user:1')
+        self.test_database.unset('user:2')
+        self.assertListEqual(session.scan('user:'), ['user:10', 'user:2', 'user:3'])
+        self.assertTupleEqual(session.keys_page('order:1', 2), (['user:10'], 'user:10'))
+        self.assertTupleEqual(session.keys_page('user:10', 2), (['user:2', 'user:3'], 'user:3'))
+        self.assertEqual(session.execute_command(*parse_command('RANGE user:2 zz')), 'user:2 user:3 zeta')
+
+    def test_find_pages(self):
+        for database in (CustomDataBase(), CompactDataBase()):
+            database.mset([(f'key{i:03}', 'hot' if i % 10 else 'rare') for i in range(200)])
+            self.assertEqual(database.execute_command(*parse_command('FIND hot LIMIT 2')), 'key001 key002\nCURSOR key002')
+            database.unset('key002')
+            self.assertTupleEqual(database.find_page('hot', 'key002', 2), (['key003', 'key004'], 'key004'))
+            self.assertTupleEqual(database.find_page('rare', 'key150', 3), (['key160', 'key170', 'key180'], 'key180'))
+            self.assertTupleEqual(database.find_page('rare', 'key180', 3), (['key190'], None))
+            self.assertTupleEqual(database.find_page('missing'), ([], None))
+            found, cursor = database.find_page('hot', count=50)
+            while cursor is not None:
+                page, cursor = database.find_page('hot', cursor, 50)
+                found.extend(page)
+            self.assertListEqual(found, sorted(database.find('hot')))
+        self.assertEqual(parse_command('FIND 5 CURSOR a LIMIT 10'), ParsedCommand(Action.FIND, 'a', '5', arguments=(10,)))
+        self.assertRaises(WrongInputException, parse_command, 'FIND 5 LIMIT 0')
+        # Надстрочные цифры - isdigit(), но не десятичные цифры: int() их не принимает.
+        self.assertRaises(WrongInputException, parse_command, 'FIND 5 LIMIT ²')
+        self.assertEqual(parse_command('FIND 5 LIMIT ٣'), ParsedCommand(Action.FIND, None, '5', arguments=(3,)))
+        output, stop = execute_line(database, 'FIND 5 LIMIT ²', logging.getLogger(__name__))
+        self.assertEqual((output, stop), (WrongInputText.WRONG_LIMIT.value, False))
+        self.assertRaises(WrongInputException, parse_command, 'FIND 5 LIMIT 1 LIMIT 2')
+
+    def test_find_stream(self):
+        self.test_database.mset([(f'key{i}', 'v') for i in range(2500)])
+        chunks = list(self.test_database.execute_command(*parse_command('FIND v')))
+        self.assertEqual(len(chunks), 3)
+        self.assertListEqual(''.join(chunks).split(' '), self.test_database.find('v'))
+        session = Session(self.test_database)
+        session.begin_transaction()
+        session.set('key1', 'w')
+        self.assertEqual(session.execute_command(*parse_command('FIND v LIMIT 2')), 'key0 key10\nCURSOR key10')
+
+
+class BulkCommandsCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_database = CustomDataBase()
+
+    def execute(self, line):
+        return self.test_database.execute_command(*parse_command(line))
+
+    def test_parse(self):
+        self.assertEqual(parse_command('MSET A 1 B 2'), ParsedCommand(Action.MSET, arguments=(('A', '1'), ('B', '2'))))
+        self.assertEqual(parse_command('mget A B C'), ParsedCommand(Action.MGET, arguments=('A', 'B', 'C')))
+        with self.assertRaises(WrongInputException) as error:
+            parse_command('MSET A 1 B')
+        self.assertEqual(error.exception.message, WrongInputText.NO_ARGUMENT_VALUE.value)
+        with self.assertRaises(WrongInputException) as error:
+            parse_command('MUNSET')
+        self.assertEqual(error.exception.message, WrongInputText.NO_ARGUMENT_NAME.value)
+
+    def test_commands(self):
+        self.assertIsNone(self.execute('MSET A 1 B 2 C 1'))
+        self.assertEqual(self.execute('MGET C A Z'), '1 1 NULL')
+        self.assertEqual(self.execute('COUNTS 1'), 2)
+        self.assertEqual(self.execute('MUNSET A Z B'), 2)
+        self.assertDictEqual(self.test_database.database, {'C': '1'})
+
+    def test_single_commit_and_rollback(self):
+        batches = []
+        self.test_database.add_commit_listener(batches.append)
+        self.execute('MSET A 1 B 2')
+        self.execute('MUNSET A B')
+        self.assertListEqual(batches, [[('A', None, '1'), ('B', None, '2')], [('A', '1', None), ('B', '2', None)]])
+        self.execute('BEGIN')
+        self.execute('MSET A 1 B 2')
+        self.execute('ROLLBACK')
+        self.assertDictEqual(self.test_database.database, {})
+        self.assertEqual(len(batches), 2)
+
+    def test_session(self):
+        session = Session(self.test_database)
+        self.test_database.set('A', '0')
+        session.begin_transaction()
+        session.execute_command(*parse_command('MSET B 1 C 2'))
+        self.assertEqual(session.execute_command(*parse_command('MUNSET A C Z')), 2)
+        self.assertEqual(session.execute_command(*parse_command('MGET A B C')), 'NULL 1 NULL')
+        self.assertDictEqual(self.test_database.database, {'A': '0'})
+        session.commit_transaction()
+        self.assertDictEqual(self.test_database.database, {'B': '1'})
+
+
+class PersistentStorageCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def open_storage(self):
+        return PersistentStorage(self.data_dir, fsync_policy=FsyncPolicy.ALWAYS, snapshot_every=None)
+
+    def test_restore_committed_changes(self):
+        storage = self.open_storage()
+        database = storage.open()
+        database.set('A', '5')
+        database.set('B', '4')
+        database.unset('A')
+        database.begin_transaction()
+        database.set('C', '3')
+        database.begin_transaction()
+        database.set('D', '2')
+        database.rollback_transaction()
+        database.commit_transaction()
+        database.begin_transaction()
+        database.set('I_AM_ONLY_IN_TRANSACTION', '55')
+        storage.close()
+
+        database = self.open_storage().open()
+        self.assertDictEqual(database.database, {'B': '4', 'C': '3'})
+        self.assertEqual(database.counts('4'), 1)
+
+    def test_snapshot_and_log_tail(self):
+        storage = self.open_storage()
+        database = storage.open()
+        database.set('A', '5')
+        database.set('B', '4')
+        database.begin_transaction()
+        database.set('I_AM_ONLY_IN_TRANSACTION', '55')
+        storage.snapshot(wait=True)
+        database.rollback_transaction()
+        database.set('C', '3')
+        storage.close()
+        self.assertFalse(os.path.exists(storage.old_wal_path))
+
+        database = self.open_storage().open()
+        self.assertDictEqual(database.database, {'A': '5', 'B': '4', 'C': '3'})
+
+    def test_torn_log_tail_is_ignored(self):
+        storage = self.open_storage()
+        database = storage.open()
+        database.set('A', '5')
+        storage.close()
+        with open(storage.wal_path, 'ab') as file:
+            file.write(encode_record('B', '4')[:-3])
+
+        database = self.open_storage().open()
+        self.assertDictEqual(database.database, {'A': '5'})
+
+    def test_appends_after_torn_tail_survive_restart(self):
+        storage = self.open_storage()
+        database = storage.open()
+        database.set('A', '5')
+        database.set('B', '4')
+        storage.close()
+        with open(storage.wal_path, 'r+b') as file:
+            file.truncate(os.path.getsize(storage.wal_path) - 3)
+
+        storage = self.open_storage()
+        database = storage.open()
+        self.assertDictEqual(database.database, {'A': '5'})
+        database.set('C', '3')
+        database.set('D', '2')
+        storage.close()
+
+        database = self.open_storage().open()
+        self.assertDictEqual(database.database, {'A': '5', 'C': '3', 'D': '2'})
+
+    def test_expiry_survives_restart(self):
+        storage = self.open_storage()
+        database = storage.open()
+        database.set('snapshot_session', 'x', ttl=2)
+        database.set('snapshot_long', 'y', ttl=100)
+        storage.snapshot(wait=True)
+        database.set('session', 'x', ttl=2)
+        database.set('long', 'y', ttl=100)
+        database.set('persistent', 'z', ttl=100)
+        database.set('persistent', 'z')
+        database.begin_transaction()
+        database.set('long', 'y', ttl=50)
+        database.commit_transaction()
+        storage.close()
+
+        storage = self.open_storage()
+        database = storage.open()
+        self.assertListEqual([database.ttl(key) for key in ('snapshot_session', 'snapshot_long', 'session', 'long',
+                                                            'persistent')], [2, 100, 2, 50, -1])
+        storage.close()
+
+        # Перезапуск через 2.5 секунды: ключи со сроком 2 секунды удаляются.
+        with mock.patch('custom_database.time', return_value=time.time() + 2.5):
+            storage = self.open_storage()
+            database = storage.open()
+        self.assertDictEqual(database.database, {'snapshot_long': 'y', 'long': 'y', 'persistent': 'z'})
+        self.assertListEqual([database.ttl(key) for key in ('snapshot_long', 'long', 'persistent')], [98, 48, -1])
+        storage.snapshot(wait=True)
+        storage.close()
+        database = self.open_storage().open()
+        self.assertEqual(database.ttl('long'), 48)
+
+    def test_binary_snapshot(self):
+        path = os.path.join(self.data_dir, 'test.snapshot')
+        items = {f'KEY{i}': str(i % 7) for i in range(25000)}
+        items.update({'КЛЮЧ': 'значение', 'B': 'значение'})
+        database = CustomDataBase()
+        database.mset(list(items.items()))
+        self.assertEqual(write_snapshot(path, database.committed_groups()), len(items))
+        self.assertDictEqual(read_snapshot(path), items)
+
+        for engine in (CustomDataBase(), CompactDataBase()):
+            storage = PersistentStorage(self.data_dir, snapshot_every=None)
+            storage.snapshot_path = path
+            database = storage.open(engine)
+            self.assertDictEqual(dict(database.database.items()), items)
+            self.assertEqual(database.counts('значение'), 2)
+            self.assertListEqual(database.find('3')[:2], ['KEY3', 'KEY10'])
+            storage.close()
+            os.remove(storage.wal_path)
+
+        with open(path, 'r+b') as file:
+            file.seek(-10, os.SEEK_END)
+            file.write(b'X')
+        self.assertRaises(ValueError, read_snapshot, path)
+
+        with open(path, 'wb') as file:
+            file.write(RECORDS_SNAPSHOT_MAGIC + encode_record('A', '5') + encode_record('B', '4'))
+        self.assertDictEqual(read_snapshot(path), {'A': '5', 'B': '4'})
+
+    def test_background_save_excludes_open_transactions(self):
+        storage = self.open_storage()
+        database = storage.open()
+        database.set('A', '5')
+        database.set('B', '4')
+        database.begin_transaction()
+        database.set('A', '6')
+        database.unset('B')
+        database.set('I_AM_ONLY_IN_TRANSACTION', '55')
+        self.assertEqual(database.execute_command(Action.BGSAVE), BACKGROUND_SAVE_TEXT)
+        database.set('C', '3')
+        self.assertTrue(storage.saver.wait())
+        self.assertDictEqual(read_snapshot(storage.snapshot_path), {'A': '5', 'B': '4'})
+        stats = database.stats()
+        self.assertEqual(stats['saves'], 1)
+        self.assertEqual(stats['last_save_keys'], 2)
+        self.assertEqual(stats['bgsave_progress'], 100.0)
+        database.commit_transaction()
+        storage.close()
+        self.assertFalse(os.path.exists(storage.old_wal_path))
+
+        database = self.open_storage().open()
+        self.assertDictEqual(database.database, {'A': '6', 'C': '3', 'I_AM_ONLY_IN_TRANSACTION': '55'})
+
+    def test_save_command(self):
+        with self.assertRaises(WrongInputException) as context:
+            CustomDataBase().execute_command(Action.SAVE)
+        self.assertEqual(context.exception.message, WrongInputText.NO_STORAGE.value)
+
+        storage = self.open_storage()
+        database = storage.open()
+        database.set('A', '5')
+        self.assertEqual(database.execute_command(*parse_command('SAVE')), SAVED_TEXT.format(keys=1))
+        self.assertDictEqual(read_snapshot(storage.snapshot_path), {'A': '5'})
+        self.assertEqual(database.stats()['changes_since_last_save'], 0)
+        storage.close()
+
+
+class BatchModeCase(unittest.TestCase):
+
+    def run_script(self, script):
+        output = io.StringIO()
+        executed = run_batch(CustomDataBase(), io.BytesIO(script.encode()), output, logging.getLogger(__name__))
+        return executed, output.getvalue()
+
+    def test_batch_output(self):
+        executed, output = self.run_script('SET A 5\nGET A\nFIND 5\nGET B\nROLLBACK\n')
+        self.assertEqual(executed, 5)
+        self.assertEqual(output, '\n'.join(['5', 'A', WrongInputText.NULL.value,
+                                            WrongInputText.NO_TRANSACTIONS_TO_ROLLBACK.value,
+                                            GOODBYE_TEXT, '']))
+
+    def test_batch_stops_on_end(self):
+        executed, output = self.run_script('SET A 5\nEND\nGET A\n')
+        self.assertEqual(executed, 2)
+        self.assertEqual(output, GOODBYE_TEXT + '\n')
+
+
+class DiagnosticsCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_database = CustomDataBase()
+        self.logger = logging.getLogger(__name__)
+
+    def test_parse(self):
+        self.assertEqual(parse_command('slowlog get 5'), ParsedCommand(Action.SLOWLOG, value='GET', arguments=(5,)))
+        self.assertEqual(parse_command('PROFILE STOP report.txt'),
+                         ParsedCommand(Action.PROFILE, value='STOP', arguments=('report.txt',)))
+        self.assertRaises(WrongInputException, parse_command, 'SLOWLOG GET x')
+        self.assertRaises(WrongInputException, parse_command, 'SLOWLOG GET ²')
+        self.assertRaises(WrongInputException, parse_command, 'SLOWLOG LEN 5')
+        self.assertRaises(WrongInputException, parse_command, 'PROFILE PAUSE')
+
+    def test_slowlog(self):
+        self.test_database.slowlog = SlowLog(threshold_us=0, max_len=2)
+        execute_line(self.test_database, 'SET A 5', self.logger)
+        execute_line(self.test_database, 'BEGIN', self.logger)
+        execute_line(self.test_database, 'GET A', self.logger)
+        entries = self.test_database.slowlog.get()
+        self.assertListEqual([entry.command for entry in entries], ['GET A', 'BEGIN'])
+        self.assertListEqual([entry.transaction_depth for entry in entries], [1, 1])
+        self.assertEqual(execute_line(self.test_database, 'SLOWLOG LEN', self.logger), ('2', False))
+        self.assertIn('depth=1 SLOWLOG LEN', execute_line(self.test_database, 'SLOWLOG GET 1', self.logger)[0])
+        execute_line(self.test_database, 'SLOWLOG RESET', self.logger)
+        self.assertEqual(len(self.test_database.slowlog), 1)
+
+        self.test_database.slowlog = SlowLog(threshold_us=10 ** 9)
+        execute_line(self.test_database, 'GET A', self.logger)
+        self.assertEqual(len(self.test_database.slowlog), 0)
+
+    def test_profile(self):
+        self.assertRaises(WrongInputException, self.test_database.stop_profile)
+        execute_line(self.test_database, 'PROFILE START', self.logger)
+        self.assertRaises(WrongInputException, self.test_database.start_profile)
+        execute_line(self.test_database, 'SET A 5', self.logger)
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('../profile.txt', os.path.join(directory, 'profile.txt'), '..'):
+                output, _ = execute_line(self.test_database, f'PROFILE STOP {name}', self.logger)
+                self.assertEqual(output, WrongInputText.PROFILE_WRONG_FILE.value)
+            with open(os.path.join(directory, 'file'), 'w'):
+                pass
+            with mock.patch('profiling.PROFILE_DIR', os.path.join(directory, 'file')):
+                self.assertRaises(WrongInputException, self.test_database.stop_profile)
+            self.assertIsNotNone(self.test_database.profiler)
+            with mock.patch('profiling.PROFILE_DIR', os.path.join(directory, 'profiles')):
+                output, _ = execute_line(self.test_database, 'PROFILE STOP report.txt', self.logger)
+            path = os.path.join(directory, 'profiles', 'report.txt')
+            self.assertIn(path, output)
+            with open(path, encoding='utf-8') as report:
+                self.assertIn('execute_command', report.read())
+        self.assertIsNone(self.test_database.profiler)
+
+
+class CompactDataBaseCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_database = CompactDataBase()
+
+    def test_set_get_unset_counts_find(self):
+        self.test_database.database = {'A': '5', 'B': '4', 'C': '4'}
+        self.test_database.set('D', '4')
+        self.test_database.set('A', '4')
+        self.assertEqual(self.test_database.get('A'), '4')
+        self.assertEqual(self.test_database.counts('4'), 4)
+        self.assertEqual(self.test_database.counts('5'), 0)
+        self.test_database.unset('B')
+        self.assertListEqual(self.test_database.find('4'), ['A', 'C', 'D'])
+        self.assertRaises(WrongInputException, self.test_database.get, 'B')
+        self.assertEqual(self.test_database.stats()['value_dictionary_values'], 1)
+
+    def test_values_are_shared(self):
+        self.test_database.set('A', ''.join(['val', 'ue']))
+        self.test_database.set('B', ''.join(['val', 'ue']))
+        codes = self.test_database.database.codes
+        self.assertIs(codes['A'], codes['B'])
+        self.assertEqual(self.test_database.memory_usage()['keys'], 2)
+
+    def test_transactions(self):
+        self.test_database.database = {'A': '5', 'B': '4'}
+        self.test_database.begin_transaction()
+        self.test_database.set('A', '4')
+        self.test_database.unset('B')
+        self.test_database.set('C', '3')
+        self.assertEqual(self.test_database.counts('4'), 1)
+        self.test_database.rollback_transaction()
+        self.assertDictEqual(self.test_database.database.copy(), {'A': '5', 'B': '4'})
+        self.assertEqual(self.test_database.counts('3'), 0)
+        self.assertEqual(''.join(self.test_database.execute_command(Action.FIND, value='4')), 'B')
+
+
+class MmapDataBaseCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'data.idx')
+        self.test_database = MmapDataBase(self.path)
+
+    def tearDown(self):
+        self.test_database.close()
+        self.temp_dir.cleanup()
+
+    def test_commands(self):
+        for line in ('SET A 10', 'SET B 10', 'SET A 20', 'UNSET B', 'SET C 20'):
+            self.test_database.execute_command(*parse_command(line))
+        self.assertEqual(self.test_database.execute_command(*parse_command('GET A')), '20')
+        self.assertEqual(self.test_database.execute_command(*parse_command('COUNTS 20')), 2)
+        self.assertEqual(''.join(self.test_database.execute_command(*parse_command('FIND 10'))), '')
+        self.assertRaises(WrongInputException, self.test_database.get, 'B')
+
+    def test_transactions(self):
+        self.test_database.set('A', '10')
+        self.test_database.begin_transaction()
+        self.test_database.set('A', 'a much longer value')
+        self.test_database.unset('A')
+        self.test_database.set('B', '20')
+        self.test_database.rollback_transaction()
+        self.assertDictEqual(self.test_database.database.copy(), {'A': '10'})
+
+    def test_resize_and_reopen(self):
+        expected = {f'key{i}': str(i % 7) * (i % 5) for i in range(5000)}
+        for key, value in expected.items():
+            self.test_database.set(key, value)
+        for i in range(0, 5000, 2):
+            self.test_database.unset(f'key{i}')
+            del expected[f'key{i}']
+        self.assertGreater(self.test_database.stats()['mmap_capacity'], 5000)
+        self.test_database.close()
+        self.test_database = MmapDataBase(self.path)
+        self.assertDictEqual(self.test_database.database.copy(), expected)
+        self.assertEqual(self.test_database.counts('3'), sum(value == '3' for value in expected.values()))
+
+    def test_get_reads_mapping(self):
+        self.test_database.set('A', 'значение')
+        view = self.test_database.execute_get('A')
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(bytes(view), 'значение'.encode())
+        view.release()
+        self.assertEqual(self.test_database.get('A'), 'значение')
+        self.assertRaises(WrongInputException, self.test_database.execute_get, 'B')
+        server = DatabaseServer(self.test_database, port=0)
+        session = Session(self.test_database)
+        self.assertTupleEqual(server.run_line(session, 'GET A'.encode()), ('+значение\n'.encode(), False))
+        self.assertTupleEqual(server.run_line(session, b'GET B'), (b'-' + WrongInputText.NULL.value.encode() + b'\n', False))
+
+    def test_background_save_from_table_copy(self):
+        self.test_database.mset([(f'key{i}', str(i % 3)) for i in range(100)])
+        self.test_database.begin_transaction()
+        self.test_database.set('key0', 'uncommitted')
+        self.test_database.unset('key1')
+        self.test_database.set('new', '1')
+        path = os.path.join(self.temp_dir.name, 'database.snapshot')
+        saver = BackgroundSave(path)
+        self.assertTrue(saver.start(self.test_database))
+        self.test_database.set('key2', 'after start')
+        self.assertTrue(saver.wait())
+        self.assertDictEqual(read_snapshot(path), {f'key{i}': str(i % 3) for i in range(100)})
+        self.assertListEqual(sorted(os.listdir(self.temp_dir.name)), ['data.idx', 'data.idx.data', 'database.snapshot'])
+
+
+class SessionCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_database = CustomDataBase()
+        self.test_database.database = {'A': '5', 'B': '4', 'C': '4'}
+        self.first = Session(self.test_database)
+        self.second = Session(self.test_database)
+
+    def test_uncommitted_changes_are_private(self):
+        self.first.begin_transaction()
+        self.first.set('A', '4')
+        self.first.unset('B')
+        self.first.set('D', '4')
+        self.assertEqual(self.first.get('A'), '4')
+        self.assertRaises(WrongInputException, self.first.get, 'B')
+        self.assertEqual(self.first.counts('4'), 3)
+        self.assertListEqual(sorted(self.first.find('4')), ['A', 'C', 'D'])
+
+        self.assertEqual(self.second.get('A'), '5')
+        self.assertEqual(self.second.counts('4'), 2)
+        self.second.begin_transaction()
+        self.second.set('E', '1')
+        self.second.rollback_transaction()
+
+        self.first.commit_transaction()
+        self.assertDictEqual(self.test_database.database, {'A': '4', 'C': '4', 'D': '4'})
+        self.assertEqual(self.second.counts('4'), 3)
+
+    def test_commit_deletes_key_expired_after_read(self):
+        now = [0.0]
+        self.test_database.clock = lambda: now[0]
+        self.test_database.set('E', '1', ttl=10)
+        listener = mock.Mock()
+        self.test_database.add_commit_listener(listener)
+        self.first.begin_transaction()
+        self.first.unset('E')
+        self.first.set('A', '6')
+        now[0] = 20.0
+        self.first.commit_transaction()
+        self.assertEqual(self.test_database.transaction_depth, 0)
+        self.assertDictEqual(self.test_database.database, {'A': '6', 'B': '4', 'C': '4'})
+        self.test_database.set('F', '1')
+        self.assertEqual(listener.call_count, 2)
+
+    def test_nested_transactions(self):
+        self.first.begin_transaction()
+        self.first.set('TR1', '11')
+        self.first.begin_transaction()
+        self.first.set('TR2', '22')
+        self.first.rollback_transaction()
+        self.first.begin_transaction()
+        self.first.set('TR3', '33')
+        self.first.commit_transaction()
+        self.assertNotIn('TR1', self.test_database.database)
+        self.first.commit_transaction()
+        self.assertDictEqual(self.test_database.database,
+                             {'A': '5', 'B': '4', 'C': '4', 'TR1': '11', 'TR3': '33'})
+        self.assertRaises(WrongInputException, self.first.commit_transaction)
+
+
+class SnapshotIsolationCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_database = CustomDataBase()
+        self.test_database.database = {'A': '5', 'B': '4', 'C': '4'}
+        self.versions = VersionStore(self.test_database)
+        self.reader = Session(self.test_database, self.versions)
+        self.writer = Session(self.test_database, self.versions)
+
+    def test_transaction_reads_snapshot(self):
+        self.reader.begin_transaction()
+        self.writer.set('A', '4')
+        self.writer.unset('B')
+        self.writer.set('D', '4')
+        self.assertEqual(self.reader.get('A'), '5')
+        self.assertEqual(self.reader.get('B'), '4')
+        self.assertRaises(WrongInputException, self.reader.get, 'D')
+        self.assertEqual(self.reader.counts('4'), 2)
+        self.assertListEqual(sorted(self.reader.find('4')), ['B', 'C'])
+        self.reader.commit_transaction()
+        self.assertEqual(self.reader.get('A'), '4')
+        self.assertEqual(self.reader.counts('4'), 3)
+
+    def test_write_conflict(self):
+        self.reader.begin_transaction()
+        self.writer.begin_transaction()
+        self.reader.set('A', '1')
+        self.writer.set('A', '2')
+        self.writer.commit_transaction()
+        with self.assertRaises(WrongInputException) as context:
+            self.reader.commit_transaction()
+        self.assertIn('A', context.exception.message)
+        self.assertEqual(self.test_database.get('A'), '2')
+        self.assertListEqual(self.reader.transaction_stack, [])
+
+    def test_versions_are_collected(self):
+        self.reader.begin_transaction()
+        for i in range(100):
+            self.writer.set('A', str(i))
+        self.assertEqual(self.versions.stats()['mvcc_versions'], 100)
+        self.assertEqual(self.reader.get('A'), '5')
+        self.reader.rollback_transaction()
+        stats = self.versions.stats()
+        self.assertEqual(stats['mvcc_versions'], 0)
+        self.assertEqual(stats['mvcc_snapshots'], 0)
+        self.writer.set('A', '1')
+        self.assertEqual(self.versions.stats()['mvcc_versions'], 0)
+
+
+class OptimisticTransactionCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_database = CustomDataBase()
+        self.test_database.database = {'A': '5', 'B': '4'}
+        self.versions = VersionStore(self.test_database)
+        self.first = Session(self.test_database, self.versions)
+        self.second = Session(self.test_database, self.versions)
+
+    @staticmethod
+    def execute(client, line):
+        return client.execute_command(*parse_command(line))
+
+    def test_exec_applies_queue(self):
+        changes = []
+        self.test_database.add_commit_listener(changes.append)
+        self.execute(self.first, 'WATCH A')
+        self.execute(self.first, 'MULTI')
+        self.assertEqual(self.execute(self.first, 'SET A 6'), 'QUEUED')
+        self.assertEqual(self.execute(self.first, 'UNSET Z'), 'QUEUED')
+        self.assertEqual(self.execute(self.first, 'MSET B 1 C 2'), 'QUEUED')
+        self.assertRaises(WrongInputException, self.execute, self.first, 'BEGIN')
+        self.assertEqual(self.test_database.get('A'), '5')
+        result = self.execute(self.first, 'EXEC')
+        self.assertListEqual(result.split('\n'), ['OK', 'Ошибка: Аргумент Z отсутствует в базе данных.', 'OK'])
+        self.assertDictEqual(self.test_database.database, {'A': '6', 'B': '1', 'C': '2'})
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(self.test_database.stats()['watched_keys'], 0)
+        self.assertRaises(WrongInputException, self.execute, self.first, 'EXEC')
+
+    def test_watched_key_change_aborts_exec(self):
+        self.execute(self.first, 'WATCH A B')
+        self.execute(self.second, 'WATCH A')
+        self.execute(self.first, 'MULTI')
+        self.execute(self.first, 'SET A 7')
+        self.execute(self.second, 'SET B 3')
+        with self.assertRaises(WrongInputException) as context:
+            self.execute(self.first, 'EXEC')
+        self.assertIn('B', context.exception.message)
+        self.assertEqual(self.test_database.get('A'), '5')
+        self.execute(self.second, 'MULTI')
+        self.execute(self.second, 'SET A 8')
+        self.assertEqual(self.execute(self.second, 'EXEC'), 'OK')
+        self.assertEqual(self.test_database.get('A'), '8')
+
+        self.execute(self.first, 'WATCH A')
+        self.execute(self.first, 'MULTI')
+        self.execute(self.first, 'DISCARD')
+        self.assertRaises(WrongInputException, self.execute, self.first, 'DISCARD')
+        self.assertEqual(self.test_database.stats()['watched_keys'], 0)
+
+    def test_exec_inside_begin_transaction(self):
+        self.execute(self.first, 'BEGIN')
+        self.execute(self.first, 'MULTI')
+        self.execute(self.first, 'SET A 9')
+        self.execute(self.first, 'EXEC')
+        self.assertEqual(self.first.get('A'), '9')
+        self.assertEqual(self.second.get('A'), '5')
+        self.execute(self.first, 'ROLLBACK')
+        self.assertEqual(self.first.get('A'), '5')
+
+    def test_database_without_sessions(self):
+        database = CustomDataBase()
+        self.execute(database, 'SET A 1')
+        self.execute(database, 'WATCH A')
+        self.execute(database, 'SET A 2')
+        self.execute(database, 'MULTI')
+        self.execute(database, 'SET B 1')
+        self.assertRaises(WrongInputException, self.execute, database, 'EXEC')
+        self.execute(database, 'MULTI')
+        self.execute(database, 'SET B 1')
+        self.execute(database, 'GET A')
+        self.assertEqual(self.execute(database, 'EXEC'), 'OK\n2')
+
+
+class NumericCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_database = CustomDataBase()
+        self.test_database.database = {'A': '10', 'B': '2.5', 'C': 'x', 'D': '10', 'E': '-3'}
+
+    @staticmethod
+    def execute(client, line):
+        result = client.execute_command(*parse_command(line))
+        return result if result is None or isinstance(result, (str, int)) else ''.join(result)
+
+    def test_parse(self):
+        self.assertEqual(parse_command('INCR A'), ParsedCommand(Action.INCR, 'A', 1))
+        self.assertEqual(parse_command('DECRBY A 5'), ParsedCommand(Action.DECRBY, 'A', -5))
+        self.assertEqual(parse_command('COUNTS BETWEEN -1 AND 2.5'),
+                         ParsedCommand(Action.COUNTS, arguments=(-1, 2.5)))
+        self.assertEqual(parse_command('FIND between 0 and 9'), ParsedCommand(Action.FIND, arguments=(0, 9)))
+        self.assertRaises(WrongInputException, parse_command, 'INCRBY A 1.5')
+        self.assertRaises(WrongInputException, parse_command, 'COUNTS BETWEEN a AND 2')
+        self.assertRaises(WrongInputException, parse_command, 'COUNTS 1 2')
+
+    def test_increment(self):
+        self.assertEqual(self.execute(self.test_database, 'INCR A'), 11)
+        self.assertEqual(self.execute(self.test_database, 'DECRBY A 20'), -9)
+        self.assertEqual(self.execute(self.test_database, 'DECR Z'), -1)
+        self.assertRaises(WrongInputException, self.execute, self.test_database, 'INCR B')
+        self.assertRaises(WrongInputException, self.execute, self.test_database, 'INCR C')
+        self.test_database.set('T', '1', ttl=100)
+        self.execute(self.test_database, 'INCRBY T 4')
+        self.assertEqual(self.test_database.get('T'), '5')
+        self.assertEqual(self.test_database.ttl('T'), 100)
+
+        self.test_database.begin_transaction()
+        self.execute(self.test_database, 'INCR A')
+        self.test_database.begin_transaction()
+        self.execute(self.test_database, 'INCRBY Z 10')
+        self.test_database.rollback_transaction()
+        self.assertEqual(self.test_database.get('Z'), '-1')
+        self.test_database.rollback_transaction()
+        self.assertEqual(self.test_database.get('A'), '-9')
+
+    def test_range(self):
+        self.assertEqual(self.execute(self.test_database, 'COUNTS BETWEEN 0 AND 10'), 3)
+        self.assertEqual(self.execute(self.test_database, 'FIND BETWEEN -5 AND 5'), 'E B')
+        self.test_database.set('F', '7')
+        self.test_database.unset('D')
+        self.assertEqual(self.execute(self.test_database, 'FIND BETWEEN 0 AND 10'), 'B F A')
+        self.test_database.begin_transaction()
+        self.test_database.set('A', '100')
+        self.test_database.unset('F')
+        self.assertEqual(self.execute(self.test_database, 'COUNTS BETWEEN 0 AND 10'), 1)
+        self.test_database.rollback_transaction()
+        self.assertEqual(self.execute(self.test_database, 'COUNTS BETWEEN 0 AND 10'), 3)
+        self.assertEqual(self.execute(self.test_database, 'COUNTS BETWEEN 11 AND 20'), 0)
+
+    def test_numbers_between_skips_expired_keys(self):
+        now = [0.0]
+        self.test_database.clock = lambda: now[0]
+        self.test_database.set('T', '3', ttl=10)
+        self.assertListEqual(self.test_database.numbers_between(0, 10), [(2.5, 'B'), (3, 'T'), (10, 'A'), (10, 'D')])
+        now[0] = 20.0
+        self.assertListEqual(self.test_database.numbers_between(0, 10), [(2.5, 'B'), (10, 'A'), (10, 'D')])
+
+    def test_session_transaction(self):
+        first, second = Session(self.test_database), Session(self.test_database)
+        self.execute(first, 'BEGIN')
+        self.assertEqual(self.execute(first, 'INCRBY A 5'), 15)
+        self.execute(first, 'UNSET E')
+        self.execute(first, 'SET C 4')
+        self.assertEqual(self.execute(first, 'FIND BETWEEN -5 AND 20'), 'B C D A')
+        self.assertEqual(self.execute(first, 'COUNTS BETWEEN 10 AND 20'), 2)
+        self.assertEqual(self.execute(second, 'COUNTS BETWEEN 10 AND 20'), 2)
+        self.assertEqual(self.execute(second, 'FIND BETWEEN -5 AND 20'), 'E B A D')
+        self.execute(first, 'COMMIT')
+        self.assertEqual(self.test_database.get('A'), '15')
+        self.assertEqual(self.execute(second, 'FIND BETWEEN -5 AND 20'), 'B C D A')
+
+    def test_compact_and_mmap(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for database in (CompactDataBase(), MmapDataBase(os.path.join(directory, 'db.idx'))):
+                database.database = {'A': '10', 'B': '2.5', 'C': 'x', 'D': '10', 'E': '-3'}
+                self.assertEqual(self.execute(database, 'INCR E'), -2)
+                self.assertEqual(self.execute(database, 'COUNTS BETWEEN 0 AND 10'), 3)
+                self.assertEqual(self.execute(database, 'FIND BETWEEN -5 AND 5'), 'E B')
+                if isinstance(database, MmapDataBase):
+                    database.close()
+
+
+class BulkLoadCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_database = CustomDataBase()
+
+    def write_csv(self, text):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', encoding='utf-8', newline='') as source:
+            source.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_load_pairs(self):
+        self.test_database.set('A', '1', ttl=100)
+        self.test_database.set('B', '2')
+        self.assertEqual(self.test_database.scan(''), ['A', 'B'])
+        pairs = [('C', '2'), ('A', '3'), ('D', '2'), ('C', '5'), ('E', '3')]
+        self.assertEqual(self.test_database.load(iter(pairs), batch_size=2), 5)
+        self.assertDictEqual(self.test_database.database, {'A': '3', 'B': '2', 'C': '5', 'D': '2', 'E': '3'})
+        self.assertEqual(self.test_database.ttl('A'), -1)
+        self.assertEqual(self.test_database.counts('1'), 0)
+        self.assertListEqual(self.test_database.find('2'), ['B', 'D'])
+        self.assertListEqual(self.test_database.find('3'), ['A', 'E'])
+        self.assertListEqual(self.test_database.scan(''), ['A', 'B', 'C', 'D', 'E'])
+        self.assertEqual(self.test_database.counts_between(3, 5), 3)
+
+    def test_load_in_transaction_and_with_listeners(self):
+        batches = []
+        self.test_database.add_commit_listener(batches.append)
+        self.test_database.load([('A', '1'), ('B', '2'), ('C', '3')], batch_size=2)
+        self.assertListEqual(batches, [[('A', None, '1'), ('B', None, '2')], [('C', None, '3')]])
+        self.test_database.begin_transaction()
+        self.test_database.load([('A', '5'), ('D', '5')])
+        self.assertEqual(self.test_database.counts('5'), 2)
+        self.test_database.rollback_transaction()
+        self.assertDictEqual(self.test_database.database, {'A': '1', 'B': '2', 'C': '3'})
+        self.assertEqual(len(batches), 2)
+
+    def test_load_csv(self):
+        path = self.write_csv('key,value\nA,1\n\n"B,1",2\nC,1,extra\n')
+        self.assertEqual(bulk_load.load_csv(self.test_database, path, header=True), 3)
+        self.assertDictEqual(self.test_database.database, {'A': '1', 'B,1': '2', 'C': '1'})
+        with self.assertRaisesRegex(ValueError, 'Строка 3:'):
+            bulk_load.load_csv(CustomDataBase(), self.write_csv('key,value\nA,1\nB\n'), header=True)
+
+    def test_load_csv_parallel(self):
+        path = self.write_csv('key;value\n' + ''.join(f'key{i};{i % 7}\n' for i in range(300)) + 'key0;last')
+        with mock.patch.object(bulk_load, 'CSV_CHUNK_SIZE', 256), mock.patch.object(bulk_load, 'PARALLEL_MIN_SIZE', 0):
+            self.assertGreater(len(bulk_load._chunk_bounds(path, bulk_load.CSV_CHUNK_SIZE)), 4)
+            loaded = bulk_load.load_csv(self.test_database, path, delimiter=';', header=True, workers=2)
+        self.assertEqual(loaded, 301)
+        self.assertEqual(len(self.test_database.database), 300)
+        self.assertEqual(self.test_database.get('key0'), 'last')
+        self.assertEqual(self.test_database.get('key299'), str(299 % 7))
+        self.assertEqual(self.test_database.counts('0'), 42)
+        path = self.write_csv('key;value\n' + ''.join(f'key{i};{i}\n' for i in range(200)) + 'broken\n')
+        with mock.patch.object(bulk_load, 'CSV_CHUNK_SIZE', 256), mock.patch.object(bulk_load, 'PARALLEL_MIN_SIZE', 0):
+            with self.assertRaisesRegex(ValueError, 'Строка 202:'):
+                bulk_load.load_csv(CustomDataBase(), path, delimiter=';', header=True, workers=2)
+
+    def test_load_columns(self):
+        class Column:
+            def __init__(self, values):
+                self.values = values
+
+            def tolist(self):
+                return list(self.values)
+
+        self.assertEqual(bulk_load.load_columns(self.test_database, Column(['A', 'B', 'C']), Column([1, None, 3])), 2)
+        self.assertEqual(bulk_load.load_columns(self.test_database, ('D', 'E'), [b'x', b'y']), 2)
+        self.assertDictEqual(self.test_database.database, {'A': '1', 'C': '3', 'D': 'x', 'E': 'y'})
+        self.assertEqual(self.test_database.increment('A', 1), 2)
+        self.assertRaises(ValueError, bulk_load.load_columns, self.test_database, ['A'], [])
+        self.assertRaises(ValueError, bulk_load.load_columns, self.test_database, ['F', None], ['1', '2'])
+
+        database = CustomDataBase()
+        self.assertEqual(bulk_load.load_columns(database, ['A', 'B', 'C', 'D'], [None, 1, 'x', b'1']), 3)
+        self.assertDictEqual(database.database, {'B': '1', 'C': 'x', 'D': '1'})
+        self.assertEqual(database.counts('1'), 2)
+        self.assertListEqual(sorted(database.find('1')), ['B', 'D'])
+        self.assertEqual(bulk_load.load_columns(database, [1, 'E'], ['a', 3]), 2)
+        self.assertEqual(database.get('1'), 'a')
+        self.assertEqual(database.counts('3'), 1)
+
+    def test_load_into_empty_database(self):
+        pairs = [(f'key{i}', str(i % 3)) for i in range(10)] + [('key1', '7')]
+        for test_database in (CustomDataBase(), CompactDataBase()):
+            self.assertEqual(test_database.load(pairs, batch_size=4), 11)
+            self.assertEqual(test_database.counts('1'), 2)
+            self.assertListEqual(sorted(test_database.find('7')), ['key1'])
+            test_database.set('key4', '0')
+            self.assertEqual(test_database.counts('0'), 5)
+            self.assertEqual(test_database.counts_between(1, 2), 4)
+
+    def test_load_other_engines(self):
+        for test_database in (CompactDataBase(), ThreadSafeDataBase(stripes=4)):
+            test_database.set('A', '1')
+            test_database.load([('A', '2'), ('B', '2'), ('C', '1')])
+            self.assertEqual(test_database.get('A'), '2')
+            self.assertEqual(test_database.counts('2'), 2)
+            self.assertListEqual(test_database.find('1'), ['C'])
+
+
+class DatabaseServerCase(unittest.TestCase):
+
+    def test_pipelined_sessions(self):
+        async def scenario():
+            server = DatabaseServer(CustomDataBase(), port=0)
+            await server.start()
+            first_reader, first_writer = await asyncio.open_connection('127.0.0.1', server.port)
+            second_reader, second_writer = await asyncio.open_connection('127.0.0.1', server.port)
+
+            first_writer.write(b'SET A 5\nBEGIN\nSET A 6\nGET A\nGET B\n')
+            replies = [await first_reader.readline() for _ in range(5)]
+            second_writer.write(b'GET A\n')
+            second_reply = await second_reader.readline()
+            first_writer.write(b'COMMIT\nEND\n')
+            replies += [await first_reader.readline() for _ in range(2)]
+            second_writer.write(b'GET A\nCOUNTS 6\n')
+            second_replies = [await second_reader.readline() for _ in range(2)]
+
+            second_writer.close()
+            await server.close()
+            return replies, second_reply, second_replies
+
+        replies, second_reply, second_replies = asyncio.run(scenario())
+        self.assertListEqual(replies, [b'+OK\n', b'+OK\n', b'+OK\n', b'+6\n',
+                                       b'-' + WrongInputText.NULL.value.encode() + b'\n', b'+OK\n', b'+OK\n'])
+        self.assertEqual(second_reply, b'+5\n')
+        self.assertListEqual(second_replies, [b'+6\n', b'+1\n'])
+
+    @mock.patch('server.READ_SIZE', 4)
+    @mock.patch('server.MAX_LINE_LENGTH', 16)
+    def test_split_and_overlong_lines(self):
+        async def scenario():
+            server = DatabaseServer(CustomDataBase(), port=0)
+            await server.start()
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            writer.write(b'SET A 5\nGE')
+            await writer.drain()
+            await asyncio.sleep(0.01)
+            writer.write(b'T A\nSET B ' + b'x' * 32 + b'\n')
+            replies = [await reader.readline() for _ in range(3)]
+            closed = await reader.read()
+            writer.close()
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            writer.write(b'GET A')
+            writer.write_eof()
+            last_reply = await reader.read()
+            writer.close()
+            await server.close()
+            return replies, closed, last_reply
+
+        replies, closed, last_reply = asyncio.run(scenario())
+        self.assertListEqual(replies, [b'+OK\n', b'+5\n', b'-Line too long\n'])
+        self.assertEqual(closed, b'')
+        self.assertEqual(last_reply, b'+5\n')
+
+
+class ReplicationCase(unittest.TestCase):
+
+    @staticmethod
+    async def wait_until(condition):
+        for _ in range(500):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError('Реплика не догнала ведущий сервер.')
+
+    @mock.patch('replication.RECONNECT_INTERVAL', 0.01)
+    def test_follower_replicates_and_resyncs(self):
+        async def scenario():
+            leader_database = CustomDataBase()
+            leader_database.mset([('A', '5'), ('B', '4')])
+            leader_server = DatabaseServer(leader_database, port=0)
+            await leader_server.start()
+            follower_server = DatabaseServer(CustomDataBase(), port=0, replica_of=('127.0.0.1', leader_server.port))
+            await follower_server.start()
+            leader, follower = leader_server.leader, follower_server.follower
+
+            def synced():
+                return follower.connected and follower.offset == leader.offset
+
+            await self.wait_until(synced)
+            leader_reader, leader_writer = await asyncio.open_connection('127.0.0.1', leader_server.port)
+            leader_writer.write(b'SET C 4 EX 100\nUNSET A\nMSET D 4 E 4\n')
+            [await leader_reader.readline() for _ in range(3)]
+            await self.wait_until(synced)
+            reader, writer = await asyncio.open_connection('127.0.0.1', follower_server.port)
+            writer.write(b'GET C\nGET A\nCOUNTS 4\nSET X 1\n')
+            replies = [await reader.readline() for _ in range(4)]
+
+            # Переподключение с небольшим отставанием - недостающие кадры из backlog.
+            for link_writer in list(leader._links):
+                link_writer.close()
+            await self.wait_until(lambda: not follower.connected)
+            leader_database.set('F', '6', ttl=100)
+            await self.wait_until(lambda: synced() and follower.partial_resyncs == 1)
+            # Изменения не поместились в backlog - полный снимок.
+            leader.backlog_size = 16
+            for link_writer in list(leader._links):
+                link_writer.close()
+            await self.wait_until(lambda: not follower.connected)
+            leader_database.mset([(f'K{i}', '7') for i in range(100)])
+            leader_database.unset('B')
+            await self.wait_until(lambda: synced() and follower.full_resyncs == 2)
+            follower_data = dict(follower_server.database.database)
+            follower_ttls = [follower_server.database.ttl(key) for key in ('C', 'F', 'D')]
+            stats = leader_database.stats()
+
+            writer.close()
+            leader_writer.close()
+            await follower_server.close()
+            await leader_server.close()
+            return replies, follower_data, follower_ttls, stats
+
+        replies, follower_data, follower_ttls, stats = asyncio.run(scenario())
+        self.assertListEqual(replies, [b'+4\n', b'-' + WrongInputText.NULL.value.encode() + b'\n', b'+4\n',
+                                       b'-' + WrongInputText.READ_ONLY_REPLICA.value.encode() + b'\n'])
+        expected = {'C': '4', 'D': '4', 'E': '4', 'F': '6'}
+        expected.update((f'K{i}', '7') for i in range(100))
+        self.assertDictEqual(follower_data, expected)
+        self.assertListEqual(follower_ttls, [100, 100, -1])
+        self.assertEqual(stats['role'], 'leader')
+        self.assertEqual(stats['connected_followers'], 1)
+
+
+class ThreadSafeDataBaseCase(unittest.TestCase):
+    THREADS = 8
+
+    def setUp(self):
+        self.test_database = ThreadSafeDataBase(stripes=4)
+        self.switch_interval = sys.getswitchinterval()
+        # Частое переключение потоков, чтобы гонки проявлялись за короткий тест.
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+
+    def run_threads(self, target):
+        errors = []
+
+        def run(number):
+            try:
+                target(number)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(number,)) for number in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertListEqual(errors, [])
+
+    def test_concurrent_increments(self):
+        def increment(number):
+            for i in range(500):
+                self.test_database.increment(f'counter{i % 4}', 1)
+                self.test_database.set(f'key{number}', str(i))
+
+        self.run_threads(increment)
+        self.assertListEqual(self.test_database.mget([f'counter{i}' for i in range(4)]), ['1000'] * 4)
+        self.assertEqual(self.test_database.counts('499'), self.THREADS)
+
+    def test_transactions_per_thread(self):
+        self.test_database.mset([('shared', 'clean'), ('total', '0')])
+
+        def write(number):
+            for i in range(200):
+                self.test_database.begin_transaction()
+                self.test_database.set('shared', 'dirty')
+                self.test_database.begin_transaction()
+                self.test_database.unset('total')
+                self.assertEqual(self.test_database.transaction_depth, 2)
+                self.test_database.rollback_transaction()
+                self.assertEqual(self.test_database.get('shared'), 'dirty')
+                self.test_database.rollback_transaction()
+                self.test_database.begin_transaction()
+                self.test_database.mset([(f'{number}-a', str(i)), (f'{number}-b', str(i))])
+                self.test_database.commit_transaction()
+
+        def read(number):
+            for _ in range(1000):
+                self.assertEqual(self.test_database.get('shared'), 'clean')
+                self.assertEqual(self.test_database.counts('dirty'), 0)
+
+        self.run_threads(lambda number: (write if number % 2 else read)(number))
+        self.assertEqual(self.test_database.get('total'), '0')
+        self.assertEqual(self.test_database.counts('199'), self.THREADS)
+        self.assertEqual(self.test_database.transaction_depth, 0)
+
+    def test_commands(self):
+        execute = self.test_database.execute_command
+        execute(*parse_command('MSET A 5 B 5 C 7'))
+        execute(*parse_command('BEGIN'))
+        execute(*parse_command('UNSET A'))
+        self.assertEqual(execute(*parse_command('INCRBY C 3')), 10)
+        self.assertEqual(execute(*parse_command('FIND 5')), 'B')
+        self.assertEqual(execute(*parse_command('FIND BETWEEN 0 AND 10')), 'B C')
+        self.assertEqual(execute(*parse_command('RANGE A C')), 'B C')
+        execute(*parse_command('COMMIT'))
+        self.assertEqual(execute(*parse_command('COUNTS BETWEEN 6 AND 10')), 1)
+        self.assertRaises(WrongInputException, execute, *parse_command('GET A'))
+        self.assertRaises(WrongInputException, execute, *parse_command('ROLLBACK'))
+
+    def test_commit_deletes_key_expired_after_read(self):
+        now = [0.0]
+        for stripe in self.test_database.stripes:
+            stripe.clock = lambda: now[0]
+        self.test_database.set('E', '1', ttl=10)
+        self.test_database.begin_transaction()
+        self.test_database.unset('E')
+        self.test_database.mset([(f'key{i}', '2') for i in range(20)])
+        now[0] = 20.0
+        self.test_database.commit_transaction()
+        self.assertEqual(self.test_database.counts('2'), 20)
+        self.assertRaises(WrongInputException, self.test_database.get, 'E')
+
+    def test_paged_find_and_keys(self):
+        pairs = [(f'key{i:02}', str(i % 2)) for i in range(30)]
+        self.test_database.mset(pairs)
+        reference = CustomDataBase()
+        reference.mset(pairs)
+        for line in ('KEYS', 'KEYS key05', 'FIND 1 LIMIT 4', 'FIND 1 CURSOR key03 LIMIT 4', 'FIND 0 CURSOR key25'):
+            self.assertEqual(self.test_database.execute_command(*parse_command(line)),
+                             reference.execute_command(*parse_command(line)))
+        self.test_database.begin_transaction()
+        self.test_database.unset('key01')
+        self.test_database.set('key02', '1')
+        self.test_database.set('key000', '1')
+        self.assertTupleEqual(self.test_database.find_page('1', count=3), (['key000', 'key02', 'key03'], 'key03'))
+        self.assertTupleEqual(self.test_database.keys_page('key27'), (['key28', 'key29'], None))
+
+    def test_stats_count_distinct_values_once(self):
+        self.test_database.mset([(f'key{i}', str(i % 2)) for i in range(40)])
+        self.assertGreater(sum('0' in stripe.indexed_values() for stripe in self.test_database.stripes), 1)
+        stats = self.test_database.stats()
+        self.assertEqual(stats['keys'], 40)
+        self.assertEqual(stats['value_index_values'], 2)
+
+
+class ShardedDataBaseCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_database = ShardedDataBase(shards=3)
+
+    def tearDown(self):
+        self.test_database.close()
+
+    def test_unexpected_error_keeps_shard_running(self):
+        with self.assertRaisesRegex(RuntimeError, 'AttributeError'):
+            self.test_database._call(0, 'no_such_method')
+        self.test_database.set('A', '5')
+        self.assertEqual(self.test_database.get('A'), '5')
+
+    def test_compact_engine(self):
+        database = ShardedDataBase(shards=2, engine=CompactDataBase)
+        try:
+            database.mset([('A', '5'), ('B', '5'), ('C', '6')])
+            self.assertEqual(database.counts('5'), 2)
+            self.assertTrue(all('value_dictionary_values' in stats for stats in database._broadcast('stats')))
+        finally:
+            database.close()
+
+    def test_set_get_unset_counts_find(self):
+        for key, value in {'A': '5', 'B': '4', 'C': '4', 'D': '4'}.items():
+            self.test_database.set(key, value)
+        self.assertEqual(self.test_database.get('A'), '5')
+        self.assertRaises(WrongInputException, self.test_database.get, 'Z')
+        self.assertEqual(self.test_database.counts('4'), 3)
+        self.test_database.unset('B')
+        self.assertRaises(WrongInputException, self.test_database.unset, 'B')
+        self.assertListEqual(sorted(self.test_database.find('4')), ['C', 'D'])
+        self.assertEqual(self.test_database.stats()['keys'], 3)
+        self.assertListEqual(self.test_database.key_range('A', 'C'), ['A', 'C'])
+        self.assertTupleEqual(self.test_database.keys_page('A', count=1), (['C'], 'C'))
+        self.test_database.mset([('E', '4'), ('F', '4'), ('G', '4')])
+        self.assertListEqual(self.test_database.mget(['G', 'B', 'E']), ['4', None, '4'])
+        self.assertEqual(self.test_database.munset(['E', 'F', 'Z']), 2)
+        self.assertEqual(self.test_database.increment('A', 10), 15)
+        self.assertEqual(self.test_database.counts_between(4, 15), 4)
+        found = self.test_database.find_between(4, 20)
+        self.assertListEqual(sorted(found[:3]), ['C', 'D', 'G'])
+        self.assertEqual(found[3], 'A')
+        self.assertEqual(self.test_database.load([('H', '7'), ('A', '7')], batch_size=1), 2)
+        self.assertListEqual(sorted(self.test_database.find('7')), ['A', 'H'])
+
+    def test_multiple_transactions(self):
+        for key, value in {'A': '5', 'B': '4', 'C': '4'}.items():
+            self.test_database.set(key, value)
+        self.test_database.begin_transaction()
+        self.test_database.set('TR1', '11')
+        self.test_database.begin_transaction()
+        self.test_database.set('TR2', '22')
+        self.test_database.unset('A')
+        self.test_database.rollback_transaction()
+        self.assertEqual(self.test_database.get('A'), '5')
+        self.assertRaises(WrongInputException, self.test_database.get, 'TR2')
+        self.test_database.commit_transaction()
+        self.assertEqual(self.test_database.get('TR1'), '11')
+        self.assertRaises(WrongInputException, self.test_database.commit_transaction)
+        self.assertRaises(WrongInputException, self.test_database.rollback_transaction)
+
+    def test_execute_batch(self):
+        commands = [parse_command(line) for line in
+                    ['SET A 5', 'SET B 5', 'GET A', 'GET Z', 'BEGIN', 'SET A 6', 'COUNTS 5', 'ROLLBACK', 'GET A']]
+        results = self.test_database.execute_batch(commands)
+        self.assertListEqual(results[:3], [None, None, '5'])
+        self.assertIsInstance(results[3], WrongInputException)
+        self.assertEqual(results[3].message, WrongInputText.NULL.value)
+        self.assertListEqual(results[4:], [None, None, 1, None, '5'])
+
+
 if __name__ == '__main__':
     unittest.main()